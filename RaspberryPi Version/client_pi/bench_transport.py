@@ -0,0 +1,90 @@
+# Guided_Vision/client_pi/bench_transport.py
+#
+# Per-frame transport overhead: HTTP POST per frame vs one persistent WebSocket.
+#
+#   python bench_transport.py --server http://192.168.1.10:8000 --frames 50
+#   python bench_transport.py --server http://localhost:8000 --image frame.jpg
+#
+# The same frame is sent every time, so after the first one the server answers
+# from its near-duplicate cache and the round trip is almost all transport cost.
+# overhead = client round trip - server-reported latency_ms.
+
+import argparse
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from transport import ServerBusy, make_transport
+
+
+def _synthetic_frame() -> bytes:
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, size=(360, 480, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(".jpg", pixels, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    if not ok:
+        raise RuntimeError("cv2.imencode failed")
+    return buf.tobytes()
+
+
+def _row(name: str, samples: list) -> str:
+    if not samples:
+        return f"{name:>14}: no samples"
+    return (
+        f"{name:>14}: p50={statistics.median(samples):7.1f} ms  "
+        f"mean={statistics.mean(samples):7.1f} ms  "
+        f"max={max(samples):7.1f} ms"
+    )
+
+
+def run(name: str, server: str, jpeg_bytes: bytes, frames: int, timeout: float) -> None:
+    transport = make_transport(name, server, "bench-" + name, timeout)
+    rtt, server_ms, overhead = [], [], []
+    busy = 0
+    try:
+        for seq in range(frames + 1):
+            t0 = time.perf_counter()
+            try:
+                data = transport.analyze(jpeg_bytes, seq=seq, capture_ts=time.time())
+            except ServerBusy:
+                busy += 1
+                continue
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            if seq == 0:
+                continue  # connection setup + first (uncached) inference
+            latency = float(data.get("latency_ms") or 0.0)
+            rtt.append(elapsed)
+            server_ms.append(latency)
+            overhead.append(elapsed - latency)
+    finally:
+        transport.close()
+
+    print(f"[{name}] frames={len(rtt)} busy={busy}")
+    print(_row("round trip", rtt))
+    print(_row("server", server_ms))
+    print(_row("overhead", overhead))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HTTP vs WebSocket per-frame overhead")
+    parser.add_argument("--server", default="http://localhost:8000")
+    parser.add_argument("--image", help="JPEG to send (default: synthetic 480x360 frame)")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--transports", nargs="+", default=["http", "websocket"])
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            jpeg_bytes = f.read()
+    else:
+        jpeg_bytes = _synthetic_frame()
+    print(f"server={args.server} frame={len(jpeg_bytes)} bytes")
+
+    for name in args.transports:
+        run(name, args.server, jpeg_bytes, args.frames, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# Guided_Vision/client_pi/camera.py
+#
+# Frame sources for pi_client.
+#
+#   "rpicam"       -> one long-lived rpicam-vid process streaming MJPEG on stdout;
+#                     a reader thread splits it into JPEGs and keeps only the newest
+#   "rpicam-jpeg"  -> old behaviour: spawn rpicam-jpeg for every frame
+#   <path>         -> stand-in for testing off the Pi: a video file, a JPEG, or a
+#                     folder of JPEGs, replayed in a loop at camera_fps
+
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+SOI = b"\xff\xd8"  # JPEG start of image
+EOI = b"\xff\xd9"  # JPEG end of image
+
+
+class MjpegParser:
+    """
+    Incremental splitter for a concatenated MJPEG byte stream.
+
+    feed() takes arbitrary chunks and returns the complete JPEGs they finished.
+    Inside entropy-coded data 0xFF is always stuffed, so the first EOI after an
+    SOI ends the frame.
+    """
+
+    def __init__(self, max_frame_bytes: int = 4 * 1024 * 1024):
+        self.max_frame_bytes = max_frame_bytes
+        self._buf = bytearray()
+        self._scan_from = 0  # where to resume looking for EOI
+
+    def feed(self, chunk: bytes) -> list:
+        self._buf += chunk
+        frames = []
+        while True:
+            start = self._buf.find(SOI)
+            if start < 0:
+                # Keep a trailing 0xFF in case the marker is split across chunks
+                del self._buf[:-1]
+                self._scan_from = 0
+                break
+            if start > 0:
+                del self._buf[:start]
+                self._scan_from = 0
+
+            end = self._buf.find(EOI, max(2, self._scan_from))
+            if end < 0:
+                self._scan_from = max(2, len(self._buf) - 1)
+                if len(self._buf) > self.max_frame_bytes:
+                    # Corrupt stream; resync on the next SOI
+                    del self._buf[:2]
+                    self._scan_from = 0
+                break
+
+            frames.append(bytes(self._buf[:end + 2]))
+            del self._buf[:end + 2]
+            self._scan_from = 0
+        return frames
+
+
+class LatestFrame:
+    """Single-slot, latest-wins frame holder shared by a producer and main()."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._frame = None
+        self._captured_at = 0.0
+        self.dropped = 0  # frames overwritten before anyone took them
+        self._taken = 0
+
+    def put(self, jpeg_bytes: bytes, captured_at: float) -> None:
+        with self._cond:
+            if self._frame is not None and self._taken != self._seq:
+                self.dropped += 1
+            self._seq += 1
+            self._frame = jpeg_bytes
+            self._captured_at = captured_at
+            self._cond.notify_all()
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def get(self, newer_than: int = 0, timeout: float = None):
+        """
+        Return (seq, captured_at, jpeg_bytes) for the newest frame with
+        seq > newer_than, waiting up to timeout seconds. None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > newer_than, timeout):
+                return None
+            self._taken = self._seq
+            return self._seq, self._captured_at, self._frame
+
+
+class RpicamStreamSource:
+    """Continuous capture from one rpicam-vid process (MJPEG on stdout)."""
+
+    name = "rpicam"
+
+    def __init__(self, width: int, height: int, quality: int, fps: float):
+        self.cmd = [
+            "rpicam-vid",
+            "-t", "0",                 # run until stopped
+            "--codec", "mjpeg",
+            "-o", "-",                 # stream to stdout
+            "--width", str(width),
+            "--height", str(height),
+            "--quality", str(quality),
+            "--framerate", str(fps),
+            "--nopreview",
+        ]
+        self.frames = LatestFrame()
+        self._proc = None
+        self._thread = None
+        self._stopping = False
+
+    def start(self) -> None:
+        try:
+            self._proc = subprocess.Popen(
+                self.cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=0,
+            )
+        except FileNotFoundError:
+            raise RuntimeError(
+                "rpicam-vid not found. Install with:\n"
+                "  sudo apt update && sudo apt install -y rpicam-apps"
+            )
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def _reader(self) -> None:
+        parser = MjpegParser()
+        stdout = self._proc.stdout
+        while not self._stopping:
+            chunk = stdout.read(65536)
+            if not chunk:
+                break
+            for jpeg in parser.feed(chunk):
+                self.frames.put(jpeg, time.time())
+        if not self._stopping:
+            print(f"[GuidedVision] rpicam-vid exited (code {self._proc.poll()}).")
+
+    def latest(self, newer_than: int = 0, timeout: float = None):
+        if self._thread is not None and not self._thread.is_alive():
+            raise RuntimeError("rpicam-vid is not running")
+        return self.frames.get(newer_than, timeout)
+
+    def stop(self) -> None:
+        self._stopping = True
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+
+
+# ---------- Capture from Camera Module 3 via rpicam-jpeg ----------
+def capture_frame_from_rpicam(width: int = 640,
+                              height: int = 480,
+                              quality: int = 80) -> bytes:
+    """
+    Capture a single JPEG frame from Raspberry Pi Camera Module (libcamera / rpicam).
+    Returns the JPEG bytes, or b"" on error.
+    """
+    cmd = [
+        "rpicam-jpeg",
+        "-o", "-",                 # output JPEG to stdout
+        "--width", str(width),
+        "--height", str(height),
+        "--quality", str(quality),
+        "--timeout", "200",        # ms; short delay for exposure
+        "--nopreview",
+    ]
+
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        return result.stdout  # JPEG bytes
+    except subprocess.CalledProcessError as e:
+        print("[GuidedVision] rpicam-jpeg ERROR:")
+        try:
+            print(e.stderr.decode(errors="ignore"))
+        except Exception:
+            pass
+        return b""
+    except FileNotFoundError:
+        print("[GuidedVision] ERROR: rpicam-jpeg not found. Install with:")
+        print("  sudo apt update && sudo apt install -y rpicam-apps")
+        return b""
+
+
+class RpicamStillSource:
+    """One rpicam-jpeg process per frame (slow; kept as a fallback)."""
+
+    name = "rpicam-jpeg"
+
+    def __init__(self, width: int, height: int, quality: int, fps: float):
+        self.width, self.height, self.quality = width, height, quality
+        self._seq = 0
+
+    def start(self) -> None:
+        pass
+
+    def latest(self, newer_than: int = 0, timeout: float = None):
+        jpeg_bytes = capture_frame_from_rpicam(self.width, self.height, self.quality)
+        if not jpeg_bytes:
+            return None
+        self._seq += 1
+        return self._seq, time.time(), jpeg_bytes
+
+    def stop(self) -> None:
+        pass
+
+
+class FileSource:
+    """
+    Off-Pi stand-in: replays a video, a JPEG, or a folder of JPEGs at `fps`,
+    re-encoded to the configured size/quality, through the same latest-wins slot.
+    """
+
+    name = "file"
+
+    def __init__(self, path: str, width: int, height: int, quality: int, fps: float,
+                 loop: bool = True):
+        self.path = Path(path).expanduser()
+        if not self.path.exists():
+            raise FileNotFoundError(f"camera_source not found: {self.path}")
+        self.width, self.height, self.quality = width, height, quality
+        self.period = 1.0 / max(float(fps), 0.1)
+        self.loop = loop
+        self.frames = LatestFrame()
+        self.finished = False
+        self._thread = None
+        self._stopping = False
+
+    def _encode(self, frame) -> bytes:
+        frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buf.tobytes() if ok else b""
+
+    def _images(self):
+        if self.path.is_dir():
+            files = sorted(
+                p for p in self.path.iterdir()
+                if p.suffix.lower() in (".jpg", ".jpeg", ".png")
+            )
+            for p in files:
+                yield cv2.imread(str(p), cv2.IMREAD_COLOR)
+            return
+
+        cap = cv2.VideoCapture(str(self.path))
+        try:
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield frame
+        finally:
+            cap.release()
+
+    def _producer(self) -> None:
+        next_at = time.monotonic()
+        while not self._stopping:
+            produced = 0
+            for frame in self._images():
+                if self._stopping:
+                    return
+                if frame is None:
+                    continue
+                # Like a real camera: frames keep coming whether or not anyone reads them
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at = max(next_at + self.period, time.monotonic())
+                jpeg_bytes = self._encode(frame)
+                if jpeg_bytes:
+                    self.frames.put(jpeg_bytes, time.time())
+                    produced += 1
+            if not self.loop or produced == 0:
+                break
+        self.finished = True
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._producer, daemon=True)
+        self._thread.start()
+
+    def latest(self, newer_than: int = 0, timeout: float = None):
+        if self.finished and self.frames.seq <= newer_than:
+            raise EOFError(f"end of {self.path}")
+        return self.frames.get(newer_than, timeout)
+
+    def stop(self) -> None:
+        self._stopping = True
+
+
+def reshape_jpeg(jpeg_bytes: bytes, size=None, scale: float = 1.0, quality: int = 90) -> bytes:
+    """
+    Re-encode a JPEG at `quality`, stretched to `size` (w, h) and scaled by
+    `scale`; the input unchanged if it does not decode.
+    """
+    # libjpeg halves the resolution while decoding, so the half-size level is also the cheaper one
+    flag = cv2.IMREAD_REDUCED_COLOR_2 if scale <= 0.5 else cv2.IMREAD_COLOR
+    frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), flag)
+    if frame is None:
+        return jpeg_bytes
+    if size is not None:
+        target = (max(1, int(size[0] * scale)), max(1, int(size[1] * scale)))
+        if (frame.shape[1], frame.shape[0]) != target:
+            frame = cv2.resize(frame, target, interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buf.tobytes() if ok else jpeg_bytes
+
+
+def open_source(source: str, width: int, height: int, quality: int, fps: float):
+    """Build (but do not start) the frame source named by camera_source."""
+    source = (source or "rpicam").strip()
+    if source == "rpicam":
+        return RpicamStreamSource(width, height, quality, fps)
+    if source == "rpicam-jpeg":
+        return RpicamStillSource(width, height, quality, fps)
+    return FileSource(source, width, height, quality, fps)
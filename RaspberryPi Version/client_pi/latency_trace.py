@@ -0,0 +1,191 @@
+# Guided_Vision/client_pi/latency_trace.py
+#
+# End-to-end latency tracing: camera shutter -> alert audio.
+#
+# Every uploaded frame gets a FrameTrace. It collects client timestamps
+# (capture, upload start, response, speak, audio start) and the server's
+# per-stage breakdown from the response's "trace" field (receive, detector,
+# queue_wait, inference, post). Pi and server clocks are not synchronised,
+# so ClockSync estimates the offset NTP-style from the same request: the
+# client's send / receive times and the server's received_ts / sent_ts.
+#
+# When a trace finishes (alert played, frame safe, dropped, ...) it is
+# written to the trace log as one compact JSON line of stage durations.
+# Summarise the log with `python trace_summary.py`.
+
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+DEFAULT_LOG = Path.home() / ".cache" / "guidedvision" / "trace.jsonl"
+
+# Stage order in the log and the summary (ms):
+#   queue     capture -> upload start (scene gate, upload queue)
+#   uplink    upload start -> server received   (needs the clock offset)
+#   srv_*     server stages from the response
+#   downlink  server sent -> response received  (needs the clock offset)
+#   network   round trip - server time           (uplink + downlink, offset-free)
+#   handle    response -> speak() / handled
+#   tts       speak() -> audio start (alert queue, render / cache, player)
+#   total     capture -> audio start (alerts) or -> handled / speak() (everything else)
+STAGES = ("queue", "uplink", "srv_receive", "srv_detector", "srv_queue_wait", "srv_inference",
+          "srv_post", "downlink", "network", "handle", "tts", "total")
+
+
+class ClockSync:
+    """
+    Server-minus-client clock offset from request / response timestamps.
+
+    For one request: t0 client send, t1 server receive, t2 server send,
+    t3 client receive. offset = ((t1 - t0) + (t2 - t3)) / 2, accurate to within
+    half the network round trip (t3 - t0) - (t2 - t1). The sample with the
+    smallest round trip in the recent window is the best estimate.
+    """
+
+    def __init__(self, window: int = 32):
+        self._samples = deque(maxlen=max(1, int(window)))  # (rtt, offset)
+        self._lock = threading.Lock()
+
+    def add(self, t0: float, t1: float, t2: float, t3: float) -> None:
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0:
+            return  # server time went backwards or a bogus reply
+        with self._lock:
+            self._samples.append((rtt, ((t1 - t0) + (t2 - t3)) / 2.0))
+
+    def estimate(self):
+        """(offset_sec, error_sec) or (None, None) before the first sample."""
+        with self._lock:
+            if not self._samples:
+                return None, None
+            rtt, offset = min(self._samples)
+        return offset, rtt / 2.0
+
+
+class FrameTrace:
+    def __init__(self, tracer, seq: int, captured_at: float):
+        self.tracer = tracer
+        self.seq = seq
+        self.events = {"capture": captured_at}  # name -> client wall-clock time
+        self.server = None
+        self._done = False
+        self._lock = threading.Lock()
+
+    def mark(self, name: str, ts: float = None) -> None:
+        self.events[name] = time.time() if ts is None else ts
+
+    def response(self, data: dict) -> None:
+        """Server trace from a response (call after marking 'response')."""
+        server = data.get("trace")
+        if not server:
+            return
+        self.server = server
+        t0, t3 = self.events.get("upload_start"), self.events.get("response")
+        if t0 is not None and t3 is not None:
+            self.tracer.clock.add(t0, server["received_ts"], server["sent_ts"], t3)
+
+    def finish(self, outcome: str) -> None:
+        """Write the trace once; later calls are ignored."""
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+        self.tracer.write(self, outcome)
+
+    def stages(self, offset: float = None) -> dict:
+        ev = self.events
+        end = next((ev[k] for k in ("audio_start", "handled", "speak") if k in ev), None)
+
+        def span(a, b):
+            if a is None or b is None:
+                return None
+            return (b - a) * 1000.0
+
+        out = {
+            "queue": span(ev.get("capture"), ev.get("upload_start")),
+            "handle": span(ev.get("response"), ev.get("speak", ev.get("handled"))),
+            "tts": span(ev.get("speak"), ev.get("audio_start")),
+            "total": span(ev.get("capture"), end),
+        }
+        if self.server:
+            received, sent = self.server["received_ts"], self.server["sent_ts"]
+            for name, ms in self.server.get("stages_ms", {}).items():
+                out[f"srv_{name}"] = ms
+            out["network"] = span(ev.get("upload_start"), ev.get("response"))
+            if out["network"] is not None:
+                out["network"] -= (sent - received) * 1000.0
+            if offset is not None:
+                out["uplink"] = span(ev.get("upload_start"), received - offset)
+                out["downlink"] = span(sent - offset, ev.get("response"))
+        return {k: round(v, 1) for k, v in out.items() if v is not None}
+
+
+class _NullLog:
+    def write(self, line: str) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class TraceLog:
+    """Append-only JSON lines; rotated to <name>.1 once it grows past max_mb."""
+
+    def __init__(self, path, max_mb: float = 20.0):
+        self.path = Path(path).expanduser()
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a", encoding="utf-8", buffering=1)
+
+    def write(self, line: str) -> None:
+        self._file.write(line + "\n")
+        if self.max_bytes > 0 and self._file.tell() > self.max_bytes:
+            self._file.close()
+            self.path.replace(self.path.with_name(self.path.name + ".1"))
+            self._file = self.path.open("a", encoding="utf-8", buffering=1)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class Tracer:
+    """Creates FrameTraces and writes finished ones to the trace log (None = don't log)."""
+
+    def __init__(self, log_path=None, max_mb: float = 20.0, timer=None):
+        self.clock = ClockSync()
+        self.timer = timer
+        self._lock = threading.Lock()
+        self._log = _NullLog()
+        if log_path is not None:
+            try:
+                self._log = TraceLog(log_path, max_mb)
+            except OSError as e:
+                print(f"[GuidedVision] Trace log disabled ({e})")
+        self.written = 0
+
+    def start(self, seq: int, captured_at: float) -> FrameTrace:
+        return FrameTrace(self, seq, captured_at)
+
+    def write(self, trace: FrameTrace, outcome: str) -> None:
+        offset, error = self.clock.estimate()
+        stages = trace.stages(offset)
+        record = {
+            "seq": trace.seq,
+            "t": round(trace.events["capture"], 3),
+            "o": outcome,
+            "off": None if offset is None else round(offset * 1000.0, 1),
+            "err": None if error is None else round(error * 1000.0, 1),
+            "s": stages,
+        }
+        if self.timer is not None and outcome == "spoken" and "total" in stages:
+            self.timer.record("shutter_to_audio", stages["total"])
+        with self._lock:
+            self._log.write(json.dumps(record, separators=(",", ":")))
+            self.written += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._log.close()
+            self._log = _NullLog()  # the TTS worker may still finish a trace
@@ -0,0 +1,117 @@
+# Guided_Vision/client_pi/pacing.py
+#
+# Adaptive frame pacing from the server's load hints.
+#
+# Every result carries "load" (server/load_hints.py) with next_send_ms, the
+# delay after which this device's next frame would find the model free. The
+# Pacer steers two knobs inside the configured bounds:
+#
+#   capture interval  moves halfway to next_send_ms on every response
+#                     (clamped to min_frame_interval_sec .. frame_interval_sec),
+#                     doubles on "busy" replies and failed requests
+#   JPEG size         steps down (quality, then half resolution) while the
+#                     upload part of the round trip is over budget or the server
+#                     wants frames slower than the slowest allowed interval;
+#                     steps back up once things are comfortable again
+#
+# Size changes are one level at a time, at most once per `settle` responses,
+# so the loop sees the effect of a step before taking the next one.
+
+import threading
+
+from camera import reshape_jpeg
+
+
+class Pacer:
+    def __init__(self, min_interval_sec: float, max_interval_sec: float,
+                 quality: int, min_quality: int = 30, min_scale: float = 0.5,
+                 network_budget_ms: float = 300.0, gain: float = 0.5, settle: int = 3):
+        self.min_interval = float(min_interval_sec)
+        self.max_interval = max(float(max_interval_sec), self.min_interval)
+        self.network_budget_ms = float(network_budget_ms)
+        self.gain = min(1.0, max(0.0, float(gain)))
+        self.settle = max(1, int(settle))
+        self.interval = self.max_interval  # start at the old fixed rate and let hints pull it in
+
+        # (scale, JPEG quality) from the camera's own frames down to the smallest allowed
+        quality = int(quality)
+        min_quality = min(int(min_quality), quality)
+        self.levels = [(1.0, quality)]
+        self.levels += [(1.0, q) for q in range(quality - 10, min_quality - 1, -10)]
+        if self.levels[-1][1] != min_quality:
+            self.levels.append((1.0, min_quality))
+        if float(min_scale) <= 0.5:
+            self.levels.append((0.5, min_quality))
+        self.level = 0
+
+        self._since_step = 0
+        self._lock = threading.Lock()
+        self.steps_down = 0
+        self.steps_up = 0
+        self.last_hint = None
+
+    def _clamp(self, sec: float) -> float:
+        return min(self.max_interval, max(self.min_interval, sec))
+
+    def _step(self, delta: int) -> None:
+        level = min(len(self.levels) - 1, max(0, self.level + delta))
+        if level == self.level or self._since_step < self.settle:
+            return
+        self.level = level
+        self._since_step = 0
+        if delta > 0:
+            self.steps_down += 1
+        else:
+            self.steps_up += 1
+        scale, quality = self.levels[level]
+        print(f"[GuidedVision] Pacing: JPEG scale {scale}, quality {quality}")
+
+    def on_response(self, data: dict, round_trip_ms: float) -> None:
+        load = data.get("load")
+        server_ms = data.get("latency_ms")
+        with self._lock:
+            self._since_step += 1
+            wanted = None
+            if load and load.get("next_send_ms") is not None:
+                self.last_hint = load
+                wanted = float(load["next_send_ms"]) / 1000.0
+                self.interval = self._clamp(self.interval + self.gain * (wanted - self.interval))
+
+            network_ms = round_trip_ms - float(server_ms) if server_ms is not None else None
+            saturated = wanted is not None and wanted > self.max_interval
+            if saturated or (network_ms is not None and network_ms > self.network_budget_ms):
+                self._step(+1)
+            elif network_ms is not None and network_ms < self.network_budget_ms / 2:
+                self._step(-1)
+
+    def on_busy(self, retry_after_sec=None) -> None:
+        with self._lock:
+            wait = float(retry_after_sec) if retry_after_sec else 0.0
+            self.interval = self._clamp(max(self.interval * 2.0, wait))
+
+    def on_error(self) -> None:
+        """Timeouts / connection errors: slow down and send less."""
+        with self._lock:
+            self._since_step += 1
+            self.interval = self._clamp(self.interval * 2.0)
+            self._step(+1)
+
+    def encode(self, jpeg_bytes: bytes, size=None) -> bytes:
+        """
+        The frame at the current size level, based on `size` (w, h) if given,
+        else on the camera frame (returned untouched at level 0).
+        """
+        scale, quality = self.levels[self.level]
+        if self.level == 0 and size is None:
+            return jpeg_bytes
+        return reshape_jpeg(jpeg_bytes, size, scale, quality)
+
+    def stats(self) -> dict:
+        scale, quality = self.levels[self.level]
+        return {
+            "interval_sec": round(self.interval, 3),
+            "jpeg_scale": scale,
+            "jpeg_quality": quality,
+            "size_steps_down": self.steps_down,
+            "size_steps_up": self.steps_up,
+        }
@@ -1,53 +1,31 @@
 # Guided_Vision/client_pi/pi_client.py
 #
 # Raspberry Pi Camera Module 3 version
-# Uses rpicam-jpeg to grab a single JPEG each time
-# and sends it to the server for analysis.
-
-import sys
+# Keeps one rpicam-vid stream running (see camera.py) and runs three stages
+# concurrently: capture -> upload -> response/TTS, joined by latest-wins
+# queues (see pipeline.py), so the next frame is captured while the server
+# is still analysing the previous one.
+# Every uploaded frame is traced from shutter to alert audio (latency_trace.py).
+# The capture rate and JPEG size follow the server's load hints (pacing.py).
+
+import functools
+import socket
+import threading
 import time
 from pathlib import Path
-import subprocess
 
 import cv2
 import numpy as np
 import requests
 import yaml
 
-
-# ---------- SUPER SIMPLE TTS (no queues, no pyttsx3) ----------
-def speak(text: str) -> None:
-    if not text:
-        return
-
-    # Debug so we SEE if TTS is being called every time
-    print(f"[GuidedVision][TTS] speak() called with: {text!r}")
-
-    try:
-        if sys.platform.startswith("win"):
-            # Windows: use System.Speech via PowerShell
-            safe = text.replace("'", " ").replace('"', " ")
-            ps_command = (
-                "Add-Type -AssemblyName System.Speech; "
-                "$synth = New-Object System.Speech.Synthesis.SpeechSynthesizer; "
-                f"$synth.Speak('{safe}');"
-            )
-            # Use Popen so we don't block the loop
-            subprocess.Popen(
-                ["powershell", "-Command", ps_command],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-        else:
-            # Linux / Pi: assumes espeak is installed
-            safe = text.replace('"', " ").replace("'", " ")
-            subprocess.Popen(
-                ["espeak", safe],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-    except Exception as e:
-        print(f"[GuidedVision][TTS] ERROR: {e}")
+import tts
+from camera import open_source, reshape_jpeg
+from latency_trace import DEFAULT_LOG, Tracer
+from pacing import Pacer
+from pipeline import LatestQueue, QueueClosed, StageTimer
+from scene_gate import SceneGate
+from transport import ServerBusy, make_transport
 
 
 # ---------- Config loading ----------
@@ -60,43 +38,152 @@ def load_config() -> dict:
         return yaml.safe_load(f)
 
 
-# ---------- Capture from Camera Module 3 via rpicam-jpeg ----------
-def capture_frame_from_rpicam(width: int = 640,
-                              height: int = 480,
-                              quality: int = 80) -> bytes:
+def fetch_capture_profile(server_url: str, timeout: float):
+    """Frame size / JPEG quality the server's model consumes as-is, or None."""
+    try:
+        resp = requests.get(server_url + "/capture_profile", timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+    except Exception as e:
+        print(f"[GuidedVision] Could not fetch capture profile ({e}); using send_width / jpeg_quality.")
+        return None
+
+
+def fetch_alert_phrases(server_url: str, timeout: float) -> list:
+    """Warning sentences the server can send, for pre-rendering their audio."""
+    try:
+        resp = requests.get(server_url + "/alert_phrases", timeout=timeout)
+        resp.raise_for_status()
+        return list(resp.json().get("phrases", []))
+    except Exception as e:
+        print(f"[GuidedVision] Could not fetch alert phrases ({e}); audio will be cached lazily.")
+        return []
+
+
+# ---------- Pipeline stages ----------
+def capture_stage(source, upload_q: LatestQueue, frame_interval: float,
+                  timer: StageTimer, stop: threading.Event, gate: SceneGate = None,
+                  pacer: Pacer = None) -> None:
     """
-    Capture a single JPEG frame from Raspberry Pi Camera Module (libcamera / rpicam).
-    Returns the JPEG bytes, or b"" on error.
+    Every frame_interval (or the gate's adaptive interval), hand the newest
+    camera frame to the uploaders unless the scene gate says nothing changed.
+    With a pacer, never faster than the server can take frames from this device.
     """
-    cmd = [
-        "rpicam-jpeg",
-        "-o", "-",                 # output JPEG to stdout
-        "--width", str(width),
-        "--height", str(height),
-        "--quality", str(quality),
-        "--timeout", "200",
-	"--nopreview",        # ms; short delay for exposure
-    ]
+    frame_seq = 0  # last camera frame we queued
+    next_at = time.monotonic()
+    try:
+        while not stop.is_set():
+            delay = next_at - time.monotonic()
+            if delay > 0 and stop.wait(delay):
+                break
+            interval = gate.interval if gate is not None else frame_interval
+            if pacer is not None:
+                interval = max(interval, pacer.interval) if gate is not None else pacer.interval
+            next_at = max(next_at + interval, time.monotonic())
+
+            t0 = time.perf_counter()
+            try:
+                frame = source.latest(newer_than=frame_seq, timeout=2.0)
+            except (EOFError, RuntimeError) as e:
+                print(f"[GuidedVision] Camera stopped: {e}")
+                break
+
+            if frame is None or not frame[2]:
+                print("[GuidedVision] No frame from camera, skipping.")
+                timer.count("capture_errors")
+                continue
+            timer.record("capture", (time.perf_counter() - t0) * 1000.0)
+
+            frame_seq, captured_at, jpeg_bytes = frame
+            on_sent = None
+            if gate is not None:
+                t0 = time.perf_counter()
+                send, score, reason = gate.check(jpeg_bytes)
+                timer.record("gate", (time.perf_counter() - t0) * 1000.0)
+                if not send:
+                    timer.count("suppressed")
+                    continue
+                if reason == "heartbeat":
+                    timer.count("heartbeats")
+                # The gate's reference only moves once the frame is really uploaded,
+                # not if the upload queue drops it for a newer one
+                on_sent = functools.partial(gate.mark_sent, *gate.candidate)
+            upload_q.put((frame_seq, captured_at, jpeg_bytes, on_sent))
+    except QueueClosed:
+        pass
+    finally:
+        upload_q.close()
+
 
+def upload_stage(transport, upload_q: LatestQueue, result_q: LatestQueue,
+                 timer: StageTimer, tracer: Tracer, pacer: Pacer = None,
+                 reshape=None) -> None:
+    """
+    Send queued frames to the server; pass responses on to the handler.
+    reshape(jpeg_bytes) -> bytes re-encodes a frame before upload (capture profile, pacing).
+    """
+    consecutive_errors = 0
+    printed_response_keys = False
     try:
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-        )
-        return result.stdout  # JPEG bytes
-    except subprocess.CalledProcessError as e:
-        print("[GuidedVision] rpicam-jpeg ERROR:")
-        try:
-            print(e.stderr.decode(errors="ignore"))
-        except Exception:
-            pass
-        return b""
-    except FileNotFoundError:
-        print("[GuidedVision] ERROR: rpicam-jpeg not found. Install with:")
-        print("  sudo apt update && sudo apt install -y rpicam-apps")
-        return b""
+        while True:
+            try:
+                item = upload_q.get(timeout=1.0)
+            except QueueClosed:
+                break
+            if item is None:
+                continue
+            frame_seq, captured_at, jpeg_bytes, on_sent = item
+            timer.record("frame_age", (time.time() - captured_at) * 1000.0)
+            trace = tracer.start(frame_seq, captured_at)
+
+            upload_bytes = jpeg_bytes
+            if reshape is not None:
+                t0 = time.perf_counter()
+                upload_bytes = reshape(jpeg_bytes)
+                if upload_bytes is not jpeg_bytes:
+                    timer.record("reencode", (time.perf_counter() - t0) * 1000.0)
+
+            t0 = time.perf_counter()
+            trace.mark("upload_start")
+            try:
+                data = transport.analyze(upload_bytes, seq=frame_seq, capture_ts=captured_at)
+                trace.mark("response")
+                if on_sent is not None:
+                    on_sent()
+                if not printed_response_keys:
+                    print(f"[GuidedVision] First response keys: {list(data.keys())}")
+                    printed_response_keys = True
+                consecutive_errors = 0
+            except ServerBusy as e:
+                # Server is shedding load; skip this frame instead of retrying it
+                print("[GuidedVision] Server busy, frame dropped.")
+                timer.count("server_busy")
+                if pacer is not None:
+                    pacer.on_busy(e.args[0] if e.args else None)
+                trace.finish("busy")
+                continue
+            except Exception as e:
+                consecutive_errors += 1
+                timer.count("server_errors")
+                if consecutive_errors <= 3 or consecutive_errors % 10 == 0:
+                    print(f"[GuidedVision] Server error (#{consecutive_errors}): {e}")
+                if pacer is not None:
+                    pacer.on_error()
+                trace.finish("error")
+                continue
+
+            round_trip = (time.perf_counter() - t0) * 1000.0
+            timer.record("round_trip", round_trip)
+            if data.get("latency_ms") is not None:
+                server_ms = float(data["latency_ms"])
+                timer.record("server", server_ms)
+                timer.record("network", round_trip - server_ms)
+            if pacer is not None:
+                pacer.on_response(data, round_trip)
+            trace.response(data)
+            result_q.put((frame_seq, captured_at, jpeg_bytes, data, trace))
+    finally:
+        transport.close()
 
 
 def main() -> None:
@@ -106,74 +193,182 @@ def main() -> None:
     print(f"[GuidedVision] Config loaded: {cfg}")
 
     server_url = str(cfg.get("server_url", "http://localhost:8000")).rstrip("/")
-    endpoint = server_url + "/analyze_frame"
 
-    # We ignore camera_index for Camera Module 3; we always use rpicam-jpeg
+    # We ignore camera_index for Camera Module 3.
+    # camera_source: "rpicam" (continuous rpicam-vid), "rpicam-jpeg" (one process
+    # per frame), or a video / JPEG / folder path to run without a camera
+    camera_source = str(cfg.get("camera_source", "rpicam"))
+    camera_fps = float(cfg.get("camera_fps", 10))
     send_width = int(cfg.get("send_width", 480))
     jpeg_quality = int(cfg.get("jpeg_quality", 50))
     request_timeout = float(cfg.get("request_timeout_sec", 3.0))
     frame_interval = float(cfg.get("frame_interval_sec", 3.0))  # 3s default
     show_preview = bool(cfg.get("show_preview", False))
+    # The server keeps one queued frame per device id (newest wins)
+    device_id = str(cfg.get("device_id") or socket.gethostname())
+    transport_name = str(cfg.get("transport", "http"))
+    # Concurrent uploads; >1 only helps when the server batches several frames
+    upload_workers = max(1, int(cfg.get("upload_workers", 1)))
+    stats_interval = float(cfg.get("stats_interval_sec", 30.0))
+    # Per-frame latency traces (summarise with trace_summary.py)
+    trace_log = None
+    if bool(cfg.get("trace_enabled", True)):
+        trace_log = cfg.get("trace_log") or DEFAULT_LOG
+
+    # Alert audio: pre-render every warning the server can send, play from cache
+    tts.configure(
+        cache_dir=cfg.get("tts_cache_dir") or None,
+        cache_size=int(cfg.get("tts_cache_size", 128)),
+        phrases=fetch_alert_phrases(server_url, request_timeout)
+        if bool(cfg.get("tts_prerender", True)) else (),
+        min_interval_sec=float(cfg.get("min_alert_interval_sec", 5.0)),
+        ttl_sec=float(cfg.get("alert_ttl_sec", 3.0)),
+    )
+
+    # Scene-change gating: skip frames that look like the last one we sent
+    gate = None
+    if bool(cfg.get("scene_gate_enabled", True)):
+        gate = SceneGate(
+            threshold=float(cfg.get("scene_change_threshold", 0.04)),
+            heartbeat_sec=float(cfg.get("heartbeat_sec", 6.0)),
+            min_interval_sec=float(cfg.get("min_frame_interval_sec", 0.5)),
+            max_interval_sec=frame_interval,
+        )
 
     # Derive a simple 4:3 height from width unless explicitly given
     send_height = int(cfg.get("send_height", int(send_width * 3 / 4)))
 
+    # Capture to the size the server's model consumes as-is (GET /capture_profile),
+    # but never send more than before: the profile's size is only taken when it has
+    # no more pixels than send_width x send_height, and its quality only lowers ours.
+    # The Pi camera keeps its configured aspect ratio so the field of view is never
+    # cropped to the profile's; those frames are stretched to the profile before upload.
+    upload_size = None
+    profile = None
+    if bool(cfg.get("capture_profile", True)):
+        profile = fetch_capture_profile(server_url, request_timeout)
+    if profile is not None:
+        jpeg_quality = min(jpeg_quality, int(profile.get("jpeg_quality") or jpeg_quality))
+        width, height = profile.get("width"), profile.get("height")
+        if not width or width * height > send_width * send_height:
+            width = height = None  # tiles mode (resized anyway) or a bigger frame than ours
+        elif camera_source.startswith("rpicam") and width * send_height != height * send_width:
+            send_width = int(round(height * send_width / send_height / 2.0)) * 2
+            send_height = height
+            upload_size = (width, height)
+        else:
+            send_width, send_height = width, height
+        size = f"{width}x{height}" if width else f"keeping {send_width}x{send_height}"
+        print(f"[GuidedVision] Capture profile ({profile.get('preprocess')}): {size}, "
+              f"quality {jpeg_quality}, camera {send_width}x{send_height}")
+
+    # Capture rate and upload size follow the server's load hints, within
+    # min_frame_interval_sec .. frame_interval_sec and down to the smallest JPEG allowed
+    pacer = None
+    if bool(cfg.get("pacing_enabled", True)):
+        pacer = Pacer(
+            min_interval_sec=float(cfg.get("min_frame_interval_sec", 0.5)),
+            max_interval_sec=frame_interval,
+            quality=jpeg_quality,
+            min_quality=int(cfg.get("pacing_min_jpeg_quality", 30)),
+            min_scale=float(cfg.get("pacing_min_scale", 0.5)),
+            network_budget_ms=float(cfg.get("pacing_network_budget_ms", 300.0)),
+        )
+
+    source = open_source(camera_source, send_width, send_height, jpeg_quality, camera_fps)
     print(
-        f"[GuidedVision] Using rpicam-jpeg with width={send_width}, "
-        f"height={send_height}, jpeg_quality={jpeg_quality}"
+        f"[GuidedVision] Using camera source {source.name!r} with width={send_width}, "
+        f"height={send_height}, jpeg_quality={jpeg_quality}, fps={camera_fps}"
     )
     print(
         f"[GuidedVision] request_timeout={request_timeout}, "
-        f"frame_interval={frame_interval}, show_preview={show_preview}"
+        f"frame_interval={frame_interval}, show_preview={show_preview}, "
+        f"transport={transport_name}, upload_workers={upload_workers}"
     )
+    if gate is not None:
+        print(
+            f"[GuidedVision] Scene gate: threshold={gate.threshold}, "
+            f"heartbeat={gate.heartbeat_sec}s, interval {gate.min_interval}-{gate.max_interval}s"
+        )
+    if pacer is not None:
+        print(
+            f"[GuidedVision] Pacing: interval {pacer.min_interval}-{pacer.max_interval}s, "
+            f"JPEG levels {pacer.levels}, network budget {pacer.network_budget_ms:.0f} ms"
+        )
 
-    consecutive_errors = 0
-    last_frame_time = 0.0
-    printed_response_keys = False
+    # "http" = multipart POST per frame, "websocket" = one persistent connection
+    transports = [
+        make_transport(transport_name, server_url, device_id, request_timeout)
+        for _ in range(upload_workers)
+    ]
 
-    print("[GuidedVision] Starting capture loop with Camera Module 3.")
-    print("[GuidedVision] Press Ctrl+C in the terminal to stop.")
+    def reshape(jpeg_bytes: bytes) -> bytes:
+        if pacer is not None:
+            return pacer.encode(jpeg_bytes, upload_size)
+        return reshape_jpeg(jpeg_bytes, upload_size, quality=jpeg_quality)
+
+    upload_q = LatestQueue("upload", maxsize=1)
+    result_q = LatestQueue("result", maxsize=2)
+    timer = StageTimer(stats_interval)
+    tracer = Tracer(trace_log, float(cfg.get("trace_log_max_mb", 20.0)), timer)
+    stop = threading.Event()
+
+    threads = [threading.Thread(
+        target=capture_stage, name="capture",
+        args=(source, upload_q, frame_interval, timer, stop, gate, pacer), daemon=True,
+    )]
+    uploaders = [
+        threading.Thread(target=upload_stage, name=f"upload-{i}",
+                         args=(t, upload_q, result_q, timer, tracer, pacer,
+                               reshape if pacer is not None or upload_size else None), daemon=True)
+        for i, t in enumerate(transports)
+    ]
 
-    try:
-        while True:
-            now = time.time()
+    def close_results_when_uploads_done() -> None:
+        for t in uploaders:
+            t.join()
+        result_q.close()
 
-            # Respect frame_interval
-            if (now - last_frame_time) < frame_interval:
-                # Small sleep to avoid busy-looping
-                time.sleep(0.01)
-                continue
-            last_frame_time = now
-
-            # --- Capture frame from Camera Module 3 ---
-            print("[GuidedVision] Capturing frame from rpicam-jpeg...")
-            jpeg_bytes = capture_frame_from_rpicam(
-                width=send_width,
-                height=send_height,
-                quality=jpeg_quality,
-            )
+    threads += uploaders
+    threads.append(threading.Thread(target=close_results_when_uploads_done, daemon=True))
 
-            if not jpeg_bytes:
-                print("[GuidedVision] Capture failed (empty JPEG), skipping frame.")
-                consecutive_errors += 1
-                time.sleep(0.5)
-                continue
+    last_handled = 0  # newest frame whose result we acted on
+
+    def tts_counts() -> dict:
+        t = tts.stats()
+        return {f"alerts_{k}": t[k] for k in ("spoken", "coalesced", "expired", "preempted", "overflow")}
+
+    def report_counts() -> dict:
+        counts = tts_counts()
+        if pacer is not None:
+            counts.update({f"pacing_{k}": v for k, v in pacer.stats().items()})
+        return counts
+
+    print("[GuidedVision] Starting capture loop with Camera Module 3.")
+    print("[GuidedVision] Press Ctrl+C in the terminal to stop.")
 
-            files = {"file": ("frame.jpg", jpeg_bytes, "image/jpeg")}
+    try:
+        source.start()
+        for t in threads:
+            t.start()
 
-            # Send to server
+        # Response handling (TTS, preview) stays on the main thread for cv2.imshow
+        while True:
+            timer.maybe_report((upload_q, result_q), extra=report_counts)
             try:
-                resp = requests.post(endpoint, files=files, timeout=request_timeout)
-                data = resp.json()
-                if not printed_response_keys:
-                    print(f"[GuidedVision] First response keys: {list(data.keys())}")
-                    printed_response_keys = True
-                consecutive_errors = 0
-            except Exception as e:
-                consecutive_errors += 1
-                if consecutive_errors <= 3 or consecutive_errors % 10 == 0:
-                    print(f"[GuidedVision] Server error (#{consecutive_errors}): {e}")
+                item = result_q.get(timeout=0.5)
+            except QueueClosed:
+                break
+            if item is None:
+                continue
+            frame_seq, captured_at, jpeg_bytes, data, trace = item
+            if frame_seq < last_handled:
+                # An older frame finished after a newer one; it is already stale
+                timer.count("stale_results")
+                trace.finish("stale")
                 continue
+            last_handled = frame_seq
+            t0 = time.perf_counter()
 
             # ---- Process server response ----
             is_danger = bool(data.get("is_danger", False))
@@ -190,7 +385,9 @@ def main() -> None:
                 # warning is like: "sharp edge to your left"
                 spoken_text = warning or "danger to your front"
                 print(f"[GuidedVision] SPEAK: {spoken_text}")
-                speak(spoken_text)
+                # Higher severity jumps the alert queue and can cut off a milder warning;
+                # the TTS worker finishes the trace once the audio has played
+                tts.speak(spoken_text, severity=int(data.get("severity") or 1), trace=trace)
 
             # Optional preview window (only if you have a monitor / X11)
             if show_preview:
@@ -205,10 +402,32 @@ def main() -> None:
                 except Exception as e:
                     print(f"[GuidedVision] Preview error: {e}")
 
+            timer.record("handle", (time.perf_counter() - t0) * 1000.0)
+            timer.record("end_to_end", (time.time() - captured_at) * 1000.0)
+            trace.mark("handled")
+            if not is_danger:
+                trace.finish("safe")
+
     except KeyboardInterrupt:
         print("[GuidedVision] KeyboardInterrupt received. Exiting...")
 
     finally:
+        stop.set()
+        upload_q.close()
+        source.stop()
+        if gate is not None:
+            g = gate.stats()
+            print(
+                f"[GuidedVision] Scene gate: sent {g['sent']}/{g['checked']} frames, "
+                f"suppressed {g['suppressed']}, heartbeats {g['heartbeats']}"
+            )
+        print(f"[GuidedVision] Alerts: {tts_counts()}")
+        offset, error = tracer.clock.estimate()
+        if offset is not None:
+            print(f"[GuidedVision] Clock offset to server: {offset * 1000.0:+.1f} ms "
+                  f"(+/- {error * 1000.0:.1f} ms)")
+        tracer.close()
+        print(f"[GuidedVision] Traced {tracer.written} frames")
         if show_preview:
             cv2.destroyAllWindows()
         print("[GuidedVision] Client shut down cleanly.")
@@ -0,0 +1,104 @@
+# Guided_Vision/client_pi/pipeline.py
+#
+# Plumbing for the pipelined client loop:
+#   capture -> [upload queue] -> upload worker(s) -> [result queue] -> handler (TTS)
+# Queues are bounded and latest-wins: a full queue drops its oldest item, so a
+# slow stage always works on the freshest frame instead of a backlog.
+
+import statistics
+import threading
+import time
+from collections import deque
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class LatestQueue:
+    def __init__(self, name: str, maxsize: int = 1):
+        self.name = name
+        self._items = deque()
+        self._maxsize = max(1, int(maxsize))
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item) -> None:
+        with self._cond:
+            if self._closed:
+                raise QueueClosed(self.name)
+            while len(self._items) >= self._maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout: float = None):
+        """Oldest queued item, or None on timeout. Raises QueueClosed once drained."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if self._items:
+                return self._items.popleft()
+            raise QueueClosed(self.name)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class StageTimer:
+    """Collects per-stage durations (ms) and prints a summary every interval_sec."""
+
+    def __init__(self, interval_sec: float = 30.0, window: int = 200):
+        self.interval_sec = float(interval_sec)
+        self._samples = {}
+        self._counts = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self._last_report = time.monotonic()
+
+    def record(self, stage: str, ms: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self._window)).append(ms)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {
+                stage: {
+                    "n": len(s),
+                    "p50_ms": statistics.median(s),
+                    "mean_ms": statistics.mean(s),
+                    "max_ms": max(s),
+                }
+                for stage, s in self._samples.items() if s
+            }
+            return {"stages": stages, "counts": dict(self._counts)}
+
+    def maybe_report(self, queues=(), extra=None) -> None:
+        now = time.monotonic()
+        if self.interval_sec <= 0 or now - self._last_report < self.interval_sec:
+            return
+        self._last_report = now
+
+        summary = self.summary()
+        print("[GuidedVision] Stage timing (last "
+              f"{self._window} samples per stage):")
+        for stage, s in summary["stages"].items():
+            print(f"[GuidedVision]   {stage:<14} n={s['n']:4d}  p50={s['p50_ms']:8.1f} ms  "
+                  f"mean={s['mean_ms']:8.1f} ms  max={s['max_ms']:8.1f} ms")
+        counts = dict(summary["counts"])
+        for q in queues:
+            counts[f"{q.name}_dropped"] = q.dropped
+        if extra is not None:
+            counts.update(extra())
+        if counts:
+            print("[GuidedVision]   " + "  ".join(f"{k}={v}" for k, v in sorted(counts.items())))
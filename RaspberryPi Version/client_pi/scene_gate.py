@@ -0,0 +1,115 @@
+# Guided_Vision/client_pi/scene_gate.py
+#
+# Client-side scene-change gating: only upload a frame when the picture has
+# changed enough since the last one we sent, or when the heartbeat runs out.
+# While the scene is moving the capture interval shrinks; when it settles the
+# interval relaxes back to frame_interval_sec.
+#
+# A frame that passes the gate only becomes the reference ("last one we sent")
+# once the uploader reports it actually reached the server: the latest-wins
+# upload queue may still drop it, and then the server never saw that scene.
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+THUMB_SIZE = (32, 24)  # (w, h) grayscale grid the score is computed on
+
+
+def thumbnail(jpeg_bytes: bytes):
+    """Tiny float32 grayscale grid of a JPEG, or None if it does not decode."""
+    # libjpeg scales by 1/8 while decoding, so this never builds a full-size image
+    small = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    grid = cv2.resize(small, THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+    # Remove overall brightness so auto-exposure drift does not count as change
+    return grid - grid.mean()
+
+
+def change_score(a, b) -> float:
+    """Mean absolute difference of two thumbnails, scaled to 0..1."""
+    return float(np.abs(a - b).mean()) / 255.0
+
+
+class SceneGate:
+    def __init__(self, threshold: float, heartbeat_sec: float,
+                 min_interval_sec: float, max_interval_sec: float):
+        self.threshold = float(threshold)
+        self.heartbeat_sec = float(heartbeat_sec)
+        self.min_interval = float(min_interval_sec)
+        self.max_interval = max(float(max_interval_sec), self.min_interval)
+        self.interval = self.max_interval  # current capture period
+
+        self._sent_thumb = None
+        self._sent_at = 0.0
+        self._prev_thumb = None
+        self._lock = threading.Lock()  # mark_sent() is called from the upload threads
+        self.candidate = None  # (thumbnail, time) of the last frame that passed, for mark_sent()
+
+        self.checked = 0
+        self.sent = 0
+        self.suppressed = 0
+        self.heartbeats = 0
+
+    def check(self, jpeg_bytes: bytes):
+        """
+        Decide whether this frame should go to the server.
+        Returns (send, score, reason) with reason in
+        "first" | "change" | "heartbeat" | "undecodable" | "static".
+        When send is True, pass self.candidate to mark_sent() once the frame is uploaded.
+        """
+        now = time.monotonic()
+        self.checked += 1
+        thumb = thumbnail(jpeg_bytes)
+        if thumb is None:
+            # Let the server decide what to make of it
+            return self._send(None, now, 1.0, "undecodable")
+
+        # Motion since the previous capture drives the capture interval
+        if self._prev_thumb is not None:
+            if change_score(thumb, self._prev_thumb) >= self.threshold:
+                self.interval = max(self.min_interval, self.interval / 2.0)
+            else:
+                self.interval = min(self.max_interval, self.interval * 1.5)
+        self._prev_thumb = thumb
+
+        with self._lock:
+            sent_thumb, sent_at = self._sent_thumb, self._sent_at
+        if sent_thumb is None:
+            return self._send(thumb, now, 1.0, "first")
+
+        score = change_score(thumb, sent_thumb)
+        if score >= self.threshold:
+            return self._send(thumb, now, score, "change")
+        if now - sent_at >= self.heartbeat_sec:
+            self.heartbeats += 1
+            return self._send(thumb, now, score, "heartbeat")
+
+        self.suppressed += 1
+        return False, score, "static"
+
+    def _send(self, thumb, now: float, score: float, reason: str):
+        self.candidate = (thumb, now)
+        self.sent += 1
+        return True, score, reason
+
+    def mark_sent(self, thumb, at: float) -> None:
+        """A frame that passed check() reached the server: it is the new reference."""
+        with self._lock:
+            if at < self._sent_at:
+                return  # an older frame finishing after a newer one (several uploaders)
+            if thumb is not None:
+                self._sent_thumb = thumb
+            self._sent_at = at
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+            "heartbeats": self.heartbeats,
+            "interval_sec": round(self.interval, 3),
+        }
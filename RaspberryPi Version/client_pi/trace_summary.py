@@ -0,0 +1,117 @@
+# Guided_Vision/client_pi/trace_summary.py
+#
+# Latency breakdown from the client's trace log (latency_trace.py):
+# percentiles per stage, from camera shutter to alert audio.
+#
+#   python trace_summary.py                          # ~/.cache/guidedvision/trace.jsonl
+#   python trace_summary.py --outcome spoken         # only frames whose alert was played
+#   python trace_summary.py --last 500 --json summary.json
+#   python trace_summary.py /path/to/trace.jsonl trace.jsonl.1
+
+import argparse
+import json
+import statistics
+from collections import Counter
+from pathlib import Path
+
+from latency_trace import DEFAULT_LOG, STAGES
+
+
+def _percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def load(paths) -> list:
+    records = []
+    for path in paths:
+        path = Path(path).expanduser()
+        if not path.exists():
+            continue
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass  # a line cut short by a crash
+    records.sort(key=lambda r: r.get("t", 0))
+    return records
+
+
+def summarize(records: list) -> dict:
+    stages = {}
+    for name in STAGES:
+        values = [r["s"][name] for r in records if r.get("s", {}).get(name) is not None]
+        if values:
+            stages[name] = {
+                "n": len(values),
+                "p50_ms": _percentile(values, 50),
+                "p90_ms": _percentile(values, 90),
+                "p99_ms": _percentile(values, 99),
+                "mean_ms": statistics.mean(values),
+                "max_ms": max(values),
+            }
+    offsets = [r["off"] for r in records if r.get("off") is not None]
+    errors = [r["err"] for r in records if r.get("err") is not None]
+    return {
+        "frames": len(records),
+        "outcomes": dict(Counter(r.get("o") for r in records)),
+        "clock_offset_ms": {
+            "median": statistics.median(offsets) if offsets else None,
+            "min": min(offsets) if offsets else None,
+            "max": max(offsets) if offsets else None,
+            "max_error": max(errors) if errors else None,
+        },
+        "stages": stages,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-stage latency percentiles from the trace log")
+    parser.add_argument("logs", nargs="*", default=[str(DEFAULT_LOG) + ".1", str(DEFAULT_LOG)])
+    parser.add_argument("--outcome", action="append",
+                        help="Only these outcomes (spoken, safe, coalesced, expired, busy, ...); repeatable")
+    parser.add_argument("--last", type=int, help="Only the newest N frames")
+    parser.add_argument("--json", help="Write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    records = load(args.logs)
+    if args.outcome:
+        records = [r for r in records if r.get("o") in args.outcome]
+    if args.last:
+        records = records[-args.last:]
+    if not records:
+        print("No traced frames found.")
+        return
+
+    summary = summarize(records)
+    print(f"{summary['frames']} frames  outcomes: "
+          + "  ".join(f"{k}={v}" for k, v in sorted(summary["outcomes"].items(), key=str)))
+    clock = summary["clock_offset_ms"]
+    if clock["median"] is not None:
+        print(f"clock offset (server - Pi): median {clock['median']:+.1f} ms, "
+              f"range {clock['min']:+.1f} .. {clock['max']:+.1f} ms, error <= {clock['max_error']:.1f} ms")
+    else:
+        print("clock offset: unknown (no server traces); uplink / downlink not split")
+
+    total_p50 = summary["stages"].get("total", {}).get("p50_ms")
+    print(f"\n{'stage':<16}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'mean ms':>10}"
+          f"{'max ms':>10}{'% of p50':>10}")
+    for name, s in summary["stages"].items():
+        share = ""
+        if total_p50 and name not in ("total", "network"):
+            share = f"{100.0 * s['p50_ms'] / total_p50:.0f}%"
+        print(f"{name:<16}{s['n']:>6}{s['p50_ms']:>10.1f}{s['p90_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+              f"{s['mean_ms']:>10.1f}{s['max_ms']:>10.1f}{share:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
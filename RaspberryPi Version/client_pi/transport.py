@@ -0,0 +1,116 @@
+# Guided_Vision/client_pi/transport.py
+#
+# How frames get to the server:
+#   "http"      -> one multipart POST to /analyze_frame per frame
+#   "websocket" -> one persistent connection to /ws, binary frames in, JSON results out
+
+import json
+import struct
+import time
+
+import requests
+
+_LEN = struct.Struct(">H")
+
+
+class ServerBusy(Exception):
+    """The server shed this frame (HTTP 503 / {"error": "busy"}); just move on."""
+
+
+def encode_frame_message(header: dict, jpeg_bytes: bytes) -> bytes:
+    # Same layout as server/frame_protocol.py: [uint16 N][N bytes JSON header][JPEG]
+    raw = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return _LEN.pack(len(raw)) + raw + jpeg_bytes
+
+
+class HttpTransport:
+    name = "http"
+
+    def __init__(self, server_url: str, device_id: str, timeout: float):
+        self.endpoint = server_url.rstrip("/") + "/analyze_frame"
+        self.timeout = timeout
+        # Keep-alive session: one TCP (and TLS) handshake instead of one per frame
+        self.session = requests.Session()
+        self.session.headers["X-Device-Id"] = device_id
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def analyze(self, jpeg_bytes: bytes, seq: int, capture_ts: float) -> dict:
+        files = {"file": ("frame.jpg", jpeg_bytes, "image/jpeg")}
+        resp = self.session.post(self.endpoint, files=files, timeout=self.timeout)
+        if resp.status_code == 503:
+            raise ServerBusy(resp.headers.get("Retry-After"))
+        # 400 bad frame, 422, 500 ...: an error, never a (safe-looking) result
+        resp.raise_for_status()
+        return resp.json()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class WebSocketTransport:
+    name = "websocket"
+
+    def __init__(self, server_url: str, device_id: str, timeout: float):
+        base = server_url.rstrip("/")
+        if base.startswith("https://"):
+            base = "wss://" + base[len("https://"):]
+        elif base.startswith("http://"):
+            base = "ws://" + base[len("http://"):]
+        self.url = base + "/ws"
+        self.device_id = device_id
+        self.timeout = timeout
+        self._ws = None
+
+    def _connection(self):
+        if self._ws is None:
+            import websocket  # websocket-client; only needed for this transport
+            self._ws = websocket.create_connection(self.url, timeout=self.timeout)
+        return self._ws
+
+    def analyze(self, jpeg_bytes: bytes, seq: int, capture_ts: float) -> dict:
+        header = {"device_id": self.device_id, "ts": capture_ts, "seq": seq}
+        try:
+            ws = self._connection()
+            ws.send_binary(encode_frame_message(header, jpeg_bytes))
+            deadline = time.time() + self.timeout
+            while True:
+                data = json.loads(ws.recv())
+                # Replies to older frames (e.g. after a timeout) are skipped
+                if data.get("seq") == seq:
+                    break
+                if time.time() > deadline:
+                    raise TimeoutError(f"no reply for frame {seq}")
+        except Exception:
+            # Drop the socket; the next frame reconnects
+            self.close()
+            raise
+
+        if data.get("error") in ("busy", "not_ready"):
+            raise ServerBusy(data.get("retry_after_sec"))
+        if data.get("error"):
+            raise RuntimeError(f"server error: {data.get('error')} {data.get('detail', '')}")
+        return data
+
+    def close(self) -> None:
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+            self._ws = None
+
+
+TRANSPORTS = {
+    "http": HttpTransport,
+    "websocket": WebSocketTransport,
+}
+
+
+def make_transport(name: str, server_url: str, device_id: str, timeout: float):
+    try:
+        cls = TRANSPORTS[name]
+    except KeyError:
+        raise ValueError(f"transport must be one of {sorted(TRANSPORTS)}, got {name!r}")
+    return cls(server_url, device_id, timeout)
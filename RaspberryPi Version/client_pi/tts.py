@@ -1,18 +1,48 @@
 # Guided_Vision/client_pi/tts.py
+#
+# Alert speech for the Pi client.
+#
+# The server only ever says "<hazard> to your <direction>", so the phrases are
+# rendered to WAV once (espeak / System.Speech), kept in a bounded in-memory
+# LRU backed by an on-disk cache, and played through one long-lived audio
+# player. Only a phrase that has never been rendered pays for live synthesis.
+#
+# Alerts wait in a priority queue (highest severity first). Stale alerts expire,
+# repeats of the same warning within min_alert_interval_sec are coalesced, and
+# a more severe alert cuts off a less severe one that is still playing.
+#
+# speak() can carry a frame trace (latency_trace.FrameTrace): it is marked
+# when the audio starts and finished with what became of the alert.
 
-import threading
+import hashlib
+import heapq
+import io
+import itertools
+import os
 import subprocess
-import queue
 import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "guidedvision" / "tts"
+VOICE = "espeak" if not sys.platform.startswith("win") else "system.speech"
 
-_tts_queue: "queue.Queue[str]" = queue.Queue()
 
+def _safe(text: str) -> str:
+    return text.replace('"', " ").replace("'", " ")
+
+
+# --- Live synthesis (last resort when nothing can be rendered or played) ---
 
 def _speak_linux(text: str) -> None:
-    safe = text.replace('"', " ").replace("'", " ")
     try:
         subprocess.run(
-            ["espeak", safe],
+            ["espeak", _safe(text)],
             check=False,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
@@ -22,11 +52,10 @@ def _speak_linux(text: str) -> None:
 
 
 def _speak_windows(text: str) -> None:
-    safe = text.replace("'", " ").replace('"', " ")
     ps_command = (
         "Add-Type -AssemblyName System.Speech; "
         "$synth = New-Object System.Speech.Synthesis.SpeechSynthesizer; "
-        f"$synth.Speak('{safe}');"
+        f"$synth.Speak('{_safe(text)}');"
     )
     try:
         subprocess.run(
@@ -39,30 +68,442 @@ def _speak_windows(text: str) -> None:
         print(f"[TTS] Windows TTS error: {e}")
 
 
-def _tts_worker() -> None:
-    while True:
-        text = _tts_queue.get()
-        if text is None:
-            _tts_queue.task_done()
-            break
+# --- Rendering phrases to WAV bytes ---
+
+def _render_linux(text: str) -> bytes:
+    result = subprocess.run(
+        ["espeak", "--stdout", _safe(text)],
+        check=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    return result.stdout
+
+
+def _render_windows(text: str) -> bytes:
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    ps_command = (
+        "Add-Type -AssemblyName System.Speech; "
+        "$synth = New-Object System.Speech.Synthesis.SpeechSynthesizer; "
+        f"$synth.SetOutputToWaveFile('{path}'); "
+        f"$synth.Speak('{_safe(text)}'); "
+        "$synth.Dispose();"
+    )
+    try:
+        subprocess.run(
+            ["powershell", "-Command", ps_command],
+            check=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return Path(path).read_bytes()
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def render(text: str) -> bytes:
+    """WAV bytes for text, or b"" if no synthesiser is available."""
+    try:
+        if sys.platform.startswith("win"):
+            return _render_windows(text)
+        return _render_linux(text)
+    except Exception as e:
+        print(f"[TTS] Render error for {text!r}: {e}")
+        return b""
+
+
+# --- Phrase cache ---
+
+class AlertAudioCache:
+    """
+    Rendered alert audio: bounded in-memory LRU in front of an on-disk cache
+    (one WAV per phrase, keyed by voice + text).
+    """
+
+    def __init__(self, cache_dir=None, max_entries: int = 128):
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else DEFAULT_CACHE_DIR
+        self.max_entries = max(1, int(max_entries))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            print(f"[TTS] Disk cache disabled ({e})")
+            self.cache_dir = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, text: str):
+        if self.cache_dir is None:
+            return None
+        key = hashlib.sha1(f"{VOICE}\n{text}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.wav"
+
+    def _remember(self, text: str, wav: bytes) -> None:
+        with self._lock:
+            self._memory[text] = wav
+            self._memory.move_to_end(text)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, text: str):
+        """Cached WAV bytes for text, or None."""
+        with self._lock:
+            wav = self._memory.get(text)
+            if wav is not None:
+                self._memory.move_to_end(text)
+                self.memory_hits += 1
+                return wav
+
+        path = self._path(text)
+        if path is not None and path.exists():
+            wav = path.read_bytes()
+            if wav:
+                self._remember(text, wav)
+                self.disk_hits += 1
+                return wav
+
+        self.misses += 1
+        return None
+
+    def put(self, text: str, wav: bytes) -> None:
+        if not wav:
+            return
+        self._remember(text, wav)
+        path = self._path(text)
+        if path is not None:
+            try:
+                tmp = path.with_suffix(".tmp")
+                tmp.write_bytes(wav)
+                tmp.replace(path)
+            except OSError as e:
+                print(f"[TTS] Could not write {path}: {e}")
+
+    def has(self, text: str) -> bool:
+        path = self._path(text)
+        with self._lock:
+            if text in self._memory:
+                return True
+        return path is not None and path.exists()
+
+    def prerender(self, phrases) -> None:
+        """Render every phrase not already on disk (run in a background thread)."""
+        t0 = time.perf_counter()
+        rendered = 0
+        for text in phrases:
+            if self.has(text):
+                continue
+            wav = render(text)
+            if not wav:
+                print("[TTS] Pre-render stopped: no synthesiser available.")
+                break
+            self.put(text, wav)
+            rendered += 1
+        print(f"[TTS] Pre-rendered {rendered} new phrases "
+              f"({len(phrases)} total) in {time.perf_counter() - t0:.1f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_memory = len(self._memory)
+        return {
+            "in_memory": in_memory,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
 
-        if not text:
-            _tts_queue.task_done()
-            continue
+# --- Long-lived player ---
 
+class AudioPlayer:
+    """
+    Plays WAV bytes without spawning a process per alert.
+
+    Linux: one `aplay` reading raw PCM from stdin, restarted only if the audio
+    format changes or it dies. Windows: winsound, in-process.
+    """
+
+    def __init__(self):
+        self._proc = None
+        self._format = None
+
+    def _aplay(self, rate: int, channels: int, width: int):
+        fmt = (rate, channels, width)
+        if self._proc is not None and (self._proc.poll() is not None or self._format != fmt):
+            self.close()
+        if self._proc is None:
+            sample = {1: "U8", 2: "S16_LE", 4: "S32_LE"}[width]
+            self._proc = subprocess.Popen(
+                ["aplay", "-q", "-t", "raw", "-f", sample,
+                 "-r", str(rate), "-c", str(channels), "-"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            self._format = fmt
+        return self._proc
+
+    def play(self, wav: bytes, on_start=None, interrupt: threading.Event = None) -> bool:
+        """
+        Block until the phrase has played. Returns False if `interrupt` was set
+        first, in which case whatever is still buffered is thrown away.
+        """
+        if sys.platform.startswith("win"):
+            # winsound cannot play from memory asynchronously, so no pre-emption here
+            import winsound
+            if on_start:
+                on_start()
+            winsound.PlaySound(wav, winsound.SND_MEMORY)
+            return True
+
+        with wave.open(io.BytesIO(wav)) as w:
+            rate, channels, width = w.getframerate(), w.getnchannels(), w.getsampwidth()
+            proc = self._aplay(rate, channels, width)
+            pcm = w.readframes(w.getnframes())
+        started = time.perf_counter()
+        if on_start:
+            on_start()
+        try:
+            proc.stdin.write(pcm)
+            proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.close()
+            raise
+
+        remaining = started + len(pcm) / float(rate * channels * width) - time.perf_counter()
+        if interrupt is not None and interrupt.wait(max(0.0, remaining)):
+            # aplay still holds the rest of the phrase; killing it is the only way to cut it off
+            self._kill()
+            return False
+        if interrupt is None and remaining > 0:
+            time.sleep(remaining)
+        return True
+
+    def _kill(self) -> None:
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+            self._format = None
+
+    def close(self) -> None:
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=1)
+            except Exception:
+                self._proc.kill()
+            self._proc = None
+            self._format = None
+
+
+# --- Alert queue ---
+
+@dataclass
+class Alert:
+    text: str
+    severity: int
+    enqueued_at: float  # perf_counter
+    expires_at: float
+    trace: object = None  # FrameTrace, if the frame is being traced
+
+
+class AlertQueue:
+    """
+    Priority queue of pending alerts: higher severity first, then oldest first.
+
+    put() coalesces a warning that is already queued, playing, or was spoken
+    less than min_interval_sec ago. get() skips alerts older than their TTL.
+    A new alert more severe than the one playing sets `interrupt`.
+    """
+
+    def __init__(self, min_interval_sec: float = 5.0, ttl_sec: float = 3.0,
+                 max_pending: int = 8):
+        self.min_interval_sec = float(min_interval_sec)
+        self.ttl_sec = float(ttl_sec)
+        self.max_pending = max(1, int(max_pending))
+        self.interrupt = threading.Event()
+
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._last_spoken = {}  # text -> perf_counter when it started playing
+        self._speaking = None
+
+        self.enqueued = 0
+        self.spoken = 0
+        self.expired = 0
+        self.overflow = 0
+        self.coalesced = 0
+        self.preempted = 0
+
+    def put(self, text: str, severity: int = 1, ttl_sec: float = None, trace=None) -> bool:
+        """Queue an alert; False if it was coalesced into an earlier one."""
+        now = time.perf_counter()
+        ttl = self.ttl_sec if ttl_sec is None else float(ttl_sec)
+        with self._cond:
+            self.enqueued += 1
+            last = self._last_spoken.get(text)
+            if (
+                any(a.text == text for _, _, a in self._heap)
+                or (self._speaking is not None and self._speaking.text == text)
+                or (last is not None and now - last < self.min_interval_sec)
+            ):
+                self.coalesced += 1
+                _finish(trace, "coalesced")
+                return False
+
+            alert = Alert(text, int(severity), now, now + ttl, trace)
+            heapq.heappush(self._heap, (-alert.severity, next(self._order), alert))
+            if len(self._heap) > self.max_pending:
+                # Drop the least important (lowest severity, newest) pending alert
+                dropped = max(self._heap)
+                self._heap.remove(dropped)
+                heapq.heapify(self._heap)
+                self.overflow += 1
+                _finish(dropped[2].trace, "overflow")
+
+            if self._speaking is not None and alert.severity > self._speaking.severity:
+                self.interrupt.set()
+            self._cond.notify()
+            return True
+
+    def get(self) -> Alert:
+        """Block for the most important alert that has not expired yet."""
+        with self._cond:
+            while True:
+                self._cond.wait_for(lambda: self._heap)
+                _, _, alert = heapq.heappop(self._heap)
+                now = time.perf_counter()
+                if now > alert.expires_at:
+                    self.expired += 1
+                    _finish(alert.trace, "expired")
+                    continue
+                self._speaking = alert
+                self._last_spoken[alert.text] = now
+                self.interrupt.clear()
+                return alert
+
+    def done(self, alert: Alert, interrupted: bool) -> None:
+        with self._cond:
+            self._speaking = None
+            if interrupted:
+                self.preempted += 1
+                # It never finished, so it should not block the next identical warning
+                self._last_spoken.pop(alert.text, None)
+            else:
+                self.spoken += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._heap),
+                "enqueued": self.enqueued,
+                "spoken": self.spoken,
+                "expired": self.expired,
+                "overflow": self.overflow,
+                "coalesced": self.coalesced,
+                "preempted": self.preempted,
+            }
+
+
+def _finish(trace, outcome: str) -> None:
+    if trace is not None:
+        trace.finish(outcome)
+
+
+_cache = None  # set by configure(); created with defaults on first alert otherwise
+_player = AudioPlayer()
+_alerts = AlertQueue()
+
+
+def configure(cache_dir=None, cache_size: int = 128, phrases=(), prerender: bool = True,
+              min_interval_sec: float = None, ttl_sec: float = None) -> None:
+    """Set up the phrase cache and alert queue; optionally pre-render phrases."""
+    global _cache
+    if min_interval_sec is not None:
+        _alerts.min_interval_sec = float(min_interval_sec)
+    if ttl_sec is not None:
+        _alerts.ttl_sec = float(ttl_sec)
+    _cache = AlertAudioCache(cache_dir, cache_size)
+    phrases = list(phrases)
+    if prerender and phrases:
+        threading.Thread(target=_cache.prerender, args=(phrases,), daemon=True).start()
+
+
+def _say(alert: Alert) -> bool:
+    """Play one alert; returns False if a more severe alert cut it off."""
+    text = alert.text
+    if _cache is None:
+        configure(prerender=False)
+    wav = _cache.get(text)
+    source = "cache"
+    if wav is None:
+        # Never seen before: synthesise now, and keep it for next time
+        wav = render(text)
+        _cache.put(text, wav)
+        source = "live"
+
+    started = {}
+
+    def on_start():
+        started["t"] = time.perf_counter()
+        if alert.trace is not None:
+            alert.trace.mark("audio_start")
+        print(f"[TTS] {text!r} ({source}, severity {alert.severity}) "
+              f"alert->audio {(started['t'] - alert.enqueued_at) * 1000.0:.0f} ms")
+
+    finished = True
+    if wav:
+        try:
+            finished = _player.play(wav, on_start, _alerts.interrupt)
+        except Exception as e:
+            print(f"[TTS] Player error: {e}")
+            started.clear()
+
+    if not started:
+        # No renderer or player available: fall back to speaking directly
+        source = "direct"
+        on_start()
         if sys.platform.startswith("win"):
             _speak_windows(text)
         else:
             _speak_linux(text)
 
-        _tts_queue.task_done()
+    if not finished:
+        print(f"[TTS] {text!r} pre-empted by a more severe alert")
+    return finished
+
+
+def _tts_worker() -> None:
+    while True:
+        alert = _alerts.get()
+        finished = _say(alert)
+        _alerts.done(alert, interrupted=not finished)
+        _finish(alert.trace, "spoken" if finished else "preempted")
 
 
 _worker_thread = threading.Thread(target=_tts_worker, daemon=True)
 _worker_thread.start()
 
 
-def speak(text: str) -> None:
+def speak(text: str, severity: int = 1, ttl_sec: float = None, trace=None) -> None:
     if not text:
+        _finish(trace, "no_text")
         return
-    _tts_queue.put(text)
+    if trace is not None:
+        trace.mark("speak")
+    _alerts.put(text, severity, ttl_sec, trace)
+
+
+def stats() -> dict:
+    out = _alerts.stats()
+    if _cache is not None:
+        out.update(_cache.stats())
+    return out
@@ -0,0 +1,168 @@
+# Guided_Vision/server/backends.py
+#
+# Inference backends for the SmolVLM model (config.yaml: vlm_backend).
+#
+#   eager        plain PyTorch, as loaded by transformers
+#   compile      torch.compile on the vision encoder and the text decoder
+#                (compiled lazily: the warm-up frame pays for it)
+#   onnxruntime  vision encoder exported once to ONNX and run by ONNX Runtime
+#                on CPU; the export is cached on disk per model / library version
+#
+# A backend only changes how the model's modules execute. Preprocessing, the
+# prompt prefix cache, batching and the decode loop in vlm_service are shared,
+# so every backend produces captions through the same code path.
+# Compare them with `python bench_backends.py`.
+
+import copy
+import hashlib
+import os
+import time
+from pathlib import Path
+
+import torch
+
+from config import CONFIG
+
+BACKENDS = ("eager", "compile", "onnxruntime")
+
+# torch.compile mode: "default", "reduce-overhead" or "max-autotune"
+COMPILE_MODE = str(CONFIG.get("vlm_compile_mode", "default"))
+ONNX_CACHE_DIR = Path(os.path.expanduser(str(
+    CONFIG.get("vlm_onnx_cache_dir", "~/.cache/guidedvision/onnx")
+)))
+# Intra-op threads for ONNX Runtime (0 = same as torch)
+ONNX_THREADS = int(CONFIG.get("vlm_onnx_threads", 0))
+
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self):
+        self.info = {"backend": self.name}
+
+    def prepare(self, model, source: str):
+        """Return the model to run (may be modified in place)."""
+        return model
+
+
+class CompileBackend(EagerBackend):
+    name = "compile"
+
+    def prepare(self, model, source: str):
+        inner = model.model
+        # dynamic=True: tile counts and prompt lengths change from frame to frame
+        inner.vision_model.compile(mode=COMPILE_MODE, dynamic=True)
+        inner.text_model.compile(mode=COMPILE_MODE, dynamic=True)
+        self.info.update({"compile_mode": COMPILE_MODE})
+        return model
+
+
+class _VisionForExport(torch.nn.Module):
+    """
+    Full (unpadded) image tiles -> encoder hidden states, the graph ONNX sees.
+    For a full tile the encoder's per-image position ids are simply 0..N-1, so
+    they are written out here instead of traced from the padding-aware
+    bucketize code, which the exporter cannot type and which fixes the batch size.
+    """
+
+    def __init__(self, vision_model):
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values):
+        vm = self.vision_model
+        patches = vm.embeddings.patch_embedding(pixel_values).flatten(2).transpose(1, 2)
+        positions = torch.arange(patches.shape[1], device=pixel_values.device)
+        hidden = patches + vm.embeddings.position_embedding(positions)
+        hidden = vm.encoder(inputs_embeds=hidden).last_hidden_state
+        return vm.post_layernorm(hidden)
+
+
+class OrtVisionModel(torch.nn.Module):
+    """
+    Drop-in for model.model.vision_model that runs the exported encoder on
+    all tiles of a batch at once. Tiles with padded patches, which the SmolVLM
+    processor does not produce, go to the PyTorch encoder.
+    """
+
+    def __init__(self, session, fallback):
+        super().__init__()
+        self.session = session
+        self.fallback = fallback
+        self._input = session.get_inputs()[0].name
+
+    def forward(self, pixel_values, patch_attention_mask=None, **kwargs):
+        from transformers.modeling_outputs import BaseModelOutput
+
+        if patch_attention_mask is not None and not bool(patch_attention_mask.all()):
+            return self.fallback(pixel_values=pixel_values, patch_attention_mask=patch_attention_mask, **kwargs)
+        tiles = pixel_values.detach().to(torch.float32).cpu().numpy()
+        hidden = self.session.run(None, {self._input: tiles})[0]
+        hidden = torch.from_numpy(hidden).to(pixel_values.device, pixel_values.dtype)
+        return BaseModelOutput(last_hidden_state=hidden)
+
+
+class OnnxRuntimeBackend(EagerBackend):
+    name = "onnxruntime"
+
+    def _export_path(self, source: str, tile: int) -> Path:
+        import onnxruntime
+        import transformers
+        key = "|".join([source, str(tile), torch.__version__, transformers.__version__, onnxruntime.__version__])
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return ONNX_CACHE_DIR / f"vision_{digest}.onnx"
+
+    def _export(self, vision, tile: int, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Export from an fp32 copy (CPU ONNX Runtime has no fast bf16 kernels)
+        module = _VisionForExport(copy.deepcopy(vision).float().eval())
+        dummy = torch.zeros(2, 3, tile, tile)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        kwargs = dict(
+            input_names=["pixel_values"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"pixel_values": {0: "tiles"}, "last_hidden_state": {0: "tiles"}},
+            opset_version=17,
+        )
+        with torch.no_grad():
+            try:
+                torch.onnx.export(module, (dummy,), str(tmp), dynamo=False, **kwargs)
+            except TypeError:  # torch < 2.5 has no dynamo switch
+                torch.onnx.export(module, (dummy,), str(tmp), **kwargs)
+        os.replace(tmp, path)  # atomic: concurrent workers never load a half-written file
+
+    def prepare(self, model, source: str):
+        import onnxruntime as ort
+
+        inner = model.model
+        vision = inner.vision_model
+        if any(not p.is_floating_point() for p in vision.state_dict().values() if torch.is_tensor(p)):
+            raise ValueError("vlm_backend 'onnxruntime' needs vlm_precision fp32 or bf16")
+        tile = int(model.config.vision_config.image_size)
+
+        path = self._export_path(source, tile)
+        cached = path.exists()
+        t0 = time.perf_counter()
+        if not cached:
+            self._export(vision, tile, path)
+        export_ms = (time.perf_counter() - t0) * 1000.0
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = ONNX_THREADS or torch.get_num_threads()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        inner.vision_model = OrtVisionModel(session, vision)
+
+        self.info.update({
+            "onnx_path": str(path),
+            "onnx_cached": cached,
+            "onnx_export_ms": None if cached else export_ms,
+        })
+        return model
+
+
+def get_backend(name: str):
+    name = str(name).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"vlm_backend must be one of {BACKENDS}, got {name!r}")
+    return {"eager": EagerBackend, "compile": CompileBackend, "onnxruntime": OnnxRuntimeBackend}[name]()
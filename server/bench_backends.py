@@ -0,0 +1,119 @@
+# Guided_Vision/server/bench_backends.py
+#
+# Compare the inference backends (backends.py) on the same frames:
+# load time, first-frame latency (lazy compilation / ONNX session warm-up
+# included), steady-state latency, memory, and whether the captions match eager.
+#
+# Every backend runs in a fresh Python process, so load time and memory are
+# not skewed by an earlier backend in the same process.
+#
+#   cd server
+#   python bench_backends.py                                  # eager, compile, onnxruntime
+#   python bench_backends.py --backends eager onnxruntime --runs 20 --out backends.json
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import vlm_service
+from backends import BACKENDS
+from bench_replay import DEMO_DIR, peak_rss_mb, sample_clip
+
+RESULT_PREFIX = "BACKEND_RESULT "
+
+
+def _frames(limit: int) -> list:
+    """The same frames for every backend: demo clips at 0.5 fps, else the synthetic warm-up frame."""
+    frames = []
+    try:
+        for path in sorted(DEMO_DIR.glob("*.mp4")):
+            frames.extend(sample_clip(path, 0.5, 480, 70))
+            if len(frames) >= limit:
+                break
+    except SystemExit:  # no OpenCV
+        pass
+    return frames[:limit] or [vlm_service._warmup_frame()] * limit
+
+
+def run_backend(name: str, runs: int) -> dict:
+    """Child process: load with one backend and time the frames."""
+    vlm_service.BACKEND = name
+    vlm_service.WARMUP = False          # the first frame is measured instead
+    vlm_service.INFERENCE_PROCESSES = 0
+    frames = _frames(runs + 1)
+
+    t0 = time.perf_counter()
+    vlm_service.load_model()
+    load_ms = (time.perf_counter() - t0) * 1000.0
+
+    captions = []
+    latencies = []
+    for image_bytes in frames:
+        t0 = time.perf_counter()
+        captions.append(vlm_service.generate_caption(image_bytes))
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    steady = latencies[1:] or latencies
+    return {
+        "backend": name,
+        "info": vlm_service.MODEL_INFO.get("backend"),
+        "load_ms": load_ms,
+        "load_stages_ms": dict(vlm_service.LOAD_STATE["timings_ms"]),
+        "first_frame_ms": latencies[0],
+        "steady_p50_ms": statistics.median(steady),
+        "steady_mean_ms": statistics.mean(steady),
+        "rss_mb": vlm_service.rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "captions": captions,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load time, latency and memory per inference backend")
+    parser.add_argument("--backends", nargs="*", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--runs", type=int, default=10, help="Steady-state frames after the first one")
+    parser.add_argument("--out", help="Write the results as JSON to this file")
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(RESULT_PREFIX + json.dumps(run_backend(args.child, args.runs)), flush=True)
+        return
+
+    results = []
+    for name in args.backends:
+        print(f"--- {name} ---", flush=True)
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", name, "--runs", str(args.runs)],
+            stdout=subprocess.PIPE, text=True,
+        )
+        lines = [l for l in proc.stdout.splitlines() if l.startswith(RESULT_PREFIX)]
+        if proc.returncode != 0 or not lines:
+            print(f"{name}: failed (exit code {proc.returncode})")
+            continue
+        results.append(json.loads(lines[-1][len(RESULT_PREFIX):]))
+
+    reference = next((r["captions"] for r in results if r["backend"] == "eager"), None)
+    print(f"\n{'backend':<12}{'load ms':>10}{'first ms':>10}{'p50 ms':>9}{'mean ms':>9}"
+          f"{'RSS MB':>8}{'peak MB':>9}{'same as eager':>15}")
+    for r in results:
+        same = "n/a"
+        if reference is not None:
+            matches = sum(a == b for a, b in zip(r["captions"], reference))
+            r["same_captions_as_eager"] = matches / len(reference)
+            same = f"{matches}/{len(reference)}"
+        print(f"{r['backend']:<12}{r['load_ms']:>10.0f}{r['first_frame_ms']:>10.0f}"
+              f"{r['steady_p50_ms']:>9.0f}{r['steady_mean_ms']:>9.0f}"
+              f"{r['rss_mb'] or 0:>8.0f}{r['peak_rss_mb'] or 0:>9.0f}{same:>15}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# Guided_Vision/server/bench_fast_path.py
+#
+# Side-by-side comparison of the default image preprocessing and the
+# low-resolution fast path (vlm_fast_preprocess): image tokens per frame,
+# decode + preprocess time, prefill time, end-to-end caption time and danger
+# recall on the demo clips (demo/hardware_demo/labels.yaml).
+#
+#   cd server
+#   python bench_fast_path.py                         # both modes, 1 frame/s of video
+#   python bench_fast_path.py --size 384 --out fast.json
+#   python bench_fast_path.py --tokens-only           # processor only, no model weights
+#
+# Needs OpenCV for video decoding: pip install opencv-python-headless
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import yaml
+
+import vlm_service
+from bench_replay import DEMO_DIR, _percentile, sample_clip
+from hazards import classify_hazard
+from vlm_service import PROMPT, is_dangerous
+
+MODES = ("default", "fast")
+
+
+def _set_mode(mode: str, size: int) -> None:
+    vlm_service.FAST_PREPROCESS = mode == "fast"
+    vlm_service.FAST_IMAGE_SIZE = size
+
+
+def _load_processor() -> None:
+    from transformers import AutoProcessor
+    vlm_service.processor = AutoProcessor.from_pretrained(vlm_service.MODEL_PATH or vlm_service.MODEL_NAME)
+
+
+def measure_frame(image_bytes: bytes, image_token_id: int, caption: bool) -> dict:
+    t0 = time.perf_counter()
+    image = vlm_service._load_image(image_bytes)
+    inputs = vlm_service.processor(
+        text=[PROMPT], images=[[image]], return_tensors="pt", **vlm_service.image_kwargs()
+    )
+    preprocess_ms = (time.perf_counter() - t0) * 1000.0
+    row = {
+        "image_tokens": int((inputs["input_ids"] == image_token_id).sum()),
+        "preprocess_ms": preprocess_ms,
+    }
+    if caption:
+        before = vlm_service.generation_stats()["prefill_sec"]
+        t0 = time.perf_counter()
+        text = vlm_service.generate_caption(image_bytes)
+        row["caption_ms"] = (time.perf_counter() - t0) * 1000.0
+        row["prefill_ms"] = (vlm_service.generation_stats()["prefill_sec"] - before) * 1000.0
+        row["caption"] = text
+    return row
+
+
+def run_mode(mode: str, clips: list, labels: dict, args, image_token_id: int) -> dict:
+    _set_mode(mode, args.size)
+    rows = []
+    hazard_frames = flagged_hazard = 0
+    safe_frames = flagged_safe = 0
+    for path, frames in clips:
+        expected = list(labels.get(path.name) or [])
+        for image_bytes in frames:
+            row = measure_frame(image_bytes, image_token_id, caption=not args.tokens_only)
+            rows.append(row)
+            if args.tokens_only:
+                continue
+            flagged = is_dangerous(row["caption"])
+            if expected:
+                hazard_frames += 1
+                # Recall counts a frame only when the flagged hazard is one the clip shows
+                if flagged and classify_hazard(row["caption"]).category in expected:
+                    flagged_hazard += 1
+            else:
+                safe_frames += 1
+                flagged_safe += int(flagged)
+
+    def stat(key):
+        values = [r[key] for r in rows if key in r]
+        if not values:
+            return None
+        return {"mean": statistics.mean(values), "p50": _percentile(values, 50), "p95": _percentile(values, 95)}
+
+    return {
+        "mode": mode,
+        "image_size": args.size if mode == "fast" else None,
+        "frames": len(rows),
+        "image_tokens": stat("image_tokens"),
+        "preprocess_ms": stat("preprocess_ms"),
+        "prefill_ms": stat("prefill_ms"),
+        "caption_ms": stat("caption_ms"),
+        "danger_recall": flagged_hazard / hazard_frames if hazard_frames else None,
+        "false_alarm_rate": flagged_safe / safe_frames if safe_frames else None,
+    }
+
+
+def print_table(results: dict) -> None:
+    def cell(result, key, field="p50", fmt="{:.1f}"):
+        value = result[key]
+        if isinstance(value, dict):
+            value = value[field]
+        return "n/a" if value is None else fmt.format(value)
+
+    rows = [
+        ("image tokens / frame", "image_tokens", "mean", "{:.0f}"),
+        ("preprocess p50 (ms)", "preprocess_ms", "p50", "{:.1f}"),
+        ("prefill p50 (ms)", "prefill_ms", "p50", "{:.1f}"),
+        ("caption p50 (ms)", "caption_ms", "p50", "{:.1f}"),
+        ("caption p95 (ms)", "caption_ms", "p95", "{:.1f}"),
+        ("danger recall", "danger_recall", None, "{:.2f}"),
+        ("false alarm rate", "false_alarm_rate", None, "{:.2f}"),
+    ]
+    print(f"\n{'':<22}" + "".join(f"{m:>12}" for m in results))
+    for label, key, field, fmt in rows:
+        print(f"{label:<22}" + "".join(f"{cell(r, key, field, fmt):>12}" for r in results.values()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Default vs low-resolution fast image preprocessing")
+    parser.add_argument("--clips", nargs="*", help="Videos to sample (default: demo/hardware_demo/*.mp4)")
+    parser.add_argument("--labels", default=str(DEMO_DIR / "labels.yaml"))
+    parser.add_argument("--fps", type=float, default=1.0, help="Frames sampled per second of video")
+    parser.add_argument("--width", type=int, default=480, help="Resize frames to this width (like the clients)")
+    parser.add_argument("--size", type=int, default=vlm_service.FAST_IMAGE_SIZE,
+                        help="Fast-path target size (longest edge)")
+    parser.add_argument("--tokens-only", action="store_true",
+                        help="Only load the processor: image tokens and preprocessing time")
+    parser.add_argument("--out", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    paths = [Path(c) for c in args.clips] if args.clips else sorted(DEMO_DIR.glob("*.mp4"))
+    labels = {}
+    if Path(args.labels).exists():
+        with open(args.labels, "r", encoding="utf-8") as f:
+            labels = yaml.safe_load(f) or {}
+    clips = [(path, sample_clip(path, args.fps, args.width, 70)) for path in paths]
+
+    if args.tokens_only:
+        _load_processor()
+    else:
+        vlm_service.load_model()
+    image_token_id = vlm_service.processor.tokenizer.convert_tokens_to_ids("<image>")
+
+    results = {mode: run_mode(mode, clips, labels, args, image_token_id) for mode in MODES}
+    print(f"model={vlm_service.MODEL_PATH or vlm_service.MODEL_NAME}  device={vlm_service.DEVICE}  "
+          f"frames={results['default']['frames']}  fast size={args.size}")
+    print_table(results)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
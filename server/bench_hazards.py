@@ -0,0 +1,112 @@
+# Guided_Vision/server/bench_hazards.py
+#
+# Micro-benchmark: compiled hazard lexicon vs the old per-keyword substring scans.
+# Expect the lexicon to be slower (about 1.5x); it exists for correct matches, see hazards.py.
+#
+#   cd server
+#   python bench_hazards.py --runs 20000
+
+import argparse
+import time
+
+from hazards import LEXICON
+
+# --- The two lists the server used before hazards.yaml (kept here for comparison) ---
+
+LEGACY_HAZARD_KEYWORDS = [
+    "knife", "knives", "blade", "scissors",
+    "sharp edge", "sharp edges",
+    "sharp corner", "sharp corners",
+    "corner of the table", "table corner",
+    "edge of the table", "table edge",
+    "broken glass",
+    "table", "chair", "desk", "door", "wall", "edge",
+    "fire", "flame", "flames", "smoke",
+    "exposed cable", "exposed wire",
+    "loose cable", "loose wire",
+    "cable", "wire",
+    "hole", "open hole", "pit", "gap",
+    "stairs", "staircase", "step", "steps",
+    "obstacle", "barrier",
+]
+
+LEGACY_DANGER_KEYWORDS = [
+    "knife", "knives", "blade",
+    "sharp edge", "sharp edges",
+    "sharp corner", "sharp corners",
+    "corner of the table", "table corner",
+    "edge of the table", "table edge",
+    "broken glass", "table", "chair", "door", "edge", "wall",
+    "fire", "flame", "flames",
+    "exposed cable", "exposed wire",
+    "loose cable", "loose wire",
+    "cable", "wire", "rope", "pipe",
+    "hole", "open hole", "pit", "gap",
+    "stairs", "staircase", "step", "steps",
+    "obstacle", "barrier",
+]
+
+
+def legacy_classify(text: str):
+    t = text.lower()
+    danger = any(kw in t for kw in LEGACY_HAZARD_KEYWORDS)
+    keyword = "danger"
+    if danger:
+        for kw in LEGACY_DANGER_KEYWORDS:
+            if kw in t:
+                keyword = kw
+                break
+    return danger, keyword
+
+
+def lexicon_classify(text: str):
+    hazard = LEXICON.classify(text)
+    return hazard is not None, hazard.keyword if hazard else "danger"
+
+
+CAPTIONS = [
+    "A person holding a knife in front of you",
+    "A kitchen counter with scissors on the left",
+    "Smoke rising from a pan to your right",
+    "A stable shelf with books in front",
+    "The room is empty and there is no knife on the counter",
+    "Loose cables on the floor to your left about 1 meter away",
+    "A staircase going down in front of you",
+    "A person walking in a park on a sunny day",
+    "The corner of the table is close on your right",
+    "A hallway with a door at the end",
+]
+
+
+def _time(fn, runs: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        for caption in CAPTIONS:
+            fn(caption)
+    return (time.perf_counter() - t0) * 1e6 / (runs * len(CAPTIONS))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hazard lexicon vs legacy keyword scans")
+    parser.add_argument("--runs", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'caption':<58} {'legacy':<22} lexicon")
+    for caption in CAPTIONS:
+        old = legacy_classify(caption)
+        new = LEXICON.classify(caption)
+        new_desc = f"{new.keyword} [{new.category}/{new.severity}] @{new.span}" if new else "safe"
+        old_desc = old[1] if old[0] else "safe"
+        print(f"{caption[:56]:<58} {old_desc:<22} {new_desc}")
+
+    legacy_us = _time(legacy_classify, args.runs)
+    lexicon_us = _time(lexicon_classify, args.runs)
+    print()
+    print(f"legacy  (two substring scans): {legacy_us:7.2f} us/caption")
+    print(f"lexicon (one compiled regex):  {lexicon_us:7.2f} us/caption")
+    print(f"keywords: legacy {len(set(LEGACY_HAZARD_KEYWORDS) | set(LEGACY_DANGER_KEYWORDS))}, "
+          f"lexicon {len(LEXICON.keywords)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Guided_Vision/server/bench_prefill.py
+#
+# Measure decoder prefill time with and without the cached prompt prefix, and
+# whether the reordered prompt (instructions before the image, which is what
+# makes the prefix cacheable) still gives the same captions and hazard
+# verdicts as the layout SmolVLM was trained on.
+#
+#   cd server
+#   python bench_prefill.py                       # synthetic 480x360 frame, demo clips for agreement
+#   python bench_prefill.py path/to/frame.jpg --runs 20
+#   python bench_prefill.py --agreement-frames 0  # timing only
+
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+import vlm_service
+from bench_replay import DEMO_DIR, sample_clip
+from hazards import classify_hazard
+from vlm_service import PROMPT
+
+
+def _synthetic_frame() -> bytes:
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, size=(360, 480, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=70)
+    return buf.getvalue()
+
+
+def _summary(name: str, samples: list, tokens: int) -> None:
+    print(
+        f"{name:>14}: tokens={tokens:4d}  "
+        f"mean={statistics.mean(samples):8.1f} ms  "
+        f"p50={statistics.median(samples):8.1f} ms  "
+        f"min={min(samples):8.1f} ms"
+    )
+
+
+def _demo_frames(limit: int) -> list:
+    frames = []
+    for path in sorted(DEMO_DIR.glob("*.mp4")):
+        try:
+            frames.extend(sample_clip(path, 0.5, 480, 70))
+        except SystemExit:
+            break
+        if len(frames) >= limit:
+            break
+    return frames[:limit]
+
+
+def _captions(frames: list, cached: bool) -> list:
+    saved = vlm_service.prefix_cache
+    vlm_service.prefix_cache = saved if cached else None  # None = the original prompt layout
+    try:
+        return [vlm_service.generate_caption(f) for f in frames]
+    finally:
+        vlm_service.prefix_cache = saved
+
+
+def agreement(frames: list) -> dict:
+    """Captions and hazard labels of the original prompt vs the reordered (cached) one, per frame."""
+    original = _captions(frames, cached=False)
+    reordered = _captions(frames, cached=True)
+    rows = []
+    for before, after in zip(original, reordered):
+        hb, ha = classify_hazard(before), classify_hazard(after)
+        rows.append({
+            "original": before,
+            "reordered": after,
+            "same_caption": before == after,
+            "same_danger": (hb is None) == (ha is None),
+            "same_hazard": (hb and hb.category) == (ha and ha.category),
+        })
+    n = len(rows)
+    return {
+        "frames": n,
+        "caption_match": sum(r["same_caption"] for r in rows) / n,
+        "danger_match": sum(r["same_danger"] for r in rows) / n,
+        "hazard_match": sum(r["same_hazard"] for r in rows) / n,
+        "rows": rows,
+    }
+
+
+@torch.no_grad()
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prefill time: full prompt vs cached prefix")
+    parser.add_argument("image", nargs="?", help="JPEG to use (default: synthetic frame)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--agreement-frames", type=int, default=24,
+                        help="Demo frames to caption with both prompt layouts (0 = skip)")
+    args = parser.parse_args()
+
+    vlm_service.load_model()
+    model, processor = vlm_service.model, vlm_service.processor
+    if vlm_service.prefix_cache is None and vlm_service.PROMPT_CACHE_ERROR is None:
+        vlm_service._build_prompt_cache()  # vlm_prompt_cache is off by default
+    if vlm_service.prefix_cache is None:
+        raise SystemExit(f"Prompt cache not available: {vlm_service.PROMPT_CACHE_ERROR}")
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = _synthetic_frame()
+    batch = [[vlm_service._load_image(image_bytes)]]
+    cache = vlm_service.prefix_cache
+
+    def full_prompt():
+        inputs = processor(
+            text=[PROMPT], images=batch, return_tensors="pt", **vlm_service.image_kwargs()
+        ).to(vlm_service.DEVICE)
+        model(**inputs, use_cache=True)
+        return inputs["input_ids"].shape[1]
+
+    def cached_prefix():
+        _, _, mask = cache.prefill(batch)
+        return mask.shape[1] - cache.prefix_len
+
+    results = {}
+    for name, fn in (("before (full)", full_prompt), ("after (cached)", cached_prefix)):
+        for _ in range(args.warmup):
+            fn()
+        samples = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            tokens = fn()
+            samples.append((time.perf_counter() - t0) * 1000.0)
+        results[name] = (samples, tokens)
+
+    print(f"device={vlm_service.DEVICE}  threads={torch.get_num_threads()}  "
+          f"cached prefix tokens={cache.prefix_len}")
+    for name, (samples, tokens) in results.items():
+        _summary(name, samples, tokens)
+
+    before = statistics.median(results["before (full)"][0])
+    after = statistics.median(results["after (cached)"][0])
+    print(f"prefill saved per frame: {before - after:.1f} ms ({100.0 * (before - after) / before:.0f}%)")
+
+    if args.agreement_frames > 0:
+        frames = _demo_frames(args.agreement_frames) or [image_bytes]
+        agree = agreement(frames)
+        print(f"\nagreement over {agree['frames']} frames (original vs reordered prompt): "
+              f"caption {100.0 * agree['caption_match']:.0f}%, "
+              f"danger flag {100.0 * agree['danger_match']:.0f}%, "
+              f"hazard category {100.0 * agree['hazard_match']:.0f}%")
+        for row in agree["rows"]:
+            if not row["same_hazard"]:
+                print(f"  hazard differs: {row['original']!r} -> {row['reordered']!r}")
+
+
+if __name__ == "__main__":
+    main()
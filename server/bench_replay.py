@@ -0,0 +1,287 @@
+# Guided_Vision/server/bench_replay.py
+#
+# Offline replay benchmark: decode the demo clips, push the sampled frames
+# through generate_caption + is_dangerous + extract_direction in-process, and
+# report throughput, latency percentiles, peak RSS and per-clip detection rate
+# against demo/hardware_demo/labels.yaml.
+#
+#   cd server
+#   python bench_replay.py                               # real model, 1 frame/s
+#   python bench_replay.py --fps 2 --out replay.json
+#   python bench_replay.py --stub --out ci.json          # no weights, plumbing check for CI
+#   python bench_replay.py --baseline old.json           # print deltas vs an earlier run
+#
+# Needs OpenCV for video decoding: pip install opencv-python-headless
+
+import argparse
+import io
+import json
+import platform
+import time
+from pathlib import Path
+
+import yaml
+from PIL import Image
+
+import vlm_service
+from hazards import classify_hazard, extract_direction
+from vlm_service import is_dangerous
+
+DEMO_DIR = Path(__file__).resolve().parent.parent / "demo" / "hardware_demo"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    except Exception:
+        return None
+
+
+def _percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def sample_clip(path: Path, fps: float, width: int, quality: int) -> list:
+    """JPEG bytes for frames taken every 1/fps seconds, resized like a client would send."""
+    try:
+        import cv2
+    except ImportError:
+        raise SystemExit("bench_replay needs OpenCV: pip install opencv-python-headless")
+
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open {path}")
+    clip_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, int(round(clip_fps / fps)))
+
+    frames = []
+    index = 0
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if index % step == 0:
+                h, w = frame.shape[:2]
+                size = (width, int(round(h * width / w)))
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                if ok:
+                    frames.append(buf.tobytes())
+            index += 1
+    finally:
+        cap.release()
+    return frames
+
+
+# Hand-written captions in the VLM's register for the demo clips. They are not
+# derived from labels.yaml, so a stub run only shows the plumbing works: the
+# lexicon still has to match "staircase" or "corner of the table" as phrased.
+STUB_CAPTIONS = {
+    "cable.mp4": "A loose cable lies across the floor in front of you",
+    "knife.mp4": "A knife is lying on the kitchen counter to your left",
+    "stairs.mp4": "A staircase going down is directly ahead of you",
+    "table.mp4": "The corner of the table is close on your right",
+}
+STUB_DEFAULT_CAPTION = "An empty hallway in front of you"
+
+
+class StubCaptioner:
+    """
+    Stand-in for the VLM when the weights are not available (CI).
+    Decodes the JPEG like the real path, optionally sleeps, and returns the
+    fixed STUB_CAPTIONS entry for the clip. Stub mode only checks the plumbing
+    (decode, classification, report); its detection rates say nothing about
+    detection quality.
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_sec = latency_ms / 1000.0
+        self.caption = STUB_DEFAULT_CAPTION
+
+    def set_clip(self, name: str) -> None:
+        self.caption = STUB_CAPTIONS.get(name, STUB_DEFAULT_CAPTION)
+
+    def __call__(self, image_bytes: bytes) -> str:
+        Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        return self.caption
+
+
+def run_clip(name: str, frames: list, expected: list, caption_fn) -> dict:
+    latencies = []
+    danger = 0
+    correct = 0
+    keywords = {}
+    directions = {}
+    for image_bytes in frames:
+        t0 = time.perf_counter()
+        caption = caption_fn(image_bytes)
+        flagged = is_dangerous(caption)
+        direction = extract_direction(caption) if flagged else None
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+        if flagged:
+            danger += 1
+            hazard = classify_hazard(caption)
+            keywords[hazard.keyword] = keywords.get(hazard.keyword, 0) + 1
+            directions[direction] = directions.get(direction, 0) + 1
+            if hazard.category in expected:
+                correct += 1
+
+    n = len(frames)
+    if expected:
+        detection_rate = correct / n if n else None
+    else:
+        # A safe clip "detects" correctly when nothing is flagged
+        detection_rate = (n - danger) / n if n else None
+    return {
+        "clip": name,
+        "expected": expected,
+        "frames": n,
+        "danger_frames": danger,
+        "correct_frames": correct if expected else n - danger,
+        "detection_rate": detection_rate,
+        "keywords": keywords,
+        "directions": directions,
+        "latency_ms": latencies,
+    }
+
+
+def summarize(latencies: list, wall_sec: float) -> dict:
+    return {
+        "frames": len(latencies),
+        "throughput_fps": len(latencies) / wall_sec if wall_sec > 0 else None,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else None,
+    }
+
+
+def print_baseline_delta(result: dict, baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+
+    def row(label, new, old, fmt="{:.1f}"):
+        if new is None or old is None:
+            return
+        change = f" ({100.0 * (new - old) / old:+.0f}%)" if old else ""
+        print(f"  {label:<26} {fmt.format(old):>10} -> {fmt.format(new):>10}{change}")
+
+    print(f"\nvs baseline {baseline_path}:")
+    for key in ("throughput_fps", "p50_ms", "p95_ms", "p99_ms"):
+        row(key, result["overall"][key], base["overall"].get(key))
+    row("peak_rss_mb", result["peak_rss_mb"], base.get("peak_rss_mb"), "{:.0f}")
+    base_clips = {c["clip"]: c for c in base.get("clips", [])}
+    for clip in result["clips"]:
+        old = base_clips.get(clip["clip"])
+        if old:
+            row(f"{clip['clip']} detection", clip["detection_rate"], old.get("detection_rate"), "{:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay the demo clips through the caption + hazard pipeline")
+    parser.add_argument("--clips", nargs="*", help="Videos to replay (default: demo/hardware_demo/*.mp4)")
+    parser.add_argument("--labels", default=str(DEMO_DIR / "labels.yaml"))
+    parser.add_argument("--fps", type=float, default=1.0, help="Frames sampled per second of video")
+    parser.add_argument("--width", type=int, default=480, help="Resize frames to this width (like the clients)")
+    parser.add_argument("--quality", type=int, default=70, help="JPEG quality of the sampled frames")
+    parser.add_argument("--stub", action="store_true", help="Use a stub captioner instead of loading the VLM")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+    parser.add_argument("--out", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier --out JSON to compare against")
+    args = parser.parse_args()
+
+    clips = [Path(c) for c in args.clips] if args.clips else sorted(DEMO_DIR.glob("*.mp4"))
+    labels = {}
+    if Path(args.labels).exists():
+        with open(args.labels, "r", encoding="utf-8") as f:
+            labels = yaml.safe_load(f) or {}
+
+    rss_start = peak_rss_mb()
+    if args.stub:
+        caption_fn = StubCaptioner(args.stub_latency_ms)
+        model = "stub"
+    else:
+        timings = vlm_service.load_model()
+        print("model loaded: " + ", ".join(f"{k}={v:.0f}ms" for k, v in timings.items()))
+        caption_fn = vlm_service.generate_caption
+        model = vlm_service.MODEL_NAME
+
+    results = []
+    all_latencies = []
+    wall = 0.0
+    for path in clips:
+        expected = list(labels.get(path.name) or [])
+        frames = sample_clip(path, args.fps, args.width, args.quality)
+        if args.stub:
+            caption_fn.set_clip(path.name)
+
+        t0 = time.perf_counter()
+        clip = run_clip(path.name, frames, expected, caption_fn)
+        clip_wall = time.perf_counter() - t0
+        wall += clip_wall
+        all_latencies.extend(clip["latency_ms"])
+
+        clip.update(summarize(clip["latency_ms"], clip_wall))
+        clip["latency_ms"] = [round(ms, 2) for ms in clip["latency_ms"]]
+        results.append(clip)
+
+        rate = clip["detection_rate"]
+        print(
+            f"{path.name:<14} frames={clip['frames']:3d}  danger={clip['danger_frames']:3d}  "
+            f"expected={','.join(expected) or 'safe':<16} "
+            f"detection={'n/a' if rate is None else f'{rate:.2f}'}  "
+            f"p50={clip['p50_ms'] or 0:7.1f} ms  keywords={clip['keywords']}"
+        )
+
+    overall = summarize(all_latencies, wall)
+    rated = [c["detection_rate"] for c in results if c["detection_rate"] is not None]
+    overall["mean_detection_rate"] = sum(rated) / len(rated) if rated else None
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "model": model,
+        "device": vlm_service.DEVICE,
+        "precision": vlm_service.PRECISION,
+        "max_new_tokens": vlm_service.MAX_NEW_TOKENS,
+        "platform": platform.platform(),
+        "sample_fps": args.fps,
+        "width": args.width,
+        "overall": overall,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_before_load_mb": rss_start,
+        "clips": results,
+    }
+
+    print(
+        f"\noverall: {overall['frames']} frames, {overall['throughput_fps'] or 0:.2f} frames/s, "
+        f"p50={overall['p50_ms'] or 0:.1f} ms  p95={overall['p95_ms'] or 0:.1f} ms  "
+        f"p99={overall['p99_ms'] or 0:.1f} ms, peak RSS {result['peak_rss_mb'] or 0:.0f} MB, "
+        f"mean detection {overall['mean_detection_rate'] or 0:.2f}"
+    )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"wrote {args.out}")
+    if args.baseline:
+        print_baseline_delta(result, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# Guided_Vision/server/bench_sectors.py
+#
+# Single-image captioning vs tri-sector captioning (left / center / right crops
+# in one batched generate call) on the demo clips:
+#   - latency of each path, and of ONE crop alone, so the cost of the 3-crop
+#     batch over a single crop is visible
+#   - hazard detection rate against demo/hardware_demo/labels.yaml
+#   - direction: distribution per path, agreement between the paths, and
+#     accuracy when --directions gives the expected direction per clip
+#
+#   cd server
+#   python bench_sectors.py
+#   python bench_sectors.py --fps 2 --directions directions.yaml --out sectors.json
+#
+# directions.yaml maps clip file name -> left | front | right.
+# Needs OpenCV for video decoding: pip install opencv-python-headless
+
+import argparse
+import io
+import json
+import statistics
+import time
+from pathlib import Path
+
+import yaml
+from PIL import Image
+
+import vlm_service
+from bench_replay import DEMO_DIR, _percentile, sample_clip
+from hazards import classify_hazard, extract_direction, locate_hazard
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - t0) * 1000.0
+
+
+def single_crop(image_bytes: bytes) -> str:
+    """The center crop alone (batch of one), the unit cost of the sector path."""
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    crop = vlm_service.crop_sectors(image)[1]
+    if vlm_service.FAST_PREPROCESS:
+        crop = crop.resize((vlm_service.FAST_IMAGE_SIZE, vlm_service.FAST_IMAGE_SIZE), Image.BILINEAR)
+    return vlm_service._generate_texts([[crop]])[0]
+
+
+def run_clip(name: str, frames: list, expected: list, expected_direction: str) -> dict:
+    rows = []
+    for image_bytes in frames:
+        caption, single_ms = _timed(vlm_service.generate_caption, image_bytes)
+        captions, sectors_ms = _timed(vlm_service.caption_sectors, image_bytes)
+        _, crop_ms = _timed(single_crop, image_bytes)
+
+        hazard = classify_hazard(caption)
+        sector, sector_hazard = locate_hazard(captions)
+        rows.append({
+            "single_ms": single_ms,
+            "sectors_ms": sectors_ms,
+            "crop_ms": crop_ms,
+            "single": {
+                "hazard": hazard.category if hazard else None,
+                "direction": extract_direction(caption) if hazard else None,
+            },
+            "sectors": {
+                "hazard": sector_hazard.category if sector_hazard else None,
+                "direction": sector,
+            },
+            "caption": caption,
+            "sector_captions": captions,
+        })
+
+    def mode_stats(mode: str) -> dict:
+        flagged = [r[mode] for r in rows if r[mode]["hazard"] is not None]
+        if expected:
+            correct = sum(1 for f in flagged if f["hazard"] in expected)
+        else:
+            correct = len(rows) - len(flagged)
+        directions = {}
+        for f in flagged:
+            directions[f["direction"]] = directions.get(f["direction"], 0) + 1
+        stats = {
+            "detection_rate": correct / len(rows) if rows else None,
+            "directions": directions,
+            "direction_accuracy": None,
+        }
+        if expected_direction and flagged:
+            hits = sum(1 for f in flagged if f["direction"] == expected_direction)
+            stats["direction_accuracy"] = hits / len(flagged)
+        return stats
+
+    both = [r for r in rows if r["single"]["hazard"] and r["sectors"]["hazard"]]
+    return {
+        "clip": name,
+        "expected": expected,
+        "expected_direction": expected_direction,
+        "frames": len(rows),
+        "single": mode_stats("single"),
+        "sectors": mode_stats("sectors"),
+        "direction_agreement": (
+            sum(r["single"]["direction"] == r["sectors"]["direction"] for r in both) / len(both)
+            if both else None
+        ),
+        "rows": rows,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Single-image vs tri-sector hazard localisation")
+    parser.add_argument("--clips", nargs="*", help="Videos to sample (default: demo/hardware_demo/*.mp4)")
+    parser.add_argument("--labels", default=str(DEMO_DIR / "labels.yaml"))
+    parser.add_argument("--directions", help="YAML: clip file name -> expected direction")
+    parser.add_argument("--fps", type=float, default=1.0, help="Frames sampled per second of video")
+    parser.add_argument("--width", type=int, default=480, help="Resize frames to this width (like the clients)")
+    parser.add_argument("--out", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    def load_yaml(path):
+        if path and Path(path).exists():
+            with open(path, "r", encoding="utf-8") as f:
+                return yaml.safe_load(f) or {}
+        return {}
+
+    labels = load_yaml(args.labels)
+    directions = load_yaml(args.directions)
+    paths = [Path(c) for c in args.clips] if args.clips else sorted(DEMO_DIR.glob("*.mp4"))
+
+    vlm_service.load_model()
+    results = []
+    for path in paths:
+        frames = sample_clip(path, args.fps, args.width, 70)
+        clip = run_clip(path.name, frames, list(labels.get(path.name) or []), directions.get(path.name))
+        results.append(clip)
+
+        def rate(v):
+            return "n/a" if v is None else f"{v:.2f}"
+
+        print(f"{path.name:<14} frames={clip['frames']:3d}  "
+              f"detection single={rate(clip['single']['detection_rate'])} "
+              f"sectors={rate(clip['sectors']['detection_rate'])}  "
+              f"directions single={clip['single']['directions']} sectors={clip['sectors']['directions']}  "
+              f"agreement={rate(clip['direction_agreement'])}")
+
+    rows = [r for clip in results for r in clip["rows"]]
+    summary = {}
+    for key in ("single_ms", "crop_ms", "sectors_ms"):
+        values = [r[key] for r in rows]
+        summary[key] = {"p50": _percentile(values, 50), "p95": _percentile(values, 95),
+                        "mean": statistics.mean(values) if values else None}
+    crop_p50 = summary["crop_ms"]["p50"]
+    summary["batch_cost_over_single_crop"] = summary["sectors_ms"]["p50"] / crop_p50 if crop_p50 else None
+    summary["sectors_over_single_image"] = (
+        summary["sectors_ms"]["p50"] / summary["single_ms"]["p50"] if summary["single_ms"]["p50"] else None
+    )
+    for mode in ("single", "sectors"):
+        rated = [c[mode]["detection_rate"] for c in results if c[mode]["detection_rate"] is not None]
+        accurate = [c[mode]["direction_accuracy"] for c in results if c[mode]["direction_accuracy"] is not None]
+        summary[f"{mode}_mean_detection_rate"] = statistics.mean(rated) if rated else None
+        summary[f"{mode}_mean_direction_accuracy"] = statistics.mean(accurate) if accurate else None
+
+    print(f"\nlatency p50: single image {summary['single_ms']['p50'] or 0:.0f} ms, "
+          f"one crop {crop_p50 or 0:.0f} ms, 3-crop batch {summary['sectors_ms']['p50'] or 0:.0f} ms "
+          f"({summary['batch_cost_over_single_crop'] or 0:.2f}x one crop, "
+          f"{summary['sectors_over_single_image'] or 0:.2f}x the single-image path)")
+    for mode in ("single", "sectors"):
+        acc = summary[f"{mode}_mean_direction_accuracy"]
+        print(f"{mode:<8} mean detection {summary[f'{mode}_mean_detection_rate'] or 0:.2f}, "
+              f"direction accuracy {'n/a (no --directions)' if acc is None else f'{acc:.2f}'}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "clips": results}, f, indent=2)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Guided_Vision/server/bench_workers.py
+#
+# Throughput-per-core scaling of multi-process serving (worker_pool.py)
+# against the current single-process setup, plus the memory it costs.
+#
+# For every configuration, `concurrency` client threads caption frames back to
+# back for --seconds. "single" is today's server: one process, generate() on
+# inference_workers threads, torch using every CPU. "pool xN" is N worker
+# processes sharing the weights, each pinned to CPUs / N cores.
+# Memory is reported as total PSS (shared weight pages counted once) and as the
+# plain sum of RSS (which counts them once per process).
+#
+#   cd server
+#   python bench_workers.py                          # single + pools of 1, 2, 4, ... processes
+#   python bench_workers.py --processes 1 2 3 --seconds 60 --out workers.json
+#   python bench_workers.py --batch 2                # frames per generate() call
+
+import argparse
+import json
+import threading
+import time
+
+import torch
+
+import vlm_service
+from backends import get_backend
+from bench_replay import DEMO_DIR, sample_clip
+from worker_pool import InferencePool, available_cpus, memory_mb
+
+
+def _frames(limit: int) -> list:
+    clips = sorted(DEMO_DIR.glob("*.mp4"))
+    frames = []
+    for path in clips:
+        try:
+            frames.extend(sample_clip(path, 0.5, 480, 70))
+        except SystemExit:
+            break
+        if len(frames) >= limit:
+            break
+    return frames[:limit] or [vlm_service._warmup_frame()]
+
+
+def drive(caption_fn, frames: list, concurrency: int, batch: int, seconds: float) -> dict:
+    """Run `concurrency` threads calling caption_fn for `seconds`; frames/s and per-call latency."""
+    stop = time.monotonic() + seconds
+    done = []
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset: int) -> None:
+        i = offset
+        while time.monotonic() < stop:
+            images = [frames[(i + k) % len(frames)] for k in range(batch)]
+            t0 = time.perf_counter()
+            caption_fn(images)
+            with lock:
+                done.append(len(images))
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+            i += batch
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n * 7,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "frames": sum(done),
+        "frames_per_sec": sum(done) / wall,
+        "p50_ms": latencies[len(latencies) // 2] if latencies else None,
+    }
+
+
+def main() -> None:
+    cpus = available_cpus()
+    default_counts = sorted({n for n in (1, 2, 4, 8, 16) if n <= len(cpus)} | {len(cpus) // 2 or 1})
+    parser = argparse.ArgumentParser(description="Single-process vs shared-weight worker processes")
+    parser.add_argument("--processes", type=int, nargs="*", default=default_counts)
+    parser.add_argument("--seconds", type=float, default=30.0, help="Measurement time per configuration")
+    parser.add_argument("--batch", type=int, default=1, help="Frames per caption call")
+    parser.add_argument("--frames", type=int, default=32, help="Distinct demo frames to cycle through")
+    parser.add_argument("--out", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Load in this process like the server does, but without the backend yet: like
+    # load_model() with inference_processes, the pools get the plain weights and
+    # each worker prepares its own backend (a prepared model, e.g. one holding an
+    # ONNX Runtime session, cannot be sent to another process)
+    backend = vlm_service.BACKEND
+    vlm_service.INFERENCE_PROCESSES = 0
+    vlm_service.BACKEND = "eager"
+    vlm_service.load_model()
+    frames = _frames(args.frames)
+    print(f"{vlm_service.MODEL_INFO['model']} ({vlm_service.PRECISION}, {backend}), {len(cpus)} CPUs, "
+          f"batch {args.batch}, {args.seconds:.0f}s per configuration")
+
+    rows = []
+    for n in args.processes:
+        pool = InferencePool(n)
+        pool.start(vlm_service.model, vlm_service.processor)
+        try:
+            run = drive(pool.caption_frames, frames, n, args.batch, args.seconds)
+            stats = pool.stats()
+        finally:
+            pool.close()
+        rss = [w["rss_mb"] for w in stats["workers"]] + [stats["server"]["rss_mb"]]
+        rows.append({
+            "mode": f"pool x{n}", "processes": n, "threads": stats["threads_per_process"],
+            "cores": min(len(cpus), n * stats["threads_per_process"]), **run,
+            "total_pss_mb": stats["total_pss_mb"],
+            "sum_rss_mb": sum(rss) if None not in rss else None,
+        })
+
+    # Single process last: preparing the backend changes the model in place
+    source = vlm_service.MODEL_PATH or vlm_service.MODEL_NAME
+    vlm_service.model = get_backend(backend).prepare(vlm_service.model, source)
+    if vlm_service.WARMUP:
+        vlm_service.generate_captions([vlm_service._warmup_frame()])
+    workers = max(1, vlm_service.INFERENCE_WORKERS)
+    run = drive(vlm_service.caption_frames, frames, workers, args.batch, args.seconds)
+    mem = memory_mb()
+    rows.insert(0, {"mode": "single", "processes": 1, "threads": torch.get_num_threads(),
+                    "cores": len(cpus), **run, "total_pss_mb": mem["pss_mb"], "sum_rss_mb": mem["rss_mb"]})
+
+    base = rows[0]["frames_per_sec"]
+    print(f"\n{'mode':<10}{'procs':>6}{'thr':>5}{'cores':>6}{'frames/s':>10}{'per core':>10}"
+          f"{'speedup':>9}{'p50 ms':>9}{'PSS MB':>9}{'sumRSS MB':>11}")
+    for r in rows:
+        r["frames_per_sec_per_core"] = r["frames_per_sec"] / r["cores"]
+        r["speedup"] = r["frames_per_sec"] / base if base else None
+
+        def fmt(v, spec):
+            return "n/a" if v is None else format(v, spec)
+
+        print(f"{r['mode']:<10}{r['processes']:>6}{r['threads']:>5}{r['cores']:>6}"
+              f"{r['frames_per_sec']:>10.2f}{r['frames_per_sec_per_core']:>10.3f}"
+              f"{fmt(r['speedup'], '.2f'):>9}{fmt(r['p50_ms'], '.0f'):>9}"
+              f"{fmt(r['total_pss_mb'], '.0f'):>9}{fmt(r['sum_rss_mb'], '.0f'):>11}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"model": vlm_service.MODEL_INFO, "cpus": len(cpus), "batch": args.batch,
+                       "seconds": args.seconds, "runs": rows}, f, indent=2)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+# Guided_Vision/server/config.py
+
+import os
+from pathlib import Path
+
+import yaml
+
+# The shared config.yaml lives in the repo root, one level above server/.
+# Inside Docker only server/ is copied, so GUIDEDVISION_CONFIG can point elsewhere.
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.yaml"
+
+
+def load_config() -> dict:
+    """Load the server settings. A missing file just means 'use the defaults'."""
+    cfg_path = Path(os.environ.get("GUIDEDVISION_CONFIG", DEFAULT_CONFIG_PATH))
+    if not cfg_path.exists():
+        return {}
+    with cfg_path.open("r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+CONFIG = load_config()
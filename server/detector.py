@@ -0,0 +1,215 @@
+# Guided_Vision/server/detector.py
+#
+# Optional YOLOv8 detector cascade in front of the VLM.
+#
+# The 4-class model from yolo_version_first_trials/ (cable, fire, knife, tool),
+# exported for CPU with ultralytics:
+#   YOLO("best.pt").export(format="onnx", imgsz=640)         # -> best.onnx
+#   YOLO("best.pt").export(format="torchscript", imgsz=640)  # -> best.torchscript
+#
+# Every frame goes through the detector first. A confident detection is a danger
+# verdict on its own; a confident "nothing" is a safe verdict; anything in
+# between goes to the VLM. Each device still gets a VLM caption every
+# vlm_refresh_sec so the descriptive sentence (and hazards the detector has no
+# class for, like stairs) keeps coming.
+
+import io
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from config import CONFIG
+from hazards import LEXICON, format_warning
+
+HERE = Path(__file__).resolve().parent
+
+CASCADE_ENABLED = bool(CONFIG.get("cascade_enabled", False))
+# Relative to server/ (like hazard_taxonomy), whatever directory the server is started from
+_MODEL_PATH = str(CONFIG.get("detector_model_path", "") or "")
+DETECTOR_MODEL_PATH = HERE / _MODEL_PATH if _MODEL_PATH else None
+DETECTOR_CLASSES = list(CONFIG.get("detector_classes", ["cable", "fire", "knife", "tool"]))
+DETECTOR_IMGSZ = int(CONFIG.get("detector_imgsz", 640))
+DETECTOR_CONFIDENT = float(CONFIG.get("detector_confident", 0.6))
+DETECTOR_UNSURE = float(CONFIG.get("detector_unsure", 0.25))
+VLM_REFRESH_SEC = float(CONFIG.get("vlm_refresh_sec", 10.0))
+
+
+@dataclass
+class Detection:
+    label: str
+    confidence: float
+    box: tuple          # (x1, y1, x2, y2) in original image pixels
+    direction: str      # "left" | "front" | "right" from the box centre
+
+
+def _direction(center_x: float, width: float) -> str:
+    if center_x < width / 3.0:
+        return "left"
+    if center_x > 2.0 * width / 3.0:
+        return "right"
+    return "front"
+
+
+class YoloDetector:
+    """YOLOv8 exported to ONNX (onnxruntime) or TorchScript, run on CPU."""
+
+    def __init__(self, path: str, classes: list = DETECTOR_CLASSES, imgsz: int = DETECTOR_IMGSZ):
+        self.path = Path(path)
+        self.classes = list(classes)
+        self.imgsz = int(imgsz)
+
+        if self.path.suffix == ".onnx":
+            import onnxruntime as ort  # only needed for the ONNX export
+            self._session = ort.InferenceSession(str(self.path), providers=["CPUExecutionProvider"])
+            self._input = self._session.get_inputs()[0].name
+            self.backend = "onnxruntime"
+        else:
+            import torch
+            self._module = torch.jit.load(str(self.path), map_location="cpu").eval()
+            self.backend = "torchscript"
+
+    def _letterbox(self, image_bytes: bytes):
+        image = Image.open(io.BytesIO(image_bytes))
+        # Decode at reduced scale when the JPEG is much larger than the network input
+        image.draft("RGB", (self.imgsz, self.imgsz))
+        image = image.convert("RGB")
+        w, h = image.size
+        scale = self.imgsz / max(w, h)
+        nw, nh = max(1, round(w * scale)), max(1, round(h * scale))
+        canvas = Image.new("RGB", (self.imgsz, self.imgsz), (114, 114, 114))
+        pad_x, pad_y = (self.imgsz - nw) // 2, (self.imgsz - nh) // 2
+        canvas.paste(image.resize((nw, nh), Image.BILINEAR), (pad_x, pad_y))
+
+        x = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1)[None] / 255.0
+        return np.ascontiguousarray(x), scale, pad_x, pad_y, w, h
+
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        if self.backend == "onnxruntime":
+            return self._session.run(None, {self._input: x})[0]
+        import torch
+        with torch.no_grad():
+            out = self._module(torch.from_numpy(x))
+        if isinstance(out, (tuple, list)):
+            out = out[0]
+        return out.numpy()
+
+    def detect(self, image_bytes: bytes, min_confidence: float = DETECTOR_UNSURE) -> list:
+        """Best box per class at or above min_confidence, most confident first."""
+        x, scale, pad_x, pad_y, w, h = self._letterbox(image_bytes)
+        # YOLOv8 head: (1, 4 + classes, anchors) with boxes as cx, cy, w, h
+        pred = self._forward(x)[0].T
+        scores = pred[:, 4:4 + len(self.classes)]
+
+        detections = []
+        for cls, label in enumerate(self.classes):
+            i = int(scores[:, cls].argmax())
+            conf = float(scores[i, cls])
+            if conf < min_confidence:
+                continue
+            cx, cy, bw, bh = pred[i, :4]
+            cx = (cx - pad_x) / scale
+            cy = (cy - pad_y) / scale
+            bw, bh = bw / scale, bh / scale
+            box = (float(cx - bw / 2), float(cy - bh / 2), float(cx + bw / 2), float(cy + bh / 2))
+            detections.append(Detection(label, conf, box, _direction(cx, w)))
+        detections.sort(key=lambda d: d.confidence, reverse=True)
+        return detections
+
+
+class CascadePolicy:
+    """
+    Decides per frame whether the detector's answer is enough.
+
+    decide() returns (run_vlm, verdict_stage, top_detection):
+      top >= confident            -> danger from the detector
+      unsure <= top < confident   -> VLM decides
+      top < unsure (or nothing)   -> safe from the detector
+    The VLM also runs when the device has had no caption for refresh_sec; for
+    a "nothing" frame its caption then decides (it may see stairs, holes, ...).
+    """
+
+    def __init__(self, confident: float = DETECTOR_CONFIDENT, unsure: float = DETECTOR_UNSURE,
+                 refresh_sec: float = VLM_REFRESH_SEC):
+        self.confident = float(confident)
+        self.unsure = float(unsure)
+        self.refresh_sec = float(refresh_sec)
+        self._last_vlm = {}  # device -> monotonic time of its last VLM caption
+        self._lock = threading.Lock()
+
+        self.frames = 0
+        self.vlm_skipped = 0
+        self.by_stage = {"detector": 0, "vlm": 0}
+
+    def decide(self, device: str, detections: list):
+        top = detections[0] if detections else None
+        now = time.monotonic()
+        with self._lock:
+            self.frames += 1
+            refresh_due = now - self._last_vlm.get(device, float("-inf")) >= self.refresh_sec
+
+            if top is not None and top.confidence >= self.confident:
+                stage, run_vlm = "detector", refresh_due
+            elif top is not None and top.confidence >= self.unsure:
+                stage, run_vlm = "vlm", True
+            else:
+                run_vlm = refresh_due
+                stage = "vlm" if run_vlm else "detector"
+
+            self.by_stage[stage] += 1
+            if run_vlm:
+                self._last_vlm[device] = now
+            else:
+                self.vlm_skipped += 1
+        return run_vlm, stage, top
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "vlm_skipped": self.vlm_skipped,
+                "vlm_skip_fraction": (self.vlm_skipped / self.frames) if self.frames else None,
+                "verdict_stage": dict(self.by_stage),
+                "confident": self.confident,
+                "unsure": self.unsure,
+                "vlm_refresh_sec": self.refresh_sec,
+            }
+
+
+def detection_analysis(top, last_caption: str = None) -> dict:
+    """Result fields for a frame decided by the detector alone."""
+    if top is None or top.confidence < DETECTOR_CONFIDENT:
+        return {
+            "is_danger": False,
+            "message": last_caption,
+            "raw_caption": last_caption,
+            "warning": None,
+            "hazard_category": None,
+            "severity": 0,
+        }
+    # Detector classes that are also hazards.yaml keywords take its category/severity
+    category, severity = LEXICON.taxonomy.get(top.label, (top.label, 1))
+    return {
+        "is_danger": True,
+        "message": last_caption,
+        "raw_caption": last_caption,
+        "warning": format_warning(top.label, top.direction),
+        "hazard_category": category,
+        "severity": severity,
+    }
+
+
+def load_detector():
+    """The configured detector, or None when the cascade is off or has no model."""
+    if not CASCADE_ENABLED:
+        return None
+    if DETECTOR_MODEL_PATH is None or not DETECTOR_MODEL_PATH.exists():
+        print(f"[SERVER] Cascade disabled: detector model not found ({str(DETECTOR_MODEL_PATH or '')!r})")
+        return None
+    detector = YoloDetector(DETECTOR_MODEL_PATH)
+    print(f"[SERVER] Detector cascade: {detector.path.name} via {detector.backend}, "
+          f"classes={detector.classes}")
+    return detector
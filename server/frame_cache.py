@@ -0,0 +1,128 @@
+# Guided_Vision/server/frame_cache.py
+#
+# Near-duplicate frame cache: if a device sends (almost) the same picture again,
+# reuse the previous caption instead of running the VLM.
+
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from config import CONFIG
+
+HASH_SIZE = 8  # 8x8 gradient bits -> 64-bit dHash
+
+FRAME_CACHE_ENABLED = bool(CONFIG.get("frame_cache_enabled", True))
+FRAME_CACHE_MAX_DISTANCE = int(CONFIG.get("frame_cache_max_distance", 4))
+FRAME_CACHE_TTL_SEC = float(CONFIG.get("frame_cache_ttl_sec", 10.0))
+FRAME_CACHE_SIZE = int(CONFIG.get("frame_cache_size", 8))
+
+
+def dhash(image_bytes: bytes, hash_size: int = HASH_SIZE) -> int:
+    """
+    Difference hash of a JPEG: shrink to (hash_size+1) x hash_size grayscale and
+    keep one bit per horizontal gradient sign.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    # JPEG draft mode decodes straight at 1/2..1/8 scale, far cheaper than a full decode
+    image.draft("L", ((hash_size + 1) * 8, hash_size * 8))
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class CacheEntry:
+    __slots__ = ("frame_hash", "result", "cost_ms", "created")
+
+    def __init__(self, frame_hash: int, result: dict, cost_ms: float):
+        self.frame_hash = frame_hash
+        self.result = result
+        self.cost_ms = cost_ms
+        self.created = time.monotonic()
+
+
+class FrameCache:
+    """
+    Per-device LRU of recent frame hashes and their analysis results.
+
+    A lookup hits when a stored hash is within max_distance bits of the new one
+    and younger than ttl_sec. Each device keeps at most max_entries hashes.
+    """
+
+    def __init__(self, max_distance: int = FRAME_CACHE_MAX_DISTANCE,
+                 ttl_sec: float = FRAME_CACHE_TTL_SEC,
+                 max_entries: int = FRAME_CACHE_SIZE):
+        self.max_distance = int(max_distance)
+        self.ttl_sec = float(ttl_sec)
+        self.max_entries = max(1, int(max_entries))
+
+        self._devices = {}  # device_id -> OrderedDict[frame_hash, CacheEntry]
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.time_saved_ms = 0.0
+        self.distance_histogram = [0] * (HASH_SIZE * HASH_SIZE + 1)
+
+    def lookup(self, device_id: str, frame_hash: int):
+        """Return the cached result dict for a near-duplicate frame, or None."""
+        now = time.monotonic()
+        with self._lock:
+            self.lookups += 1
+            entries = self._devices.get(device_id)
+            if not entries:
+                return None
+
+            for key in [k for k, e in entries.items() if now - e.created > self.ttl_sec]:
+                del entries[key]
+
+            best, best_dist = None, None
+            for entry in entries.values():
+                dist = hamming(entry.frame_hash, frame_hash)
+                if best_dist is None or dist < best_dist:
+                    best, best_dist = entry, dist
+            if best is None:
+                return None
+
+            # Nearest distance per lookup, hit or miss, to help pick the threshold
+            self.distance_histogram[best_dist] += 1
+            if best_dist > self.max_distance:
+                return None
+
+            entries.move_to_end(best.frame_hash)
+            self.hits += 1
+            self.time_saved_ms += best.cost_ms
+            return best.result
+
+    def store(self, device_id: str, frame_hash: int, result: dict, cost_ms: float) -> None:
+        with self._lock:
+            entries = self._devices.setdefault(device_id, OrderedDict())
+            entries[frame_hash] = CacheEntry(frame_hash, result, cost_ms)
+            entries.move_to_end(frame_hash)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_distance": self.max_distance,
+                "ttl_sec": self.ttl_sec,
+                "max_entries_per_device": self.max_entries,
+                "devices": len(self._devices),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": (self.hits / self.lookups) if self.lookups else None,
+                "time_saved_ms": self.time_saved_ms,
+                "nearest_distance_histogram": {
+                    d: n for d, n in enumerate(self.distance_histogram) if n
+                },
+            }
@@ -0,0 +1,41 @@
+# Guided_Vision/server/frame_protocol.py
+#
+# Binary frame message used on the /ws WebSocket:
+#
+#   [uint16 big-endian N][N bytes UTF-8 JSON header][JPEG bytes]
+#
+# The header carries {"device_id": str, "ts": capture time (unix seconds), "seq": int}
+# and optionally "sectors": true for tri-sector direction analysis (see main.analyze_sectors).
+# client_pi/transport.py and frontend/index.html build the same layout.
+
+import json
+import struct
+
+_LEN = struct.Struct(">H")
+MAX_HEADER_BYTES = 4096
+
+
+def encode_frame_message(header: dict, jpeg_bytes: bytes) -> bytes:
+    raw = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    if len(raw) > MAX_HEADER_BYTES:
+        raise ValueError("frame header too large")
+    return _LEN.pack(len(raw)) + raw + jpeg_bytes
+
+
+def decode_frame_message(data: bytes) -> tuple:
+    """Split a binary frame message into (header dict, JPEG bytes)."""
+    if len(data) < _LEN.size:
+        raise ValueError("message too short")
+    (n,) = _LEN.unpack_from(data)
+    if n > MAX_HEADER_BYTES or _LEN.size + n > len(data):
+        raise ValueError("bad header length")
+    try:
+        header = json.loads(data[_LEN.size:_LEN.size + n].decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"bad header: {e}")
+    if not isinstance(header, dict):
+        raise ValueError("header must be a JSON object")
+    jpeg = data[_LEN.size + n:]
+    if not jpeg:
+        raise ValueError("no image data")
+    return header, jpeg
@@ -0,0 +1,183 @@
+# Guided_Vision/server/hazards.py
+#
+# Hazard lexicon: the taxonomy from hazards.yaml compiled into one regex,
+# so a single pass over a caption gives the danger flag, keyword, category and span.
+#
+# This is about correctness, not speed: whole-word matching ("stable" is not
+# "table"), negation ("no knife"), one place for keywords and the most severe
+# hazard winning. It is NOT faster than the old substring scans; in Python a
+# regex walks the caption position by position while `kw in text` is a C
+# search, so bench_hazards.py shows the lexicon at about 1.5x their time
+# (still a few microseconds per caption, next to ~1 s of generate()).
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import yaml
+
+from config import CONFIG
+
+HERE = Path(__file__).resolve().parent
+HAZARD_TAXONOMY_PATH = HERE / str(CONFIG.get("hazard_taxonomy", "hazards.yaml"))
+
+# "no knife", "not a knife", "without any cables", "free of obstacles"
+# (but not across "but": "no fire but smoke" still mentions smoke)
+_NEGATION = re.compile(r"\b(?:no|not|without|free of|never|nothing like)\s+(?:(?!but\b)\w+\s+){0,2}$")
+_NEGATION_WINDOW = 40  # characters before a match that can hold the negation
+
+
+@dataclass
+class HazardMatch:
+    keyword: str    # canonical keyword from the taxonomy ("cable", not "Cables")
+    category: str
+    severity: int
+    span: tuple     # (start, end) of the matched text in the caption
+
+
+def load_taxonomy(path: Path = HAZARD_TAXONOMY_PATH) -> dict:
+    """Return {keyword: (category, severity)} from the YAML taxonomy."""
+    with Path(path).open("r", encoding="utf-8") as f:
+        raw = yaml.safe_load(f) or {}
+
+    taxonomy = {}
+    for category, spec in raw.items():
+        severity = int(spec.get("severity", 1))
+        for kw in spec.get("keywords", []):
+            taxonomy[str(kw).strip().lower()] = (str(category), severity)
+    return taxonomy
+
+
+def _surface_forms(keyword: str) -> list:
+    # Regular plurals on the last word: "cable" -> "cables", "glass" -> "glasses"
+    return [keyword, keyword + "s", keyword + "es"]
+
+
+def _trie_regex(words: list) -> str:
+    """
+    Build a prefix-factored alternation ("c(?:able|hair)..."), so the regex
+    engine checks one branch per character instead of every keyword in turn.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node) -> str:
+        if list(node) == [""]:
+            return ""
+        branches, optional = [], "" in node
+        for ch in sorted(k for k in node if k):
+            piece = r"\s+" if ch == " " else re.escape(ch)
+            branches.append(piece + emit(node[ch]))
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            body = ("(?:" + body + ")?") if len(branches) == 1 else body + "?"
+        return body
+
+    return emit(trie)
+
+
+class HazardLexicon:
+    """
+    All hazard keywords compiled into a single word-bounded, prefix-factored regex.
+
+    Regex quantifiers are greedy, so at a given position the longest keyword wins
+    ("table corner" over "table"). Negated mentions ("no knife") are skipped.
+    """
+
+    def __init__(self, taxonomy: dict):
+        self.taxonomy = dict(taxonomy)
+        self.keywords = sorted(self.taxonomy, key=len, reverse=True)
+
+        # Every spelling the regex can produce -> canonical keyword
+        self._forms = {}
+        for kw in sorted(self.keywords, key=len):
+            for form in _surface_forms(kw):
+                self._forms.setdefault(form, kw)
+        # Case-sensitive on lowercased text is about twice as fast as re.IGNORECASE
+        self._pattern = re.compile(r"\b" + _trie_regex(list(self._forms)) + r"\b")
+
+    @classmethod
+    def from_file(cls, path: Path = HAZARD_TAXONOMY_PATH) -> "HazardLexicon":
+        return cls(load_taxonomy(path))
+
+    def scan(self, text: str) -> list:
+        """Every non-negated hazard mention in text, in order of appearance."""
+        lower = text.lower()
+        matches = []
+        for m in self._pattern.finditer(lower):
+            start = m.start()
+            if _NEGATION.search(lower, max(0, start - _NEGATION_WINDOW), start):
+                continue
+            keyword = self._forms[" ".join(m.group().split())]
+            category, severity = self.taxonomy[keyword]
+            matches.append(HazardMatch(keyword, category, severity, m.span()))
+        return matches
+
+    def classify(self, text: str):
+        """
+        The most severe, then most specific (longest), then earliest hazard
+        in text, or None if the caption is safe.
+        """
+        best = None
+        for match in self.scan(text):
+            if best is None or (match.severity, len(match.keyword)) > (best.severity, len(best.keyword)):
+                best = match
+        return best
+
+
+LEXICON = HazardLexicon.from_file()
+
+
+def classify_hazard(text: str):
+    return LEXICON.classify(text)
+
+
+# --- Direction + spoken warning ---
+
+def extract_direction(text: str) -> str:
+    """
+    Try to guess the direction of the danger from the caption.
+    We keep it simple and only look for basic words.
+    """
+    t = text.lower()
+
+    if "left" in t:
+        return "left"
+    if "right" in t:
+        return "right"
+    if "behind" in t or "back" in t:
+        return "behind you"
+    if "front" in t or "ahead" in t or "in front" in t:
+        return "front"
+
+    # Default if no direction found
+    return "front"
+
+
+# Everything extract_direction() can return; clients pre-render alert audio from these
+DIRECTIONS = ("front", "left", "right", "behind you")
+
+# Tri-sector mode: the crop a hazard was found in is its direction.
+# Ties on severity go to the front sector first.
+SECTOR_PRIORITY = ("front", "left", "right")
+
+
+def locate_hazard(sector_captions: dict):
+    """(sector, Hazard) for the most severe hazard across sector captions, or (None, None)."""
+    best = None
+    for rank, sector in enumerate(SECTOR_PRIORITY):
+        hazard = classify_hazard(sector_captions.get(sector) or "")
+        if hazard is not None and (best is None or (-hazard.severity, rank) < best[0]):
+            best = ((-hazard.severity, rank), sector, hazard)
+    if best is None:
+        return None, None
+    return best[1], best[2]
+
+
+def format_warning(keyword: str, direction: str) -> str:
+    """The short sentence the client speaks, e.g. 'knife to your left'."""
+    return f"{keyword} to your {direction}"
@@ -0,0 +1,63 @@
+# Guided_Vision/server/load_hints.py
+#
+# Load hints for client pacing. Every result carries a "load" block:
+#
+#   queue_depth       devices with a frame waiting for the model
+#   in_flight         frames being captioned right now
+#   inference_p50_ms  median batch time over the recent batches
+#   active_devices    devices that sent a frame within pacing_active_window_sec
+#   next_send_ms      when this device's next frame would find a free slot
+#
+# next_send_ms is the server's share of capacity per device: W workers finish
+# about W * B frames (B = recent mean batch size) every p50 batch time, so each
+# of D active devices gets one frame through every p50 * max(1, D / (W * B)).
+# Sending faster only makes frames wait (and get superseded); sending slower
+# leaves the model idle. Clients clamp it to their own interval bounds.
+
+import threading
+import time
+
+from config import CONFIG
+
+PACING_HINTS = bool(CONFIG.get("pacing_hints", True))
+ACTIVE_WINDOW_SEC = float(CONFIG.get("pacing_active_window_sec", 10.0))
+MIN_SEND_MS = float(CONFIG.get("pacing_min_send_ms", 250))
+MAX_SEND_MS = float(CONFIG.get("pacing_max_send_ms", 10000))
+
+
+class LoadHints:
+    def __init__(self, batcher, window_sec: float = ACTIVE_WINDOW_SEC,
+                 min_send_ms: float = MIN_SEND_MS, max_send_ms: float = MAX_SEND_MS):
+        self.batcher = batcher
+        self.window_sec = float(window_sec)
+        self.min_send_ms = float(min_send_ms)
+        self.max_send_ms = max(float(max_send_ms), self.min_send_ms)
+        self._seen = {}  # device -> monotonic time of its last frame
+        self._lock = threading.Lock()
+
+    def seen(self, device: str) -> None:
+        with self._lock:
+            self._seen[device] = time.monotonic()
+
+    def active_devices(self) -> int:
+        cutoff = time.monotonic() - self.window_sec
+        with self._lock:
+            for device in [d for d, t in self._seen.items() if t < cutoff]:
+                del self._seen[device]
+            return len(self._seen)
+
+    def hint(self) -> dict:
+        p50_ms, mean_batch = self.batcher.recent()
+        devices = max(1, self.active_devices())
+        if p50_ms is None:
+            next_ms = self.min_send_ms  # nothing measured yet: let clients probe
+        else:
+            per_round = self.batcher.workers * max(1.0, mean_batch)
+            next_ms = p50_ms * max(1.0, devices / per_round)
+        return {
+            "queue_depth": self.batcher.scheduler.depth(),
+            "in_flight": self.batcher.in_flight(),
+            "inference_p50_ms": None if p50_ms is None else round(p50_ms, 1),
+            "active_devices": devices,
+            "next_send_ms": round(min(self.max_send_ms, max(self.min_send_ms, next_ms)), 1),
+        }
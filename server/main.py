@@ -1,13 +1,92 @@
 # Guided_Vision/server/main.py
 
+import asyncio
+import json
+import re
+import threading
 import time
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, UploadFile, File
+from fastapi import (
+    FastAPI, UploadFile, File, Form, Header, HTTPException, Request, WebSocket, WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
-
-from vlm_service import generate_caption, is_dangerous
-
-app = FastAPI()
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+import metrics
+import vlm_service
+from config import CONFIG
+from detector import CascadePolicy, detection_analysis, load_detector
+from frame_cache import FRAME_CACHE_ENABLED, FrameCache, dhash
+from frame_protocol import decode_frame_message
+from hazards import DIRECTIONS, LEXICON, classify_hazard, extract_direction, format_warning, locate_hazard
+from load_hints import PACING_HINTS, LoadHints
+from results_hub import ResultsHub, event_stream
+from scheduler import SchedulerFull
+from vlm_service import CaptionBatcher
+
+
+def _load_model_in_background() -> None:
+    try:
+        timings = vlm_service.load_model()
+    except Exception as e:
+        print(f"[SERVER] Model load FAILED: {e}")
+        return
+    stages = ", ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items())
+    print(f"[SERVER] Model ready ({stages})")
+
+    info = vlm_service.MODEL_INFO
+    rate = vlm_service.decode_rate()
+    print(
+        f"[SERVER] {info['model']} on {info['device']} ({info['precision']}): "
+        f"weights {info['weights_mb']:.0f} MB, process RSS {info['rss_mb_after_load'] or 0:.0f} MB, "
+        f"decode {f'{rate:.1f} tokens/s' if rate else 'n/a (no warm-up)'}"
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the VLM off the event loop so "/" and "/ready" answer right away
+    loop = asyncio.get_running_loop()
+    app.state.model_loader = loop.run_in_executor(None, _load_model_in_background)
+    yield
+    if vlm_service.worker_pool is not None:
+        vlm_service.worker_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Frames from all clients go through one micro-batching engine.
+# Inference runs on its executor, so the event loop stays free for other requests.
+caption_batcher = CaptionBatcher()
+metrics.QUEUE_DEPTH.set_function(caption_batcher.scheduler.depth)
+metrics.INFERENCE_IN_FLIGHT.set_function(caption_batcher.in_flight)
+
+# Queue depth, recent inference time and a suggested next-send delay for client pacing
+load_hints = LoadHints(caption_batcher) if PACING_HINTS else None
+
+# Near-duplicate frames from the same device reuse the previous analysis
+frame_cache = FrameCache() if FRAME_CACHE_ENABLED else None
+
+# Optional YOLO pass in front of the VLM (cascade_enabled in config.yaml)
+detector = load_detector()
+cascade = CascadePolicy() if detector is not None else None
+# Latest VLM caption per device, spoken alongside detector-only verdicts
+LAST_CAPTION = {}
+
+# Seconds a rejected client is asked to back off when the queue is full
+RETRY_AFTER_SEC = 1
+# ... and while the model is still loading
+LOADING_RETRY_AFTER_SEC = 5
+# Frames one WebSocket may have in the pipeline at once; further ones are answered "busy"
+WS_MAX_IN_FLIGHT = max(1, int(CONFIG.get("ws_max_in_flight", 2)))
+
+# /analyze_frame/stream: stop decoding at the first hazard word unless the request says otherwise
+HAZARD_FAST_EXIT = bool(CONFIG.get("vlm_hazard_fast_exit", False))
+
+# "caption": direction from words in the caption; "sectors": caption the left /
+# center / right crops in one batch and take the direction from the crop with the hazard
+SECTOR_DIRECTIONS = str(CONFIG.get("direction_mode", "caption")).lower() == "sectors"
 
 
 @app.get("/")
@@ -15,7 +94,21 @@ async def health():
     return {"status": "ok"}
 
 
-LAST_RESULT = None
+@app.get("/ready")
+async def ready():
+    """200 once the model is loaded (and warmed up), 503 with per-stage progress before that."""
+    state = vlm_service.LOAD_STATE
+    body = {
+        "ready": state["ready"],
+        "stage": state["stage"],
+        "timings_ms": state["timings_ms"],
+        "error": state["error"],
+    }
+    return JSONResponse(body, status_code=200 if state["ready"] else 503)
+
+
+# Latest result per device, pushed to dashboards over /events
+results_hub = ResultsHub()
 
 # Allow frontend / clients to call this API
 app.add_middleware(
@@ -26,115 +119,453 @@ app.add_middleware(
 )
 
 
-def extract_direction(text: str) -> str:
-    """
-    Try to guess the direction of the danger from the caption.
-    We keep it simple and only look for basic words.
-    """
-    t = text.lower()
-
-    if "left" in t:
-        return "left"
-    if "right" in t:
-        return "right"
-    if "behind" in t or "back" in t:
-        return "behind you"
-    if "front" in t or "ahead" in t or "in front" in t:
-        return "front"
-
-    # Default if no direction found
-    return "front"
-
-
 def extract_danger_keyword(text: str) -> str:
     """
     Extract a short danger keyword from the caption.
     This is just to build: '<keyword> to your <direction>'
     """
-    t = text.lower()
-
-    danger_keywords = [
-        # sharp / cutting objects
-        "knife", "knives", "blade",
-        "sharp edge", "sharp edges",
-        "sharp corner", "sharp corners",
-        "corner of the table", "table corner",
-        "edge of the table", "table edge",
-        "broken glass", "table", "chair", "door", "edge", "wall",
-
-        # fire / heat / smoke
-        "fire", "flame", "flames",
-
-        # cables / wires
-        "exposed cable", "exposed wire",
-        "loose cable", "loose wire",
-        "cable", "wire", "rope", "pipe",
-
-        # holes / gaps / stairs / obstacles
-        "hole", "open hole", "pit", "gap",
-        "stairs", "staircase", "step", "steps",
-        "obstacle", "barrier",
-    ]
-
-    for kw in danger_keywords:
-        if kw in t:
-            return kw
+    hazard = classify_hazard(text)
+    if hazard is not None:
+        return hazard.keyword
 
     # Fallback if we don't detect a specific keyword
     return "danger"
 
 
-@app.post("/analyze_frame")
-async def analyze_frame(file: UploadFile = File(...)):
-    """
-    Receive a single frame, run the VLM, classify danger, and return a compact JSON
-    that matches what client_pi/pi_client.py and the dashboard expect.
-    """
-    start = time.time()
+def resolve_device_id(request: Request, header_id, form_id) -> str:
+    """Identify the sending device: explicit id if given, else the client address."""
+    device_id = header_id or form_id
+    if device_id:
+        return str(device_id)
+    return request.client.host if request.client else "default"
 
-    image_bytes = await file.read()
 
-    # 1) Caption from VLM
-    caption = generate_caption(image_bytes)
+def ensure_ready() -> None:
+    if not vlm_service.is_ready():
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model not ready ({vlm_service.LOAD_STATE['stage']}).",
+            headers={"Retry-After": str(LOADING_RETRY_AFTER_SEC)},
+        )
+
 
-    # 2) Classify dangerous / safe
-    danger = is_dangerous(caption)
+def analyze_caption(caption: str) -> dict:
+    """Danger classification + spoken warning for a finished caption."""
+    # One pass: flag, keyword, category, span
+    t0 = time.perf_counter()
+    hazard = classify_hazard(caption)
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="classify")
+    danger = hazard is not None
 
-    # 3) Always show what the model thinks in the server terminal
+    # Always show what the model thinks in the server terminal
     print(f"[SERVER] Caption: {caption!r}  (danger={danger})")
 
-    # 4) If dangerous, build the spoken warning sentence for the client
+    # If dangerous, build the spoken warning sentence for the client
     warning = None
     if danger:
         direction = extract_direction(caption)
-        danger_kw = extract_danger_keyword(caption)
-        warning = f"{danger_kw} to your {direction}"
-
-    latency_ms = (time.time() - start) * 1000.0
+        warning = format_warning(hazard.keyword, direction)
 
-    result = {
+    return {
         "is_danger": danger,
         "message": caption,
         "raw_caption": caption,
         "warning": warning,
+        "hazard_category": hazard.category if hazard else None,
+        "severity": hazard.severity if hazard else 0,
+    }
+
+
+def _detection_info(top):
+    if top is None:
+        return None
+    return {"label": top.label, "confidence": round(top.confidence, 3), "direction": top.direction}
+
+
+def analyze_sectors(captions: dict) -> dict:
+    """Like analyze_caption, for {sector: caption}: the hazard's sector is its direction."""
+    t0 = time.perf_counter()
+    sector, hazard = locate_hazard(captions)
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="classify")
+    caption = captions[sector] if hazard else captions["front"]
+
+    print(f"[SERVER] Sector captions: {captions!r}  (danger={hazard is not None}, sector={sector})")
+
+    return {
+        "is_danger": hazard is not None,
+        "message": caption,
+        "raw_caption": caption,
+        "warning": format_warning(hazard.keyword, sector) if hazard else None,
+        "hazard_category": hazard.category if hazard else None,
+        "severity": hazard.severity if hazard else 0,
+        "sectors": captions,
+    }
+
+
+async def process_frame(image_bytes: bytes, device: str, start: float,
+                        transport: str = "http", sectors: bool = None) -> dict:
+    """
+    Shared pipeline for every transport (multipart upload, WebSocket).
+    sectors=None follows direction_mode in config.yaml.
+    Raises SchedulerFull when the frame has to be shed.
+    """
+    if sectors is None:
+        sectors = SECTOR_DIRECTIONS
+    ready = time.time()
+    stages = {}
+    if load_hints is not None:
+        load_hints.seen(device)
+    metrics.IN_FLIGHT.inc()
+    try:
+        result = await _process_frame(image_bytes, device, start, sectors, stages)
+    finally:
+        metrics.IN_FLIGHT.dec()
+    sent = time.time()
+    metrics.REQUEST_SECONDS.observe(sent - start, transport=transport)
+    result = {**result, "trace": server_trace(start, ready, sent, stages)}
+    if load_hints is not None:
+        result["load"] = load_hints.hint()
+    return result
+
+
+def server_trace(received: float, ready: float, sent: float, stages_ms: dict) -> dict:
+    """
+    Server half of a frame's end-to-end trace, in server wall-clock seconds / ms.
+    The client pairs received_ts / sent_ts with its own send / receive times to
+    estimate the clock offset between the two machines.
+    """
+    stages = {"receive": (ready - received) * 1000.0, **stages_ms}
+    stages["post"] = max(0.0, (sent - received) * 1000.0 - sum(stages.values()))
+    return {
+        "received_ts": received,
+        "sent_ts": sent,
+        "stages_ms": {k: round(v, 2) for k, v in stages.items()},
+    }
+
+
+async def _process_frame(image_bytes: bytes, device: str, start: float, sectors: bool = False,
+                         stages: dict = None) -> dict:
+    """stages (ms) is filled in for the response trace: detector, queue_wait, inference."""
+    if stages is None:
+        stages = {}
+    # 0) Skip the VLM entirely if this device just sent (almost) the same picture
+    frame_hash = None
+    if frame_cache is not None:
+        loop = asyncio.get_running_loop()
+        try:
+            # JPEG decode + resize: off the event loop like the other CPU work
+            frame_hash = await loop.run_in_executor(None, dhash, image_bytes)
+        except Exception:
+            frame_hash = None  # undecodable here; let the VLM path report it
+    if frame_hash is not None:
+        cached = frame_cache.lookup(device, frame_hash)
+        if cached is not None:
+            metrics.FRAMES.inc(device=device, outcome="cache_hit")
+            print(f"[SERVER] Cache hit ({device}): {cached['raw_caption']!r}")
+            result = dict(cached)
+            result.update({
+                "latency_ms": (time.time() - start) * 1000.0,
+                "batch_size": 0,
+                "batch_wait_ms": 0.0,
+                "device_id": device,
+                "superseded": 0,
+                "cache_hit": True,
+                "verdict_stage": "cache",
+                "vlm_skipped": True,
+            })
+            metrics.VERDICTS.inc(stage="cache")
+            results_hub.publish(result)
+            return result
+
+    # 0b) Detector cascade: a confident YOLO answer settles the frame without the VLM
+    stage, top = "vlm", None
+    if detector is not None:
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        detections = await loop.run_in_executor(None, detector.detect, image_bytes)
+        stages["detector"] = (time.perf_counter() - t0) * 1000.0
+        metrics.STAGE_SECONDS.observe(stages["detector"] / 1000.0, stage="detector")
+        run_vlm, stage, top = cascade.decide(device, detections)
+        if not run_vlm:
+            metrics.FRAMES.inc(device=device, outcome="detector")
+            metrics.VERDICTS.inc(stage="detector")
+            result = {
+                **detection_analysis(top, LAST_CAPTION.get(device)),
+                "latency_ms": (time.time() - start) * 1000.0,
+                "batch_size": 0,
+                "batch_wait_ms": 0.0,
+                "device_id": device,
+                "superseded": 0,
+                "cache_hit": False,
+                "verdict_stage": "detector",
+                "vlm_skipped": True,
+                "detector": _detection_info(top),
+            }
+            results_hub.publish(result)
+            return result
+
+    # 1) Caption from VLM (batched with any frames arriving at the same time).
+    #    A newer frame from the same device replaces this one while it is still queued.
+    #    Sector mode adds the frame's three crops to the batch instead.
+    try:
+        fut = caption_batcher.submit(image_bytes, device_id=device, sectors=sectors)
+    except SchedulerFull:
+        metrics.FRAMES.inc(device=device, outcome="shed")
+        raise
+    metrics.FRAMES.inc(device=device, outcome="inference")
+    captioned = await asyncio.wrap_future(fut)
+    caption = captioned.caption
+    LAST_CAPTION[device] = caption
+    stages["queue_wait"] = captioned.wait_ms
+    stages["inference"] = captioned.inference_ms
+
+    # 2) Classify dangerous / safe and build the spoken warning
+    # (a plain frame that superseded a sector frame in the queue has no sector captions)
+    analysis = analyze_sectors(captioned.sectors) if captioned.sectors else analyze_caption(caption)
+    if stage == "detector" and not analysis["is_danger"]:
+        # Confident detection the caption missed: keep the detector's warning
+        analysis = detection_analysis(top, caption)
+    metrics.VERDICTS.inc(stage=stage)
+    latency_ms = (time.time() - start) * 1000.0
+
+    result = {
+        **analysis,
         "latency_ms": latency_ms,
+        "batch_size": captioned.batch_size,
+        "batch_wait_ms": captioned.wait_ms,
+        "device_id": device,
+        "superseded": captioned.superseded,
+        "cache_hit": False,
+        "verdict_stage": stage,
+        "vlm_skipped": False,
     }
+    if detector is not None:
+        result["detector"] = _detection_info(top)
+
+    if frame_hash is not None:
+        frame_cache.store(device, frame_hash, analysis, cost_ms=latency_ms)
 
-    # Save for the dashboard / Pi mode to poll
-    global LAST_RESULT
-    LAST_RESULT = result
+    # Push to dashboards watching this device
+    results_hub.publish(result)
 
     return result
 
 
+@app.post("/analyze_frame")
+async def analyze_frame(
+    request: Request,
+    file: UploadFile = File(...),
+    device_id: str = Form(None),
+    x_device_id: str = Header(None),
+    sectors: bool = None,
+):
+    """
+    Receive a single frame, run the VLM, classify danger, and return a compact JSON
+    that matches what client_pi/pi_client.py and the dashboard expect.
+    ?sectors=true captions left / center / right crops and takes the direction from them.
+    """
+    start = time.time()
+    ensure_ready()
+
+    t0 = time.perf_counter()
+    image_bytes = await file.read()
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="upload_read")
+    device = resolve_device_id(request, x_device_id, device_id)
+
+    try:
+        return await process_frame(image_bytes, device, start, sectors=sectors)
+    except SchedulerFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, frame dropped. Retry shortly.",
+            headers={"Retry-After": str(RETRY_AFTER_SEC)},
+        )
+    except vlm_service.FrameError as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode the image: {e}")
+
+
+@app.websocket("/ws")
+async def frames_socket(websocket: WebSocket):
+    """
+    Persistent frame stream. The client sends binary messages
+    (see frame_protocol.py: header length, JSON header, JPEG) and gets one JSON
+    text message back per frame, tagged with the same seq.
+    Frames are processed concurrently (at most ws_max_in_flight per socket),
+    so replies can arrive out of order.
+    """
+    await websocket.accept()
+    default_device = websocket.client.host if websocket.client else "default"
+    send_lock = asyncio.Lock()
+    pending = set()
+
+    async def reply(message: dict) -> None:
+        async with send_lock:
+            await websocket.send_text(json.dumps(message))
+
+    async def handle(data: bytes, received: float) -> None:
+        try:
+            header, image_bytes = decode_frame_message(data)
+        except ValueError as e:
+            await reply({"error": "bad_frame", "detail": str(e)})
+            return
+
+        tags = {
+            "seq": header.get("seq"),
+            "capture_ts": header.get("ts"),
+        }
+        if not vlm_service.is_ready():
+            await reply({**tags, "error": "not_ready", "retry_after_sec": LOADING_RETRY_AFTER_SEC})
+            return
+
+        device = str(header.get("device_id") or default_device)
+        try:
+            result = await process_frame(image_bytes, device, received, transport="websocket",
+                                         sectors=header.get("sectors"))
+        except SchedulerFull:
+            await reply({**tags, "error": "busy", "retry_after_sec": RETRY_AFTER_SEC})
+            return
+        except vlm_service.FrameError as e:
+            await reply({**tags, "error": "bad_frame", "detail": str(e)})
+            return
+        except Exception as e:
+            await reply({**tags, "error": "failed", "detail": str(e)})
+            return
+        await reply({**tags, **result})
+
+    try:
+        while True:
+            data = await websocket.receive_bytes()
+            if len(pending) >= WS_MAX_IN_FLIGHT:
+                # Shed here instead of starting yet another task for this socket
+                try:
+                    header, _ = decode_frame_message(data)
+                except ValueError:
+                    header = {}
+                device = str(header.get("device_id") or default_device)
+                metrics.FRAMES.inc(device=device, outcome="shed")
+                await reply({"seq": header.get("seq"), "capture_ts": header.get("ts"),
+                             "error": "busy", "retry_after_sec": RETRY_AFTER_SEC})
+                continue
+            task = asyncio.create_task(handle(data, time.time()))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+@app.post("/analyze_frame/stream")
+async def analyze_frame_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    device_id: str = Form(None),
+    x_device_id: str = Header(None),
+    fast_exit: bool = None,
+):
+    """
+    Same analysis as /analyze_frame, streamed as NDJSON while the caption is decoded:
+      {"event": "danger", ...}  as soon as a hazard word appears in the partial text (once)
+      {"event": "result", ...}  the full /analyze_frame result
+    Both carry t_first_alert_ms; only the result carries the total latency_ms.
+    With fast_exit, decoding stops at the first hazard word.
+    """
+    start = time.time()
+    ensure_ready()
+
+    t0 = time.perf_counter()
+    image_bytes = await file.read()
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="upload_read")
+    device = resolve_device_id(request, x_device_id, device_id)
+    metrics.FRAMES.inc(device=device, outcome="inference")
+    if fast_exit is None:
+        fast_exit = HAZARD_FAST_EXIT
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    alert = {}
+
+    def on_partial(text: str) -> bool:
+        if alert:
+            return fast_exit
+        # Ignore a trailing word that may still grow ("tab" -> "table" -> "tablet")
+        hazard = classify_hazard(re.sub(r"\w+$", "", text))
+        if hazard is None:
+            return False
+        alert.update({
+            "event": "danger",
+            "is_danger": True,
+            "warning": format_warning(hazard.keyword, extract_direction(text)),
+            "hazard_category": hazard.category,
+            "severity": hazard.severity,
+            "partial_caption": text.strip(),
+            "t_first_alert_ms": (time.time() - start) * 1000.0,
+            "device_id": device,
+        })
+        loop.call_soon_threadsafe(events.put_nowait, dict(alert))
+        return fast_exit
+
+    # The frame is in flight until its caption is done, whether or not the
+    # client is still reading the response (body() may never run)
+    in_flight = threading.Lock()
+
+    def end_in_flight() -> None:
+        if in_flight.acquire(blocking=False):
+            metrics.IN_FLIGHT.dec()
+
+    def run() -> str:
+        try:
+            return vlm_service.stream_caption(image_bytes, on_partial)
+        finally:
+            end_in_flight()
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    metrics.IN_FLIGHT.inc()
+    try:
+        # Waits (off the loop) for a free inference worker
+        job = await loop.run_in_executor(None, caption_batcher.submit_call, run)
+    except BaseException:
+        end_in_flight()
+        raise
+
+    async def body():
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            results_hub.publish(event, event="danger")
+            yield json.dumps(event) + "\n"
+
+        try:
+            caption = await asyncio.wrap_future(job)
+        except Exception as e:
+            yield json.dumps({"event": "error", "detail": str(e)}) + "\n"
+            return
+
+        result = {
+            **analyze_caption(caption),
+            "latency_ms": (time.time() - start) * 1000.0,
+            "t_first_alert_ms": alert.get("t_first_alert_ms"),
+            "fast_exit": fast_exit,
+            "device_id": device,
+            "cache_hit": False,
+        }
+        results_hub.publish(result)
+        metrics.REQUEST_SECONDS.observe(time.time() - start, transport="stream")
+        yield json.dumps({"event": "result", **result}) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
 @app.get("/last_result")
-async def last_result():
+async def last_result(device: str = None):
     """
-    Return the last analyze_frame result (from Pi client or web client).
-    Useful for the dashboard / Pi mode.
+    Latest analyze_frame result for ?device= (any device when omitted).
+    Dashboards should prefer /events, which pushes every result as it happens.
     """
-    global LAST_RESULT
-    if LAST_RESULT is None:
+    result = results_hub.last(device)
+    if result is None:
         return {
             "is_danger": False,
             "message": None,
@@ -142,4 +573,71 @@ async def last_result():
             "warning": None,
             "latency_ms": None,
         }
-    return LAST_RESULT
+    return result
+
+
+@app.get("/events")
+async def events(request: Request, device: str = None):
+    """
+    Server-Sent Events: the device's latest result, then every new one as
+    "result" events ("danger" events from /analyze_frame/stream as they are
+    decoded). Without ?device= every device's results are sent.
+    """
+    return StreamingResponse(
+        event_stream(results_hub, request, device),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/capture_profile")
+async def capture_profile():
+    """
+    Frame size, aspect ratio, colour mode and JPEG quality the active model and
+    preprocessing mode consume as-is, so clients can capture to it directly.
+    """
+    return vlm_service.capture_profile()
+
+
+@app.get("/alert_phrases")
+async def alert_phrases():
+    """
+    Every warning sentence the server can send (hazard keyword or detector
+    label x direction), so clients can synthesise the audio once at startup.
+    """
+    labels = set(detector.classes) if detector is not None else set()
+    keywords = sorted(set(LEXICON.keywords) | labels) + ["danger"]
+    return {
+        "phrases": [format_warning(kw, d) for kw in keywords for d in DIRECTIONS],
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-stage latency histograms, queue gauges and counters (Prometheus text format)."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/stats")
+async def stats():
+    """Runtime counters for tuning the server (batch window, etc.)."""
+    return {
+        "model": {
+            **vlm_service.MODEL_INFO,
+            "rss_mb": vlm_service.rss_mb(),
+            "generation": vlm_service.generation_stats(),
+        },
+        "batching": caption_batcher.stats(),
+        "worker_pool": vlm_service.worker_pool.stats() if vlm_service.worker_pool is not None else None,
+        "scheduler": caption_batcher.scheduler.stats(),
+        "frame_cache": frame_cache.stats() if frame_cache is not None else None,
+        "events": results_hub.stats(),
+        "pacing": load_hints.hint() if load_hints is not None else None,
+        "capture_profile": {**vlm_service.capture_profile(), "uploads": dict(vlm_service.PROFILE_STATS)},
+        "cascade": {"backend": detector.backend, **cascade.stats()} if detector is not None else None,
+        "prompt_cache": {
+            "enabled": vlm_service.prefix_cache is not None,
+            "prefix_tokens": vlm_service.prefix_cache.prefix_len if vlm_service.prefix_cache else None,
+            "error": vlm_service.PROMPT_CACHE_ERROR,
+        },
+    }
@@ -0,0 +1,208 @@
+# Guided_Vision/server/metrics.py
+#
+# Minimal Prometheus metrics (text exposition format 0.0.4) for /metrics.
+#
+# Recording is one dict lookup + bisect + add under a lock, so it stays on in
+# production. Gauges that mirror existing state (queue depth, ...) take a
+# callback and are only evaluated when /metrics is scraped.
+
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a ~1 ms keyword scan up to a multi-second CPU generate()
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), function=None):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+        self._function = function  # () -> number, read at scrape time
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function) -> None:
+        self._function = function
+
+    def render(self) -> list:
+        if self._function is not None:
+            try:
+                items = [((), self._function())]
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(v)}"
+            for key, v in items if v is not None
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.bounds) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def snapshot(self) -> dict:
+        """Copy of every series (label key -> bucket counts + sum), e.g. to diff in a worker process."""
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def merge(self, series: dict) -> None:
+        """Add observations counted elsewhere, as {label key: bucket counts + sum}."""
+        with self._lock:
+            for key, values in series.items():
+                mine = self._series.get(key)
+                if mine is None:
+                    mine = self._series[key] = [0] * (len(self.bounds) + 1) + [0.0]
+                for i, value in enumerate(values):
+                    mine[i] += value
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = self._header()
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float("inf"),), series[:-1]):
+                cumulative += n
+                le = _labels(self.labelnames, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            base = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{base} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- The server's metrics ---
+
+STAGE_SECONDS = Histogram(
+    "guidedvision_stage_seconds",
+    "Time spent per pipeline stage (prefill/decode are per batch).",
+    labelnames=("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "guidedvision_request_seconds",
+    "Frame arrival to result, per transport.",
+    labelnames=("transport",),
+)
+IN_FLIGHT = Gauge(
+    "guidedvision_requests_in_flight",
+    "Frames received and not answered yet.",
+)
+QUEUE_DEPTH = Gauge(
+    "guidedvision_queue_depth",
+    "Devices with a frame waiting for the VLM.",
+)
+INFERENCE_IN_FLIGHT = Gauge(
+    "guidedvision_inference_frames_in_flight",
+    "Frames currently inside a VLM batch.",
+)
+TOKENS = Counter(
+    "guidedvision_tokens_generated_total",
+    "New (non-padding) tokens generated by the VLM.",
+)
+FRAMES = Counter(
+    "guidedvision_frames_total",
+    "Frames received, per device and outcome (inference, cache_hit, detector, shed).",
+    labelnames=("device", "outcome"),
+)
+VERDICTS = Counter(
+    "guidedvision_verdicts_total",
+    "Which stage produced each frame's danger verdict (vlm, detector, cache).",
+    labelnames=("stage",),
+)
@@ -0,0 +1,115 @@
+# Guided_Vision/server/results_hub.py
+#
+# Per-device fan-out of analysis results to dashboards (Server-Sent Events).
+#
+# Every result is published once; each subscriber has its own small buffer.
+# A subscriber that falls behind loses its OLDEST events (latest wins, like
+# the frame scheduler), so a stalled browser tab never holds more than
+# maxsize results in memory. The last result per device is kept for
+# /last_result.
+#
+# Everything here runs on the event loop, so there are no locks.
+
+import asyncio
+import json
+from collections import deque
+
+from config import CONFIG
+
+SUBSCRIBER_BUFFER = int(CONFIG.get("events_buffer_size", 16))
+# Keep-alive comment interval, so proxies keep the stream open and dead clients are noticed
+KEEPALIVE_SEC = float(CONFIG.get("events_keepalive_sec", 15.0))
+
+
+class Subscription:
+    def __init__(self, device: str = None, maxsize: int = SUBSCRIBER_BUFFER):
+        self.device = device  # None = every device
+        self._events = deque(maxlen=max(1, int(maxsize)))
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, event_id: int, event: str, data: dict) -> None:
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append((event_id, event, data))
+        self._ready.set()
+
+    async def get(self, timeout: float = None):
+        """Oldest buffered (id, event, data), or None on timeout."""
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._events.popleft()
+
+
+class ResultsHub:
+    def __init__(self, buffer_size: int = SUBSCRIBER_BUFFER):
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self._last = {}        # device -> latest result
+        self._last_any = None  # latest result from any device
+        self._next_id = 0
+        self.published = 0
+        self.dropped = 0       # events lost by subscribers that have since left
+
+    def publish(self, result: dict, event: str = "result") -> None:
+        device = result.get("device_id") or "default"
+        if event == "result":
+            self._last[device] = result
+            self._last_any = result
+        self._next_id += 1
+        self.published += 1
+        for sub in self._subscribers:
+            if sub.device is None or sub.device == device:
+                sub.push(self._next_id, event, result)
+
+    def last(self, device: str = None):
+        if device is None:
+            return self._last_any
+        return self._last.get(device)
+
+    def subscribe(self, device: str = None) -> Subscription:
+        sub = Subscription(device, self.buffer_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subscribers.discard(sub)
+        self.dropped += sub.dropped
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "devices": len(self._last),
+            "published": self.published,
+            "dropped": self.dropped + sum(s.dropped for s in self._subscribers),
+            "buffer_size": self.buffer_size,
+        }
+
+
+def format_event(event_id: int, event: str, data: dict) -> str:
+    """One SSE message."""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(hub: ResultsHub, request, device: str = None):
+    """SSE body for /events: the device's last result, then every new one."""
+    sub = hub.subscribe(device)
+    try:
+        yield "retry: 3000\n\n"
+        last = hub.last(device)
+        if last is not None:
+            yield format_event(0, "result", last)
+        while True:
+            item = await sub.get(timeout=KEEPALIVE_SEC)
+            if await request.is_disconnected():
+                break
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(*item)
+    finally:
+        hub.unsubscribe(sub)
@@ -0,0 +1,101 @@
+# Guided_Vision/server/scheduler.py
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class SchedulerFull(Exception):
+    """Raised when a new device cannot be queued because the scheduler is at capacity."""
+
+
+class PendingFrame:
+    """The one frame a device has waiting, plus every caller waiting on it."""
+
+    __slots__ = ("device_id", "payload", "futures", "enqueued_at")
+
+    def __init__(self, device_id: str, payload, fut: Future):
+        self.device_id = device_id
+        self.payload = payload
+        self.futures = [fut]
+        self.enqueued_at = time.monotonic()
+
+
+class FrameScheduler:
+    """
+    Pending frames keyed by client / device id.
+
+    - Each device has at most one queued frame. A newer upload replaces the
+      queued one (latest frame wins) and every waiting caller gets the newer
+      frame's result, so nobody is told about a stale scene.
+    - Devices are served in arrival order and a served device re-joins at the
+      back, i.e. round-robin: one chatty client cannot starve the rest.
+    - At most max_pending devices can wait. Beyond that put() raises
+      SchedulerFull so the caller can shed load right away.
+    """
+
+    def __init__(self, max_pending: int = 16):
+        self.max_pending = max(1, int(max_pending))
+        self._slots = OrderedDict()  # device_id -> PendingFrame, in service order
+        self._cond = threading.Condition()
+        self.superseded = 0
+        self.shed = 0
+
+    def put(self, device_id: str, payload) -> Future:
+        fut = Future()
+        with self._cond:
+            slot = self._slots.get(device_id)
+            if slot is not None:
+                # Same device, still queued: swap in the fresher frame, keep its place in line
+                slot.payload = payload
+                slot.futures.append(fut)
+                self.superseded += 1
+                return fut
+
+            if len(self._slots) >= self.max_pending:
+                self.shed += 1
+                raise SchedulerFull(f"{len(self._slots)} devices already waiting")
+
+            self._slots[device_id] = PendingFrame(device_id, payload, fut)
+            self._cond.notify()
+        return fut
+
+    def wait_for_frames(self) -> None:
+        """Block until at least one frame is queued (without taking it)."""
+        with self._cond:
+            while not self._slots:
+                self._cond.wait()
+
+    def take(self, max_items: int, max_wait_sec: float) -> list:
+        """
+        Block until at least one frame is queued, then wait up to max_wait_sec
+        (measured from the oldest frame) for up to max_items frames.
+        """
+        with self._cond:
+            while not self._slots:
+                self._cond.wait()
+
+            oldest = next(iter(self._slots.values()))
+            deadline = oldest.enqueued_at + max_wait_sec
+            while len(self._slots) < max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            n = min(len(self._slots), max_items)
+            return [self._slots.popitem(last=False)[1] for _ in range(n)]
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._slots)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued_devices": len(self._slots),
+                "max_pending": self.max_pending,
+                "superseded_frames": self.superseded,
+                "shed_frames": self.shed,
+            }
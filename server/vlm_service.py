@@ -1,34 +1,59 @@
 # Guided_Vision/server/vlm_service.py
 
+import copy
 import io
+import threading
+import time
 import warnings
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 
 import torch
 from PIL import Image
-from transformers import AutoProcessor, AutoModelForVision2Seq
-from transformers.utils import logging as hf_logging
 
-# Silence transformers logs / warnings
-hf_logging.set_verbosity_error()
+from backends import get_backend
+from config import CONFIG
+from hazards import LEXICON
+from metrics import STAGE_SECONDS, TOKENS
+from scheduler import FrameScheduler
+
+# Silence transformers warnings (logs are silenced once it is imported in load_model)
 warnings.filterwarnings("ignore", category=FutureWarning, module="transformers")
 
-# --- Model config ---
-MODEL_NAME = "HuggingFaceTB/SmolVLM-256M-Instruct"
-MAX_NEW_TOKENS = 32  # shorter = faster
+# --- Model config (config.yaml: vlm_*) ---
+MODEL_NAME = str(CONFIG.get("vlm_model_id", "HuggingFaceTB/SmolVLM-256M-Instruct"))
+MAX_NEW_TOKENS = int(CONFIG.get("vlm_max_new_tokens", 32))  # shorter = faster
 
-# Auto device selection: GPU if available, otherwise CPU
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-# --- Load model once at startup (NO PRINTS) ---
-processor = AutoProcessor.from_pretrained(MODEL_NAME)
-model = AutoModelForVision2Seq.from_pretrained(MODEL_NAME)
-model.to(DEVICE)
-model.eval()
+def _resolve_device(name: str) -> str:
+    # "auto": GPU if available, otherwise CPU
+    if name in ("", "auto"):
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return name
 
-# Prompt: include <image> so the model knows there's an image
-PROMPT = (
-    "User:\n"
-    "<image>\n"
+
+DEVICE = _resolve_device(str(CONFIG.get("vlm_device", "auto")).lower())
+
+# fp32 (reference), bf16 (half the memory) or int8 (dynamic-quantized Linear layers, CPU only)
+PRECISIONS = ("fp32", "bf16", "int8")
+PRECISION = str(CONFIG.get("vlm_precision", "fp32")).lower()
+
+# How the loaded model executes: "eager", "compile" (torch.compile) or "onnxruntime" (see backends.py)
+BACKEND = str(CONFIG.get("vlm_backend", "eager")).lower()
+
+# Optional local directory with the model's config + safetensors (skips the Hub lookup)
+MODEL_PATH = CONFIG.get("vlm_model_path")
+# Run one generation on a synthetic frame before reporting ready
+WARMUP = bool(CONFIG.get("vlm_warmup", True))
+
+# Filled in by load_model(), which the server runs in its startup phase (NO PRINTS here)
+processor = None
+model = None
+
+# Fixed instruction text shared by every frame
+PROMPT_INSTRUCTIONS = (
     "You are a vision assistant for a visually impaired person. "
     "Describe in ONE short, direct sentence what you see in the image. "
     "Focus on important objects, people, and any dangerous or potentially dangerous elements "
@@ -38,25 +63,633 @@ PROMPT = (
     "front, left, right, or behind. If the distance is clear, mention the approximate "
     "distance in meters. "
     "Do not talk about being an AI or an assistant. Do not repeat the prompt. "
-    "Just answer with the description sentence.\n"
-    "Assistant:"
+    "Just answer with the description sentence."
 )
 
+# Prompt: include <image> so the model knows there's an image
+PROMPT = "User:\n<image>\n" + PROMPT_INSTRUCTIONS + "\nAssistant:"
+
+# Same prompt with the constant text BEFORE the image, so its key/value states
+# can be computed once and reused (see PromptPrefixCache).
+PROMPT_PREFIX = "User:\n" + PROMPT_INSTRUCTIONS + "\n"
+PROMPT_SUFFIX = "<image>\nAssistant:"
+
+# Off by default: moving the instructions before the image is not the layout
+# SmolVLM was trained on; check bench_prefill.py's agreement report before enabling
+USE_PROMPT_CACHE = bool(CONFIG.get("vlm_prompt_cache", False))
+
+# Low-resolution fast path: decode the JPEG at reduced scale, resize it to one
+# FAST_IMAGE_SIZE square and give the model that single tile instead of the
+# default grid of tiles + global view (SmolVLM, 480x360 frame: 64 image tokens
+# instead of 13 x 64).
+FAST_PREPROCESS = bool(CONFIG.get("vlm_fast_preprocess", False))
+FAST_IMAGE_SIZE = int(CONFIG.get("vlm_fast_image_size", 512))
+
+
+def image_kwargs() -> dict:
+    """Extra processor arguments for the current preprocessing mode."""
+    if not FAST_PREPROCESS:
+        return {}
+    # _load_image already made every frame the FAST_IMAGE_SIZE square: no second resize
+    return {"do_image_splitting": False, "do_resize": False, "size": {"longest_edge": FAST_IMAGE_SIZE}}
+
+
+# --- Capture profile (GET /capture_profile) ---
+# What clients can capture so the server has nothing to resample. Only fast
+# mode has such a size: the single square tile (the whole field of view
+# stretched into it, as the server would do). In tiles mode the processor
+# rescales and splits every frame whatever its size, so no size is published
+# and clients keep their own. jpeg_quality is a ceiling, never a target.
+
+CAPTURE_JPEG_QUALITY = int(CONFIG.get("capture_jpeg_quality", 70))
+_PROFILE_LOCK = threading.Lock()
+PROFILE_STATS = {"matched": 0, "resized": 0}
+
+
+def capture_profile() -> dict:
+    size = FAST_IMAGE_SIZE if FAST_PREPROCESS else None
+    return {
+        "width": size,
+        "height": size,
+        "aspect_ratio": 1.0 if size else None,
+        "fit": "stretch",        # whole field of view scaled to width x height, never cropped
+        "color": "RGB",
+        "format": "jpeg",
+        "jpeg_quality": CAPTURE_JPEG_QUALITY,
+        "preprocess": "fast" if FAST_PREPROCESS else "tiles",
+        "skips_resize": FAST_PREPROCESS,  # an exact-size upload goes to the model as-is
+    }
+
+
+def _count_profile(matched: bool) -> None:
+    with _PROFILE_LOCK:
+        PROFILE_STATS["matched" if matched else "resized"] += 1
+
+
+class PromptPrefixCache:
+    """
+    Key/value states of PROMPT_PREFIX, computed once at startup.
+
+    SmolVLM attends left to right, so only text that comes before the image can
+    be cached. Per frame we prefill just the image tokens and "Assistant:" on top
+    of a copy of the cached prefix, then decode greedily. The loop is written out
+    here (instead of model.generate) so the cache and image features can be fed
+    in explicitly on every transformers version.
+    """
+
+    def __init__(self):
+        if not hasattr(model.model, "get_image_features"):
+            raise RuntimeError("model does not expose get_image_features()")
+
+        tokenizer = processor.tokenizer
+        self.prefix_ids = tokenizer(PROMPT_PREFIX, return_tensors="pt").input_ids.to(DEVICE)
+        self.prefix_len = self.prefix_ids.shape[1]
+        self.image_token_id = tokenizer.convert_tokens_to_ids("<image>")
+
+        eos = model.generation_config.eos_token_id
+        eos = eos if isinstance(eos, (list, tuple)) else [eos]
+        eos = [e for e in eos if e is not None] or [tokenizer.eos_token_id]
+        self.eos_ids = torch.tensor(eos, device=DEVICE)
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else eos[0]
+
+        # One cached prefix per batch size, built on first use (batch 1 right away)
+        self._caches = {}
+        self._lock = threading.Lock()
+        self._cache_for(1)
+
+    @torch.no_grad()
+    def _cache_for(self, batch_size: int):
+        with self._lock:
+            cache = self._caches.get(batch_size)
+            if cache is None:
+                ids = self.prefix_ids.repeat(batch_size, 1)
+                out = model(input_ids=ids, attention_mask=torch.ones_like(ids), use_cache=True)
+                cache = self._caches[batch_size] = out.past_key_values
+        # Decoding appends to the cache in place, so every call gets its own copy
+        return copy.deepcopy(cache)
+
+    def preprocess(self, images: list):
+        """Processor output (pixels + suffix tokens) for a batch of [image] lists."""
+        return processor(
+            text=[PROMPT_SUFFIX] * len(images),
+            images=images,
+            padding=True,
+            add_special_tokens=False,
+            return_tensors="pt",
+            **image_kwargs(),
+        ).to(DEVICE)
+
+    def prefill(self, images: list, inputs=None):
+        """Encode image + suffix on top of the cached prefix -> (last logits, cache, attention mask)."""
+        n = len(images)
+        if inputs is None:
+            inputs = self.preprocess(images)
+
+        input_ids = inputs["input_ids"]
+        embeds = model.get_input_embeddings()(input_ids)
+        features = model.model.get_image_features(
+            inputs["pixel_values"], inputs.get("pixel_attention_mask")
+        )
+        if not torch.is_tensor(features):
+            # newer transformers wrap the projected features in a model output
+            features = features.pooler_output
+        image_slots = (input_ids == self.image_token_id).unsqueeze(-1)
+        embeds = embeds.masked_scatter(image_slots, features.to(embeds.dtype))
+
+        prefix_mask = torch.ones(n, self.prefix_len, dtype=inputs["attention_mask"].dtype, device=DEVICE)
+        attention_mask = torch.cat([prefix_mask, inputs["attention_mask"]], dim=1)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, self.prefix_len:]
+
+        out = model(
+            inputs_embeds=embeds,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=self._cache_for(n),
+            use_cache=True,
+        )
+        return out.logits[:, -1, :], out.past_key_values, attention_mask
+
+    def generate(self, images: list, max_new_tokens: int, progress=None) -> list:
+        t_pre = time.perf_counter()
+        inputs = self.preprocess(images)
+        t0 = time.perf_counter()
+        STAGE_SECONDS.observe(t0 - t_pre, stage="preprocess")
+        logits, cache, attention_mask = self.prefill(images, inputs)
+        t_prefill = time.perf_counter()
+        n = len(images)
+        finished = torch.zeros(n, dtype=torch.bool, device=DEVICE)
+        next_pos = attention_mask.sum(-1, keepdim=True)
+        tokens = []
+
+        for _ in range(max_new_tokens):
+            next_tok = logits.argmax(-1)
+            next_tok = torch.where(finished, torch.full_like(next_tok, self.pad_id), next_tok)
+            tokens.append(next_tok)
+            finished |= torch.isin(next_tok, self.eos_ids)
+            if progress is not None:
+                finished |= progress(torch.stack(tokens, dim=1))
+            if finished.all():
+                break
+
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones(n, 1)], dim=1)
+            out = model(
+                input_ids=next_tok.unsqueeze(-1),
+                attention_mask=attention_mask,
+                position_ids=next_pos,
+                past_key_values=cache,
+                use_cache=True,
+            )
+            cache = out.past_key_values
+            logits = out.logits[:, -1, :]
+            next_pos = next_pos + 1
+
+        new_ids = torch.stack(tokens, dim=1)
+        _record_generation(
+            frames=n,
+            tokens=int((new_ids != self.pad_id).sum()),
+            prefill_sec=t_prefill - t0,
+            decode_sec=time.perf_counter() - t_prefill,
+            decode_steps=len(tokens) - 1,
+        )
+        return processor.batch_decode(new_ids, skip_special_tokens=True)
+
+
+prefix_cache = None
+PROMPT_CACHE_ERROR = None
+
+
+# --- Early stopping / streaming ---
+
+# clean_caption() keeps only the first sentence, so decoding can stop right there
+STOP_AT_SENTENCE = bool(CONFIG.get("vlm_stop_at_sentence", True))
+
+
+def _first_sentence_done(text: str) -> bool:
+    """True once text holds a complete first sentence (same rule as clean_caption)."""
+    for sep in ("\n", "."):
+        idx = text.find(sep)
+        while idx != -1:
+            if text[:idx].strip():
+                return True
+            idx = text.find(sep, idx + 1)
+    return False
+
+
+class CaptionProgress:
+    """
+    Called after every decode step with the tokens generated so far.
+    Marks rows done at the first sentence boundary and, for streaming, hands
+    the partial text to on_text(texts) -> optional per-row "stop now" flags.
+    Works as a model.generate stopping criterion and in PromptPrefixCache.
+    """
+
+    def __init__(self, prompt_len: int = 0, stop_at_sentence: bool = STOP_AT_SENTENCE, on_text=None):
+        self.prompt_len = prompt_len
+        self.stop_at_sentence = stop_at_sentence
+        self.on_text = on_text
+
+    def __call__(self, input_ids, scores=None, **kwargs):
+        texts = processor.batch_decode(input_ids[:, self.prompt_len:], skip_special_tokens=True)
+        done = [self.stop_at_sentence and _first_sentence_done(t) for t in texts]
+        if self.on_text is not None:
+            stop = self.on_text(texts)
+            if stop:
+                done = [d or bool(x) for d, x in zip(done, stop)]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+# --- Generation stats (prefill vs per-token decode) ---
+
+_GEN_LOCK = threading.Lock()
+GEN_STATS = {"frames": 0, "tokens": 0, "prefill_sec": 0.0, "decode_sec": 0.0, "decode_steps": 0}
+
+
+def _record_generation(frames: int, tokens: int, prefill_sec: float,
+                       decode_sec: float, decode_steps: int) -> None:
+    with _GEN_LOCK:
+        GEN_STATS["frames"] += frames
+        GEN_STATS["tokens"] += tokens
+        GEN_STATS["prefill_sec"] += prefill_sec
+        GEN_STATS["decode_sec"] += decode_sec
+        GEN_STATS["decode_steps"] += decode_steps
+    STAGE_SECONDS.observe(prefill_sec, stage="prefill")
+    STAGE_SECONDS.observe(decode_sec, stage="decode")
+    TOKENS.inc(tokens)
+
+
+class _PrefillTimer:
+    """Logits hook: its first call happens right after the prefill forward pass."""
+
+    def __init__(self):
+        self.first_call = None
+
+    def __call__(self, input_ids, scores):
+        if self.first_call is None:
+            self.first_call = time.perf_counter()
+        return scores
 
-@torch.no_grad()
-def generate_caption(image_bytes: bytes) -> str:
-    """Run the VLM and return a single short sentence description."""
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
 
-    inputs = processor(text=PROMPT, images=image, return_tensors="pt").to(DEVICE)
+def decode_rate() -> float:
+    """Decode steps per second (one step = one new token for every frame in the batch)."""
+    with _GEN_LOCK:
+        if GEN_STATS["decode_sec"] <= 0:
+            return None
+        return GEN_STATS["decode_steps"] / GEN_STATS["decode_sec"]
 
+
+def generation_stats() -> dict:
+    with _GEN_LOCK:
+        stats = dict(GEN_STATS)
+    stats["decode_steps_per_sec"] = (
+        stats["decode_steps"] / stats["decode_sec"] if stats["decode_sec"] > 0 else None
+    )
+    stats["tokens_per_sec"] = (
+        stats["tokens"] / (stats["prefill_sec"] + stats["decode_sec"])
+        if stats["tokens"] else None
+    )
+    return stats
+
+
+def _load_image(image_bytes: bytes) -> Image.Image:
+    t0 = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    if FAST_PREPROCESS and image.size == (FAST_IMAGE_SIZE, FAST_IMAGE_SIZE):
+        # Captured to /capture_profile: already the tile
+        image = image.convert("RGB")
+        _count_profile(True)
+    elif FAST_PREPROCESS:
+        # JPEG DCT scaling: decode at 1/2, 1/4 or 1/8 size, still >= the target
+        scale = FAST_IMAGE_SIZE / max(image.size)
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+        image = image.convert("RGB")
+        # The single tile is square; the processor would stretch the frame to it anyway
+        image = image.resize((FAST_IMAGE_SIZE, FAST_IMAGE_SIZE), Image.BILINEAR)
+        _count_profile(False)
+    else:
+        image = image.convert("RGB")
+    STAGE_SECONDS.observe(time.perf_counter() - t0, stage="jpeg_decode")
+    return image
+
+
+def _clean_timed(text: str) -> str:
+    t0 = time.perf_counter()
+    caption = clean_caption(text)
+    STAGE_SECONDS.observe(time.perf_counter() - t0, stage="clean_caption")
+    return caption
+
+
+@torch.no_grad()
+def _generate_texts(batch: list, on_text=None) -> list:
+    """Raw decoded text (prompt stripped or not) for a batch of [image] lists."""
+    if prefix_cache is not None:
+        progress = CaptionProgress(on_text=on_text)
+        return prefix_cache.generate(batch, MAX_NEW_TOKENS, progress=progress)
+
+    t_pre = time.perf_counter()
+    inputs = processor(
+        text=[PROMPT] * len(batch),
+        images=batch,
+        padding=True,
+        return_tensors="pt",
+        **image_kwargs(),
+    ).to(DEVICE)
+    STAGE_SECONDS.observe(time.perf_counter() - t_pre, stage="preprocess")
+    prompt_len = inputs["input_ids"].shape[1]
+
+    timer = _PrefillTimer()
+    t0 = time.perf_counter()
     output_ids = model.generate(
         **inputs,
         max_new_tokens=MAX_NEW_TOKENS,
         do_sample=False,
+        logits_processor=[timer],
+        stopping_criteria=[CaptionProgress(prompt_len, on_text=on_text)],
+    )
+    t_end = time.perf_counter()
+
+    new_ids = output_ids[:, prompt_len:]
+    t_prefill = timer.first_call or t_end
+    _record_generation(
+        frames=len(batch),
+        tokens=int((new_ids != processor.tokenizer.pad_token_id).sum()),
+        prefill_sec=t_prefill - t0,
+        decode_sec=t_end - t_prefill,
+        decode_steps=max(0, new_ids.shape[1] - 1),
     )
-    raw_text = processor.batch_decode(output_ids, skip_special_tokens=True)[0]
-    return clean_caption(raw_text)
+
+    return processor.batch_decode(output_ids, skip_special_tokens=True)
+
+
+class FrameError(ValueError):
+    """A frame that could not be decoded. Only that frame fails, not its batch."""
+
+
+def caption_frames(images: list, sectors: list = None) -> list:
+    """
+    Caption several frames with ONE padded batch. Each frame is decoded on its
+    own first; one that fails comes back as a FrameError in its place and the
+    others are still captioned together. Frames flagged in `sectors` add their
+    three crops to the batch and come back as {sector: caption}.
+    """
+    sectors = sectors or [False] * len(images)
+    loaded = []
+    for image_bytes, split in zip(images, sectors):
+        try:
+            loaded.append(_sector_images(image_bytes) if split else [_load_image(image_bytes)])
+        except Exception as e:
+            loaded.append(FrameError(f"{type(e).__name__}: {e}"))
+    good = [[image] for frame in loaded if not isinstance(frame, FrameError) for image in frame]
+    texts = iter([_clean_timed(t) for t in _generate_texts(good)] if good else [])
+    out = []
+    for frame, split in zip(loaded, sectors):
+        if isinstance(frame, FrameError):
+            out.append(frame)
+        elif split:
+            out.append({sector: next(texts) for sector in SECTORS})
+        else:
+            out.append(next(texts))
+    return out
+
+
+def generate_captions(images: list) -> list:
+    """Caption several frames with ONE padded batch (raises FrameError for a bad frame)."""
+    captions = caption_frames(images)
+    for caption in captions:
+        if isinstance(caption, FrameError):
+            raise caption
+    return captions
+
+
+def stream_caption(image_bytes: bytes, on_partial) -> str:
+    """
+    Caption one frame, calling on_partial(text_so_far) after every token.
+    If on_partial returns True, decoding stops right there (hazard fast-exit).
+    Returns the cleaned caption of whatever was generated.
+    """
+    def on_text(texts):
+        return [bool(on_partial(texts[0]))]
+
+    raw = _generate_texts([[_load_image(image_bytes)]], on_text=on_text)[0]
+    return _clean_timed(raw)
+
+
+def generate_caption(image_bytes: bytes) -> str:
+    """Run the VLM and return a single short sentence description."""
+    return generate_captions([image_bytes])[0]
+
+
+# --- Tri-sector captioning (direction from where in the frame the hazard is) ---
+
+SECTORS = ("left", "front", "right")
+# Each third is widened by this fraction of the frame width on both sides,
+# so an object on a boundary is whole in at least one crop
+SECTOR_OVERLAP = float(CONFIG.get("sector_overlap", 0.1))
+
+
+def crop_sectors(image: Image.Image, overlap: float = SECTOR_OVERLAP) -> list:
+    """Left, center and right vertical strips of the frame."""
+    w, h = image.size
+    pad = overlap * w
+    crops = []
+    for i in range(3):
+        left = max(0, int(i * w / 3.0 - pad))
+        right = min(w, int((i + 1) * w / 3.0 + pad))
+        crops.append(image.crop((left, 0, right, h)))
+    return crops
+
+
+def _sector_images(image_bytes: bytes) -> list:
+    """The frame's three sector crops, ready for the processor."""
+    t0 = time.perf_counter()
+    # Full decode: each crop only gets a third of the pixels
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    STAGE_SECONDS.observe(time.perf_counter() - t0, stage="jpeg_decode")
+    crops = crop_sectors(image)
+    if FAST_PREPROCESS:
+        crops = [crop.resize((FAST_IMAGE_SIZE, FAST_IMAGE_SIZE), Image.BILINEAR) for crop in crops]
+    return crops
+
+
+def caption_sectors(image_bytes: bytes) -> dict:
+    """Caption the three sectors of one frame in ONE batched generate call -> {sector: caption}."""
+    captions = caption_frames([image_bytes], [True])[0]
+    if isinstance(captions, FrameError):
+        raise captions
+    return captions
+
+
+# --- Model loading ---
+
+LOAD_STATE = {"ready": False, "stage": "pending", "timings_ms": {}, "error": None}
+MODEL_INFO = {}
+
+
+def rss_mb():
+    """Resident set size of this process in MB (Linux), else the peak RSS."""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    except Exception:
+        return None
+
+
+def _tensor_bytes(value) -> int:
+    if torch.is_tensor(value):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        # quantized Linear layers keep (packed int8 weight, bias) tuples
+        return sum(_tensor_bytes(v) for v in value)
+    return 0
+
+
+def _module_bytes(module) -> int:
+    """Bytes held by the weights, counting int8 packed params of quantized layers."""
+    return sum(_tensor_bytes(v) for v in module.state_dict().values())
+
+
+@contextmanager
+def _stage(name: str):
+    LOAD_STATE["stage"] = name
+    t0 = time.perf_counter()
+    yield
+    LOAD_STATE["timings_ms"][name] = (time.perf_counter() - t0) * 1000.0
+
+
+def _warmup_frame() -> bytes:
+    gradient = Image.linear_gradient("L").resize((480, 360)).convert("RGB")
+    buf = io.BytesIO()
+    gradient.save(buf, format="JPEG", quality=70)
+    return buf.getvalue()
+
+
+def _build_prompt_cache() -> None:
+    global prefix_cache, PROMPT_CACHE_ERROR
+    try:
+        prefix_cache = PromptPrefixCache()
+    except Exception as e:
+        PROMPT_CACHE_ERROR = str(e)
+
+
+def attach_model(shared_model, shared_processor) -> None:
+    """
+    Set up an inference worker process around the server's shared weights
+    (see worker_pool.py): same captioning code, no second copy of the model.
+    """
+    global processor, model
+    processor = shared_processor
+    model = get_backend(BACKEND).prepare(shared_model, MODEL_PATH or MODEL_NAME)
+    if USE_PROMPT_CACHE:
+        _build_prompt_cache()
+    if WARMUP:
+        generate_captions([_warmup_frame()])
+
+
+def _start_worker_pool() -> None:
+    global worker_pool
+    if DEVICE != "cpu" or PRECISION == "int8":
+        raise ValueError("inference_processes needs vlm_device 'cpu' and vlm_precision fp32 or bf16")
+    from worker_pool import InferencePool
+    pool = InferencePool(INFERENCE_PROCESSES, THREADS_PER_PROCESS, PIN_CPUS)
+    pool.start(model, processor)
+    worker_pool = pool
+
+
+def is_ready() -> bool:
+    return LOAD_STATE["ready"]
+
+
+def load_model() -> dict:
+    """
+    Load processor + weights and (optionally) warm up. Each stage is timed into
+    LOAD_STATE so /ready can show progress while this runs in the background.
+    """
+    global processor, model
+
+    try:
+        with _stage("import"):
+            from transformers import AutoProcessor
+            try:
+                from transformers import AutoModelForVision2Seq as AutoVLM
+            except ImportError:  # renamed in newer transformers
+                from transformers import AutoModelForImageTextToText as AutoVLM
+            from transformers.utils import logging as hf_logging
+            hf_logging.set_verbosity_error()
+
+        source = MODEL_PATH or MODEL_NAME
+
+        with _stage("processor"):
+            processor = AutoProcessor.from_pretrained(source)
+            # Batched prompts must be right-aligned so every row continues from its last prompt token
+            processor.tokenizer.padding_side = "left"
+
+        if PRECISION not in PRECISIONS:
+            raise ValueError(f"vlm_precision must be one of {PRECISIONS}, got {PRECISION!r}")
+        if PRECISION == "int8" and DEVICE != "cpu":
+            raise ValueError("vlm_precision 'int8' (dynamic quantization) is CPU-only")
+        backend = get_backend(BACKEND)
+
+        rss_before = rss_mb()
+        with _stage("weights"):
+            # safetensors are memory-mapped straight into the model instead of
+            # being randomly initialised and then copied over
+            dtype = torch.bfloat16 if PRECISION == "bf16" else torch.float32
+            model = AutoVLM.from_pretrained(
+                source, torch_dtype=dtype, use_safetensors=True, low_cpu_mem_usage=True
+            )
+            model.eval()
+
+        if PRECISION == "int8":
+            with _stage("quantize"):
+                # Linear weights -> int8, activations quantized on the fly per batch
+                model = torch.ao.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+
+        with _stage("device"):
+            model.to(DEVICE)
+        MODEL_INFO.update({
+            "model": source,
+            "device": DEVICE,
+            "precision": PRECISION,
+            "fast_preprocess": FAST_PREPROCESS,
+            "image_size": FAST_IMAGE_SIZE if FAST_PREPROCESS else None,
+            "weights_mb": _module_bytes(model) / 2**20,
+            "rss_mb_before_load": rss_before,
+            "rss_mb_after_load": rss_mb(),
+        })
+
+        if INFERENCE_PROCESSES > 0:
+            # Workers share the plain weights and set up the backend themselves
+            with _stage("workers"):
+                _start_worker_pool()
+
+        with _stage("backend"):
+            model = backend.prepare(model, source)
+        MODEL_INFO["backend"] = backend.info
+
+        if USE_PROMPT_CACHE:
+            with _stage("prompt_cache"):
+                _build_prompt_cache()
+
+        if WARMUP:
+            # First real frame would otherwise pay allocation / kernel selection costs
+            with _stage("warmup"):
+                generate_captions([_warmup_frame()])
+
+    except Exception as e:
+        LOAD_STATE["error"] = f"{LOAD_STATE['stage']}: {e}"
+        raise
+
+    LOAD_STATE["stage"] = "ready"
+    LOAD_STATE["ready"] = True
+    return dict(LOAD_STATE["timings_ms"])
 
 
 def clean_caption(text: str) -> str:
@@ -98,42 +731,202 @@ def clean_caption(text: str) -> str:
     return t
 
 
-# --- Danger classification (no vehicles at all) ---
-
-HAZARD_KEYWORDS = [
-    # sharp / cutting objects
-    "knife", "knives", "blade", "scissors",
-    "sharp edge", "sharp edges",
-    "sharp corner", "sharp corners",
-    "corner of the table", "table corner",
-    "edge of the table", "table edge",
-    "broken glass",
-
-    # general obstacles / furniture
-    "table", "chair", "desk", "door", "wall", "edge",
+# --- Micro-batching ---
+
+BATCH_MAX_SIZE = int(CONFIG.get("batch_max_size", 4))
+BATCH_MAX_WAIT_MS = float(CONFIG.get("batch_max_wait_ms", 50.0))
+
+# Inference runs on this many executor threads, never on the asyncio loop
+INFERENCE_WORKERS = int(CONFIG.get("inference_workers", 1))
+
+# Multi-process serving (0 = off): worker processes sharing the server's weights,
+# each with its own intra-op threads and CPU set (0 threads = CPUs / processes)
+INFERENCE_PROCESSES = int(CONFIG.get("inference_processes", 0))
+THREADS_PER_PROCESS = int(CONFIG.get("inference_threads_per_process", 0))
+PIN_CPUS = bool(CONFIG.get("inference_pin_cpus", True))
+
+# Set by load_model() when INFERENCE_PROCESSES > 0; batches then run in the pool
+worker_pool = None
+# Devices allowed to wait for a slot before new uploads are rejected
+SCHEDULER_MAX_DEVICES = int(CONFIG.get("scheduler_max_devices", 16))
+
+
+@dataclass
+class CaptionResult:
+    caption: str
+    batch_size: int      # how many frames shared the generate() call
+    wait_ms: float       # time spent queued before the batch started
+    inference_ms: float  # wall time of the whole batch
+    superseded: int = 0  # older frames from the same device folded into this one
+    sectors: dict = None  # {sector: caption} for sector frames (caption is then the center's)
+
+
+def _percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class CaptionBatcher:
+    """
+    Collects frames that arrive within a short window and captions them together.
+
+    Frames wait in a FrameScheduler (one slot per device, latest frame wins,
+    round-robin across devices). A collector thread takes a batch only when an
+    executor worker is free, so while the model is busy newer frames keep
+    replacing older ones instead of piling up. The first frame of a batch waits
+    at most max_wait_ms for others to join.
+    """
+
+    def __init__(self, max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS,
+                 workers: int = INFERENCE_PROCESSES or INFERENCE_WORKERS,
+                 max_pending: int = SCHEDULER_MAX_DEVICES,
+                 history: int = 512):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_sec = max(0.0, float(max_wait_ms)) / 1000.0
+        self.workers = max(1, int(workers))
+
+        self.scheduler = FrameScheduler(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vlm")
+        self._free_workers = threading.BoundedSemaphore(self.workers)
+
+        # Stats for tuning the window
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._wait_ms = deque(maxlen=history)
+        self._batch_ms = deque(maxlen=history)
+        self._batch_lens = deque(maxlen=history)
+        self._frames = 0
+        self._in_flight = 0
+
+        self._thread = threading.Thread(target=self._run, name="caption-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image_bytes: bytes, device_id: str = "default", sectors: bool = False) -> Future:
+        """
+        Queue one frame for device_id; the Future resolves to a CaptionResult.
+        With sectors, its three crops are captioned (they still take the
+        device's single slot and join the batch as one frame).
+        Raises SchedulerFull when too many devices are already waiting.
+        """
+        return self.scheduler.put(device_id, (image_bytes, bool(sectors)))
+
+    def submit_call(self, fn, *args) -> Future:
+        """
+        Run fn(*args) on the inference executor once a worker is free, for
+        unbatched work such as streaming. Blocks until then, so call it from a
+        thread (never the event loop).
+        """
+        self._free_workers.acquire()
+
+        def run():
+            try:
+                return fn(*args)
+            finally:
+                self._free_workers.release()
+
+        try:
+            return self._executor.submit(run)
+        except Exception:
+            self._free_workers.release()
+            raise
+
+    def _run(self) -> None:
+        while True:
+            # Only hold a worker slot once there is work, so submit_call() can use idle slots
+            self.scheduler.wait_for_frames()
+            self._free_workers.acquire()
+            batch = self.scheduler.take(self.max_batch_size, self.max_wait_sec)
+            with self._lock:
+                self._in_flight += len(batch)
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: list) -> None:
+        try:
+            started = time.monotonic()
+            waits = [(started - frame.enqueued_at) * 1000.0 for frame in batch]
+            for wait_ms in waits:
+                STAGE_SECONDS.observe(wait_ms / 1000.0, stage="queue_wait")
+
+            caption_fn = worker_pool.caption_frames if worker_pool is not None else caption_frames
+            try:
+                captions = caption_fn([frame.payload[0] for frame in batch],
+                                      [frame.payload[1] for frame in batch])
+            except Exception as e:
+                # The model itself failed (or its worker died): nobody in the batch gets a caption
+                for frame in batch:
+                    for fut in frame.futures:
+                        fut.set_exception(e)
+                return
+
+            batch_ms = (time.monotonic() - started) * 1000.0
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._wait_ms.extend(waits)
+                self._batch_ms.append(batch_ms)
+                self._batch_lens.append(len(batch))
+                self._frames += len(batch)
+
+            for frame, caption, wait_ms in zip(batch, captions, waits):
+                if isinstance(caption, FrameError):
+                    for fut in frame.futures:
+                        fut.set_exception(caption)
+                    continue
+                sectors = caption if isinstance(caption, dict) else None
+                result = CaptionResult(sectors["front"] if sectors else caption, len(batch), wait_ms,
+                                       batch_ms, superseded=len(frame.futures) - 1, sectors=sectors)
+                for fut in frame.futures:
+                    fut.set_result(result)
+        finally:
+            with self._lock:
+                self._in_flight -= len(batch)
+            self._free_workers.release()
+
+    def recent(self, n: int = 32) -> tuple:
+        """(p50 batch ms, mean batch size) over the last n batches, (None, None) before the first."""
+        with self._lock:
+            batch_ms = list(self._batch_ms)[-n:]
+            lens = list(self._batch_lens)[-n:]
+        if not batch_ms:
+            return None, None
+        return _percentile(batch_ms, 50), sum(lens) / len(lens)
+
+    def in_flight(self) -> int:
+        """Frames currently being captioned."""
+        with self._lock:
+            return self._in_flight
+
+    def stats(self) -> dict:
+        """Batch sizes and queue waits seen so far, to tune the window against latency."""
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            waits = list(self._wait_ms)
+            batch_ms = list(self._batch_ms)
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_sec * 1000.0,
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "batches": batches,
+                "frames": self._frames,
+                "mean_batch_size": (self._frames / batches) if batches else None,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "wait_ms_p50": _percentile(waits, 50),
+                "wait_ms_p95": _percentile(waits, 95),
+                "wait_ms_max": max(waits) if waits else None,
+                "batch_ms_p50": _percentile(batch_ms, 50),
+                "batch_ms_p95": _percentile(batch_ms, 95),
+            }
 
-    # fire / heat / smoke
-    "fire", "flame", "flames", "smoke",
 
-    # cables / wires
-    "exposed cable", "exposed wire",
-    "loose cable", "loose wire",
-    "cable", "wire",
-
-    # holes / gaps / stairs / obstacles
-    "hole", "open hole", "pit", "gap",
-    "stairs", "staircase", "step", "steps",
-    "obstacle", "barrier",
-]
+# --- Danger classification (no vehicles at all) ---
 
+# Keywords, categories and severities live in hazards.yaml (shared with main.py)
+HAZARD_KEYWORDS = LEXICON.keywords
 
 
 def is_dangerous(description: str) -> bool:
-    text = description.lower()
-
-    # ✅ Only check for hazards (no vehicles, no special handling)
-    for kw in HAZARD_KEYWORDS:
-        if kw in text:
-            return True
-
-    return False
+    return LEXICON.classify(description) is not None
@@ -0,0 +1,256 @@
+# Guided_Vision/server/worker_pool.py
+#
+# Multi-process inference that shares ONE copy of the weights.
+#
+# More uvicorn workers would each load their own SmolVLM, and a single
+# process cannot keep a many-core CPU busy (one generate() at a time scales
+# poorly with intra-op threads). Instead the server process loads the model
+# as usual, moves its tensors into shared memory (model.share_memory(),
+# backed by /dev/shm) and spawns N worker processes. torch.multiprocessing
+# hands the model to them as shared-memory handles, not copies, so memory
+# grows by each worker's activations and runtime, not by the weights.
+#
+# Every worker gets its own intra-op thread count and CPU set. Batches from
+# the CaptionBatcher go on one task queue that idle workers pull from.
+#
+# Enabled with inference_processes in config.yaml; compare against the
+# single-process setup with bench_workers.py.
+
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import torch.multiprocessing as mp
+
+GEN_FIELDS = ("frames", "tokens", "prefill_sec", "decode_sec", "decode_steps")
+# Stage histograms recorded inside the workers, shipped back with each batch
+# (prefill / decode are rebuilt from GEN_FIELDS by the server instead)
+WORKER_STAGES = ("jpeg_decode", "preprocess", "clean_caption")
+
+
+def available_cpus() -> list:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        return list(range(os.cpu_count() or 1))
+
+
+def plan_cpus(processes: int, threads_per_process: int = 0, cpus: list = None) -> list:
+    """CPU set per worker: consecutive blocks of threads_per_process CPUs (0 = an equal share)."""
+    cpus = cpus or available_cpus()
+    per = threads_per_process or max(1, len(cpus) // processes)
+    return [[cpus[(i * per + k) % len(cpus)] for k in range(per)] for i in range(processes)]
+
+
+def memory_mb(pid="self") -> dict:
+    """RSS and PSS (shared pages split between the processes mapping them) in MB, Linux only."""
+    out = {"rss_mb": None, "pss_mb": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    out["rss_mb"] = int(line.split()[1]) / 1024.0
+                elif line.startswith("Pss:"):
+                    out["pss_mb"] = int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return out
+
+
+def _stage_delta(before: dict, after: dict) -> dict:
+    """WORKER_STAGES observations between two STAGE_SECONDS snapshots."""
+    delta = {}
+    for key, series in after.items():
+        if key[0] not in WORKER_STAGES:
+            continue
+        old = before.get(key, [0] * len(series))
+        diff = [a - b for a, b in zip(series, old)]
+        if any(diff[:-1]):
+            delta[key] = diff
+    return delta
+
+
+def _worker_main(index, model, processor, threads, cpus, tasks, results) -> None:
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    import vlm_service
+    try:
+        vlm_service.attach_model(model, processor)
+    except Exception as e:
+        results.put(("failed", index, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", index, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, images, sectors = task
+        results.put(("started", job_id, index))
+        before = vlm_service.generation_stats()
+        stages_before = vlm_service.STAGE_SECONDS.snapshot()
+        try:
+            captions = vlm_service.caption_frames(images, sectors)
+        except Exception as e:
+            results.put(("error", job_id, f"{type(e).__name__}: {e}"))
+            continue
+        after = vlm_service.generation_stats()
+        stages = _stage_delta(stages_before, vlm_service.STAGE_SECONDS.snapshot())
+        results.put(("done", job_id, (captions, {k: after[k] - before[k] for k in GEN_FIELDS}, stages)))
+
+
+class WorkerDied(RuntimeError):
+    pass
+
+
+class InferencePool:
+    def __init__(self, processes: int, threads_per_process: int = 0, pin_cpus: bool = True):
+        self.processes = max(1, int(processes))
+        self.cpu_sets = plan_cpus(self.processes, threads_per_process)
+        self.threads = len(self.cpu_sets[0])
+        self.pin_cpus = pin_cpus
+
+        self._procs = []
+        self._tasks = None
+        self._results = None
+        self._ids = itertools.count(1)
+        self._jobs = {}      # job_id -> Future
+        self._running = {}   # job_id -> worker index
+        self._lock = threading.Lock()
+        self._collector = None
+        self.jobs_per_worker = [0] * self.processes
+
+    def start(self, model, processor, timeout: float = 600.0) -> None:
+        """Share the weights, spawn the workers and wait until every one has warmed up."""
+        model.share_memory()
+        ctx = mp.get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        for i, cpus in enumerate(self.cpu_sets):
+            proc = ctx.Process(
+                target=_worker_main,
+                args=(i, model, processor, self.threads, cpus if self.pin_cpus else None,
+                      self._tasks, self._results),
+                name=f"vlm-worker-{i}",
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+
+        deadline = time.monotonic() + timeout
+        ready = 0
+        while ready < self.processes:
+            try:
+                kind, index, detail = self._results.get(timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Empty:
+                self.close()
+                raise TimeoutError(f"inference workers not ready after {timeout:.0f}s")
+            if kind == "failed":
+                self.close()
+                raise RuntimeError(f"inference worker {index} failed to start: {detail}")
+            ready += 1
+
+        self._collector = threading.Thread(target=self._collect, name="vlm-pool", daemon=True)
+        self._collector.start()
+        print(f"[SERVER] {self.processes} inference processes x {self.threads} threads "
+              f"(CPUs {self.cpu_sets if self.pin_cpus else 'not pinned'})")
+
+    def caption_frames(self, images: list, sectors: list = None) -> list:
+        """
+        Caption one batch in whichever worker is free (blocks the calling thread).
+        Like vlm_service.caption_frames, an undecodable frame comes back as a FrameError.
+        """
+        fut = Future()
+        job_id = next(self._ids)
+        with self._lock:
+            self._jobs[job_id] = fut
+        self._tasks.put((job_id, list(images), sectors))
+        return fut.result()
+
+    def _collect(self) -> None:
+        from vlm_service import STAGE_SECONDS, _record_generation  # worker timings feed the server's stats
+
+        while True:
+            try:
+                kind, job_id, detail = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                return
+
+            with self._lock:
+                if kind == "started":
+                    self._running[job_id] = detail
+                    self.jobs_per_worker[detail] += 1
+                    continue
+                self._running.pop(job_id, None)
+                fut = self._jobs.pop(job_id, None)
+            if fut is None:
+                continue
+            if kind == "done":
+                captions, gen, stages = detail
+                _record_generation(gen["frames"], gen["tokens"], gen["prefill_sec"],
+                                   gen["decode_sec"], gen["decode_steps"])
+                STAGE_SECONDS.merge(stages)
+                fut.set_result(captions)
+            else:
+                fut.set_exception(RuntimeError(detail))
+
+    def _check_workers(self) -> None:
+        """Fail the batch a crashed worker was running instead of waiting for it forever."""
+        dead = {i for i, proc in enumerate(self._procs) if not proc.is_alive()}
+        if not dead:
+            return
+        with self._lock:
+            if len(dead) == len(self._procs):
+                lost = list(self._jobs)  # nobody left to pick up queued batches either
+            else:
+                lost = [job for job, index in self._running.items() if index in dead]
+            futures = [self._jobs.pop(job, None) for job in lost]
+            for job in lost:
+                self._running.pop(job, None)
+        for fut in futures:
+            if fut is not None:
+                fut.set_exception(WorkerDied("inference worker exited before finishing the batch"))
+
+    def close(self) -> None:
+        for _ in self._procs:
+            try:
+                self._tasks.put(None)
+            except Exception:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+
+    def stats(self) -> dict:
+        workers = []
+        for i, proc in enumerate(self._procs):
+            workers.append({
+                "pid": proc.pid,
+                "alive": proc.is_alive(),
+                "cpus": self.cpu_sets[i] if self.pin_cpus else None,
+                "jobs": self.jobs_per_worker[i],
+                **memory_mb(proc.pid),
+            })
+        server = memory_mb()
+        pss = [w["pss_mb"] for w in workers] + [server["pss_mb"]]
+        return {
+            "processes": self.processes,
+            "threads_per_process": self.threads,
+            "workers": workers,
+            "server": server,
+            "total_pss_mb": sum(pss) if None not in pss else None,
+        }